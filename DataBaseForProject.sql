@@ -29,6 +29,7 @@ CREATE TABLE IF NOT EXISTS `admin` (
   `hall_id` int DEFAULT NULL,
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
   `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `status_version` int unsigned NOT NULL DEFAULT '0',
   PRIMARY KEY (`admin_id`),
   UNIQUE KEY `email` (`email`),
   KEY `hall_id` (`hall_id`),
@@ -318,8 +319,12 @@ CREATE TABLE IF NOT EXISTS `hall` (
   `available_rooms` int NOT NULL DEFAULT '0',
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
   `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `level_min` smallint unsigned DEFAULT NULL,
+  `level_max` smallint unsigned DEFAULT NULL,
+  `cost` decimal(12,2) DEFAULT NULL,
   PRIMARY KEY (`hall_id`),
-  KEY `idx_hall_gender` (`gender`)
+  KEY `idx_hall_gender` (`gender`),
+  KEY `idx_hall_eligibility` (`gender`,`cost`,`level_min`,`level_max`)
 ) ENGINE=InnoDB AUTO_INCREMENT=5 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- Dumping data for table room_allocation_system_db.hall: ~4 rows (approximately)
@@ -580,11 +585,13 @@ CREATE TABLE IF NOT EXISTS `student` (
   `room_id` int DEFAULT NULL,
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
   `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `status_version` int unsigned NOT NULL DEFAULT '0',
   PRIMARY KEY (`student_id`),
   UNIQUE KEY `matric_number` (`matric_number`),
   UNIQUE KEY `email` (`email`),
   KEY `hall_selected` (`hall_selected`),
   KEY `room_id` (`room_id`),
+  KEY `idx_student_gender_status_level` (`gender`,`payment_status`,`level`),
   CONSTRAINT `student_ibfk_1` FOREIGN KEY (`hall_selected`) REFERENCES `hall` (`hall_id`) ON DELETE SET NULL,
   CONSTRAINT `student_ibfk_2` FOREIGN KEY (`room_id`) REFERENCES `room` (`room_id`) ON DELETE SET NULL
 ) ENGINE=InnoDB AUTO_INCREMENT=64 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -655,20 +662,6 @@ INSERT INTO `student` (`student_id`, `matric_number`, `full_name`, `email`, `pas
 	(62, '22/1218', 'Favour ', 'murewabamigbola@gamil.com', 'student123', 'Computer Science', '400', 'Female', '08011111655', '080999565001', '14 Adeola Odeku St, VI, Lagos', 'Pentecostal', 'Verified', 4, 41, '2026-01-25 20:55:58', '2026-01-25 20:55:58'),
 	(63, '22/1219', 'chika excel james ', 'chikachikaexcel@gmail.com', 'student123', 'Computer Science', '400', 'Male', '09155564452', '08029296650', '14 Adeola Odeku St, VI, Lagos', 'Pentecostal', 'Verified', 1, 1, '2026-01-25 20:55:58', '2026-01-25 20:55:58');
 
--- Dumping structure for trigger room_allocation_system_db.update_hall_availability
-SET @OLDTMP_SQL_MODE=@@SQL_MODE, SQL_MODE='ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION';
-DELIMITER //
-CREATE TRIGGER `update_hall_availability` AFTER UPDATE ON `room` FOR EACH ROW BEGIN
-    DECLARE available_count INT;
-    SELECT COUNT(*) INTO available_count 
-    FROM Room 
-    WHERE hall_id = NEW.hall_id AND room_status IN ('Available', 'Occupied');
-    
-    UPDATE Hall SET available_rooms = available_count WHERE hall_id = NEW.hall_id;
-END//
-DELIMITER ;
-SET SQL_MODE=@OLDTMP_SQL_MODE;
-
 -- Dumping structure for trigger room_allocation_system_db.update_room_status_before_update
 SET @OLDTMP_SQL_MODE=@@SQL_MODE, SQL_MODE='ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION';
 DELIMITER //
@@ -14,9 +14,9 @@
 //   (Dashboard, Rooms, Students, Reports, or Settings)
 // - It uses React Router's <Outlet> to render the current child page
 
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { useNavigate, useLocation, Outlet } from "react-router-dom";
-import { getAdminDashboard, allocationGraph } from "../services/auth";
+import { getAdminDashboard, getAdminDashboardChanges, allocationGraph, watchHall } from "../services/auth";
 import "./admin.css";
 
 export default function AdminLayout() {
@@ -60,6 +60,10 @@ export default function AdminLayout() {
         return savedRoom ? JSON.parse(savedRoom) : [];
     });
 
+    // changesCursor: the hall version our data is up to date with
+    // (the offline copy in localStorage is refreshed from the merged rooms below)
+    const changesCursor = useRef(null);
+
     // ===== TOAST HELPER =====
     // Shows a green popup message for 3.5 seconds then hides it
     const triggerToast = (msg) => {
@@ -92,6 +96,7 @@ export default function AdminLayout() {
                 setHallData(data.hall_details);
                 setFilteredRooms(data.hall_details.rooms || []);
                 setRooms(data.hall_details.rooms || []);
+                changesCursor.current = data.hall_details.changes_cursor;
             }
 
             // Step 5: Done loading
@@ -108,6 +113,39 @@ export default function AdminLayout() {
         }
     };
 
+    // ===== FETCH ONLY WHAT CHANGED =====
+    // Asks the server for the rooms that changed since our cursor and swaps just
+    // those rooms into the lists (a few hundred bytes instead of the whole hall).
+    // If the server says our cursor is too old, we load the full dashboard instead.
+    const syncDashboardChanges = async () => {
+        const userString = localStorage.getItem("Admin");
+        if (!userString || changesCursor.current === null || changesCursor.current === undefined) {
+            return fetchDashboardData();
+        }
+        try {
+            const admin = JSON.parse(userString);
+            const changes = await getAdminDashboardChanges(admin.email, changesCursor.current);
+            if (changes.full_resync) {
+                return fetchDashboardData();
+            }
+            changesCursor.current = changes.changes_cursor;
+
+            // Replace each changed room, keep the rest as they are
+            const changed = new Map(changes.rooms.map((room) => [room.room_id, room]));
+            const merge = (list) => list.map((room) => changed.get(room.room_id) || room);
+            const mergeHall = (hall) => hall && { ...hall, ...changes.hall_details, rooms: merge(hall.rooms || []) };
+
+            setHallData(mergeHall);
+            setDashboardData((data) => data && { ...data, hall_details: mergeHall(data.hall_details) });
+            if (changed.size > 0) {
+                setRooms(merge);
+                setFilteredRooms(merge);
+            }
+        } catch (err) {
+            console.error("Dashboard sync error:", err);
+        }
+    };
+
     // ===== LOAD DATA WHEN PAGE FIRST OPENS =====
     // useEffect with [] runs ONCE when the component first appears
     useEffect(() => {
@@ -129,16 +167,38 @@ export default function AdminLayout() {
         }
     }, [rooms]);
 
-    // ===== AUTO-REFRESH EVERY 10 SECONDS =====
-    // This keeps the dashboard data fresh without the admin having to reload
+    // ===== LIVE UPDATES FROM THE SERVER =====
+    // Instead of asking the server every 10 seconds, we keep one connection open
+    // and the server tells us when a room in this hall changes (booking, maintenance).
+    // Then we fetch just the changed rooms. Several changes close together (e.g. an
+    // auto-allocation run) are grouped into a single request.
+    const hallId = hallData?.hall_id;
     useEffect(() => {
-        const refreshInterval = setInterval(() => {
-            fetchDashboardData();
-        }, 10000); // 10000ms = 10 seconds
+        if (!hallId) return;
+        let reloadTimer = null;
+        const scheduleReload = () => {
+            clearTimeout(reloadTimer);
+            reloadTimer = setTimeout(syncDashboardChanges, 500);
+        };
+        const stopWatching = watchHall(hallId, {
+            onChange: scheduleReload,
+            onResync: () => {
+                clearTimeout(reloadTimer);
+                fetchDashboardData();
+            }
+        });
 
-        // Cleanup: stop the timer when the component is removed
-        return () => clearInterval(refreshInterval);
-    }, []);
+        // Safety net: also ask for changes once a minute, in case the live
+        // connection dropped without us noticing (cheap - usually nothing changed)
+        const fallbackInterval = setInterval(syncDashboardChanges, 60000);
+
+        // Cleanup: close the connection when the component is removed
+        return () => {
+            clearTimeout(reloadTimer);
+            clearInterval(fallbackInterval);
+            stopWatching();
+        };
+    }, [hallId]);
 
     // ===== FETCH CHART DATA + REFRESH EVERY 60 SECONDS =====
     // The allocation trend chart needs its own data from a separate API
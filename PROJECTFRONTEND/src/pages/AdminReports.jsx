@@ -17,7 +17,7 @@
 
 import { useState, useEffect } from "react";
 import { useNavigate, useOutletContext } from "react-router-dom";
-import { getAdminReceipts } from "../services/auth";
+import { getAdminReceipts, getAdminExportUrl } from "../services/auth";
 import { PDFDownloadLink } from "@react-pdf/renderer";
 import ReceiptDocument from "./ReceiptDocument";
 
@@ -342,6 +342,19 @@ export default function AdminReports() {
                                     style={{ maxWidth: 400, marginBottom: 20 }}
                                 />
 
+                                {/* Export the whole hall's receipts as a file (streamed by the server) */}
+                                <div style={{ display: "flex", gap: 10, marginBottom: 20 }}>
+                                    {[["csv", "⬇ Export CSV"], ["ndjson", "⬇ Export NDJSON"]].map(([type, label]) => (
+                                        <a
+                                            key={type}
+                                            className="admin-btn admin-btn-ghost admin-btn-sm"
+                                            href={getAdminExportUrl(JSON.parse(localStorage.getItem("Admin") || "{}").email, "receipts", type)}
+                                        >
+                                            {label}
+                                        </a>
+                                    ))}
+                                </div>
+
                                 {filteredReceipts.length === 0 ? (
                                     <div className="admin-empty">No student receipts found.</div>
                                 ) : (
@@ -38,8 +38,17 @@ export default function AdminStudents() {
         }
     });
 
-    // Re-read localStorage every 10 seconds to keep offline data fresh
-    // (same auto-refresh as original persistent.jsx)
+    // Keep the offline copy in step with the live hall data
+    // (AdminLayout saves exactly these rooms to localStorage every time the server
+    // pushes an update)
+    useEffect(() => {
+        if (hallData?.rooms?.length) {
+            setOfflineData(hallData.rooms);
+        }
+    }, [hallData]);
+
+    // Also re-read localStorage once a minute, in case live updates stopped
+    // (e.g. the connection dropped) and another tab saved newer data
     useEffect(() => {
         const fetchInterval = setInterval(() => {
             const data = localStorage.getItem("hostel_rooms_data");
@@ -49,7 +58,7 @@ export default function AdminStudents() {
             } catch {
                 setOfflineData(null);
             }
-        }, 10000); // 10 seconds
+        }, 60000); // 60 seconds
         return () => clearInterval(fetchInterval);
     }, []);
 
@@ -4,10 +4,11 @@
 // Tailwind-styled receipt page matching the HostelMS theme.
 // All original functionality preserved:
 //   - RecipetData API call on mount
-//   - PDFDownloadLink for PDF download
+//   - Download of the official PDF stored on the server (downloadReceiptPdf),
+//     with PDFDownloadLink (built in the browser) as the fallback
 //   - Navigation back to dashboard
 
-import { RecipetData } from "../services/auth";
+import { RecipetData, downloadReceiptPdf } from "../services/auth";
 import { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import { PDFDownloadLink } from "@react-pdf/renderer";
@@ -21,6 +22,21 @@ function ReceiptPage() {
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const [recieptData, setRecieptData] = useState(null);
+    const [downloading, setDownloading] = useState(false);
+    const [serverPdfFailed, setServerPdfFailed] = useState(false);
+
+    // ===== DOWNLOAD THE STORED PDF (fall back to building it here) =====
+    const handleDownload = async () => {
+        setDownloading(true);
+        try {
+            await downloadReceiptPdf(recieptData.matric_no);
+        } catch (error) {
+            console.error(error);
+            setServerPdfFailed(true);
+        } finally {
+            setDownloading(false);
+        }
+    };
 
     // ===== LOAD RECEIPT DATA WHEN PAGE OPENS =====
     useEffect(() => {
@@ -225,7 +241,17 @@ function ReceiptPage() {
                             ← Back to Dashboard
                         </button>
 
-                        {recieptData && (
+                        {recieptData && !serverPdfFailed && (
+                            <button
+                                onClick={handleDownload}
+                                disabled={downloading}
+                                className="flex-1 py-3 bg-[#1e3a6e] text-white rounded-lg text-xs font-bold tracking-wider text-center cursor-pointer hover:bg-[#162d57] transition-colors flex items-center justify-center disabled:opacity-60"
+                            >
+                                {downloading ? "Downloading..." : "↓ Download PDF"}
+                            </button>
+                        )}
+
+                        {recieptData && serverPdfFailed && (
                             <PDFDownloadLink
                                 document={<ReceiptDocument data={recieptData} />}
                                 fileName={`BU-Receipt_${recieptData.matric_no}.pdf`}
@@ -13,7 +13,7 @@
 import { getStudentDashboard } from "../services/auth";
 import { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
-import { bookRoom, getAvailableRooms } from "../services/auth";
+import { bookRoom, getAvailableRooms, holdBed, releaseBed, joinBookingQueue, getBookingQueueStatus } from "../services/auth";
 
 // ─── Occupancy bar helper ─────────────────────────────────────────────────────
 function OccBar({ current, capacity }) {
@@ -126,7 +126,8 @@ function StudentDashboard() {
         try {
             setRoomsLoading(true);
             setSelectedHall(hall);
-            const roomData = await getAvailableRooms(hall.hall_id);
+            const user = JSON.parse(localStorage.getItem("user"));
+            const roomData = await getAvailableRooms(hall.hall_id, user.matriculation_number || user.matric_number);
             setRooms(roomData);
         } catch (error) {
             console.error("Error fetching rooms:", error);
@@ -137,13 +138,53 @@ function StudentDashboard() {
         }
     };
 
+    // ===== BOOKING QUEUE =====
+    // On allocation day the server only lets a few students per hall book at a time.
+    // Join the queue and keep checking (as often as the server asks) until it's our turn.
+    const waitForTurn = async (matricparm, hall_id) => {
+        let ticket = await joinBookingQueue(matricparm, hall_id);
+        while (ticket.status === "waiting") {
+            triggerToast(`You're number ${ticket.position} in the queue (about ${Math.max(1, Math.ceil(ticket.estimated_wait_seconds / 60))} min)`);
+            await new Promise((resolve) => setTimeout(resolve, (ticket.retry_after || 5) * 1000));
+            ticket = await getBookingQueueStatus(ticket.token);
+        }
+        if (ticket.status !== "admitted") {
+            throw new Error("Your place in the queue expired. Please try again.");
+        }
+        triggerToast("It's your turn - pick your bed now!");
+    };
+
     // ===== HANDLE ROOM BOOKING =====
-    // Step 1: When user clicks "Book", store booking details and open the confirm modal
-    const handleBooking = (hall_id, room_id, roomNumber) => {
+    // Step 1: When user clicks "Book", hold a bed, store booking details and open the confirm modal
+    const handleBooking = async (hall_id, room_id, roomNumber) => {
+        try {
+            const user = JSON.parse(localStorage.getItem("user"));
+            const matricparm = user.matriculation_number || user.matric_number;
+            try {
+                await holdBed(matricparm, hall_id, room_id);
+            } catch (error) {
+                // 429 = not our turn yet: queue up, then try the hold again
+                if (error.response?.status !== 429) throw error;
+                await waitForTurn(matricparm, hall_id);
+                await holdBed(matricparm, hall_id, room_id);
+            }
+        } catch (error) {
+            console.error(error);
+            triggerToast(error.response?.data?.error || error.message || "Could not hold this bed ❌");
+            return;
+        }
         setPendingBooking({ hall_id, room_id, roomNumber });
         setShowConfirmModal(true);
     };
 
+    // Runs when user clicks "Cancel" in the modal - give the held bed back
+    const cancelBooking = () => {
+        setShowConfirmModal(false);
+        setPendingBooking(null);
+        const user = JSON.parse(localStorage.getItem("user"));
+        releaseBed(user.matriculation_number || user.matric_number).catch((error) => console.error(error));
+    };
+
     // Step 2: Runs when user clicks "Yes, Book Room" in the modal
     const executeBooking = async () => {
         setShowConfirmModal(false);
@@ -590,7 +631,7 @@ function StudentDashboard() {
                         </p>
                         <div className="flex justify-end gap-3">
                             <button
-                                onClick={() => { setShowConfirmModal(false); setPendingBooking(null); }}
+                                onClick={cancelBooking}
                                 className="px-4 py-2 bg-gray-200 text-gray-800 rounded-md hover:bg-gray-300 transition-colors"
                             >
                                 Cancel
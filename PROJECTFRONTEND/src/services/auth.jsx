@@ -12,6 +12,49 @@ import axios from "axios"
 // The base URL of our backend server (where the Django API is running)
 const API_URL = "http://localhost:8000/api/"
 
+// ==================================================
+// LOGIN TOKEN ON EVERY REQUEST
+// ==================================================
+// The access token from login carries who you are (matric number, level,
+// payment status / admin hall), so the server doesn't have to look you up
+// again on every request. Admin pages send the admin's token, other pages
+// the student's.
+const storageKey = () => window.location.pathname.startsWith("/admin") ? "Admin" : "user";
+
+axios.interceptors.request.use((config) => {
+    const saved = JSON.parse(localStorage.getItem(storageKey()) || "null");
+    const isLogin = /(student|admin)\/login\/|token\/refresh\//.test(config.url || "");
+    if (saved && saved.access && !isLogin) {
+        config.headers = config.headers || {};
+        config.headers.Authorization = `Bearer ${saved.access}`;
+    }
+    return config;
+});
+
+// When the server says the token is out of date ("token_stale" - e.g. your
+// payment was just verified) or expired, swap it for a fresh one once and
+// send the request again.
+axios.interceptors.response.use(undefined, async (error) => {
+    const original = error.config;
+    const code = error.response && error.response.data && error.response.data.code;
+    const key = storageKey();
+    const saved = JSON.parse(localStorage.getItem(key) || "null");
+    if (error.response && error.response.status === 401 && (code === "token_stale" || code === "token_not_valid")
+        && saved && saved.refresh && original && !original._retried) {
+        try {
+            const response = await axios.post(API_URL + 'token/refresh/', { refresh: saved.refresh });
+            localStorage.setItem(key, JSON.stringify({ ...saved, ...response.data }));
+            original._retried = true;
+            original.headers.Authorization = `Bearer ${response.data.access}`;
+            return axios(original);
+        } catch (refreshError) {
+            // Refresh token expired too - they need to log in again
+            localStorage.removeItem(key);
+        }
+    }
+    throw error;
+});
+
 // ==================================================
 // STUDENT LOGIN FUNCTION
 // ==================================================
@@ -106,6 +149,23 @@ export const getAdminDashboard = async (email) => {
     }
 }
 
+// ==================================================
+// GET ADMIN DASHBOARD CHANGES - Only what changed since the last load
+// ==================================================
+// since = the hall's changes_cursor from the last dashboard/changes answer.
+// Returns { full_resync, changes_cursor, hall_details (totals only), rooms (changed rooms) }.
+// full_resync: true means "too long ago - load the full dashboard again".
+export const getAdminDashboardChanges = async (email, since) => {
+    try {
+        const response = await axios.get(API_URL + 'admin/dashboard/changes/', {
+            params: { email, since }
+        });
+        return response.data;
+    } catch (error) {
+        throw error;
+    }
+}
+
 
 
 // ==================================================
@@ -130,6 +190,24 @@ export const Adminlogout = () => {
 
 
 
+// ==================================================
+// NETWORK RETRY - Resend a request that never got an answer
+// ==================================================
+// Every attempt carries the SAME Idempotency-Key, so the server only does the
+// work once even if the first attempt actually reached it.
+const withNetworkRetry = async (send, attempts = 3) => {
+    const headers = { 'Idempotency-Key': crypto.randomUUID() };
+    for (let attempt = 1; ; attempt++) {
+        try {
+            return await send(headers);
+        } catch (error) {
+            // Only retry when there was no response at all (timeout / connection lost)
+            if (error.response || attempt >= attempts) throw error;
+            await new Promise((resolve) => setTimeout(resolve, 500 * attempt));
+        }
+    }
+}
+
 // ==================================================
 // BOOK ROOM FUNCTION
 // ==================================================
@@ -137,12 +215,14 @@ export const Adminlogout = () => {
 // Parameters: matriculation_number (which student), hall_id (which hall), room_id (which room)
 export const bookRoom = async (matriculation_number, hall_id, room_id) => {
     try {
-        // Step 1: Send the booking request to the server
-        const response = await axios.post(API_URL + 'bookRoom/', {
+        // Step 1: Send the booking request to the server.
+        // The Idempotency-Key lets us safely resend it if the network drops:
+        // the server answers a resend with the first result instead of booking again.
+        const response = await withNetworkRetry((headers) => axios.post(API_URL + 'bookRoom/', {
             matriculation_number: matriculation_number,
             hall_id: hall_id,
             room_id: room_id
-        });
+        }, { headers }));
 
         // Step 2: Return the server's response (success or error message)
         return response.data;
@@ -159,9 +239,67 @@ export const bookRoom = async (matriculation_number, hall_id, room_id) => {
 // This function fetches available rooms for a specific hall
 // Students see room numbers and bed counts, but NOT who is in each room
 // Parameter: hall_id (which hall to get rooms for)
-export const getAvailableRooms = async (hall_id) => {
+export const getAvailableRooms = async (hall_id, matriculation_number) => {
+    try {
+        // Passing the matric number keeps the student's OWN held bed in the list
+        const matricParam = matriculation_number ? `&matriculation_number=${matriculation_number}` : "";
+        const response = await axios.get(`${API_URL}available-rooms/?hall_id=${hall_id}${matricParam}`);
+        return response.data;
+    } catch (error) {
+        throw error;
+    }
+}
+
+
+// ==================================================
+// HOLD A BED - Reserve one bed while the student confirms
+// ==================================================
+// The bed stays held for a couple of minutes so nobody else can take it
+// while the confirm modal is open.
+export const holdBed = async (matriculation_number, hall_id, room_id) => {
+    try {
+        const response = await axios.post(API_URL + 'rooms/hold/', {
+            matriculation_number: matriculation_number,
+            hall_id: hall_id,
+            room_id: room_id
+        });
+        return response.data;
+    } catch (error) {
+        throw error;
+    }
+}
+
+// Give the held bed back (student cancelled)
+export const releaseBed = async (matriculation_number) => {
     try {
-        const response = await axios.get(`${API_URL}available-rooms/?hall_id=${hall_id}`);
+        const response = await axios.delete(`${API_URL}rooms/hold/?matriculation_number=${matriculation_number}`);
+        return response.data;
+    } catch (error) {
+        throw error;
+    }
+}
+
+
+// ==================================================
+// BOOKING QUEUE - Wait for your turn on allocation day
+// ==================================================
+// Join the hall's queue and get a ticket token back
+export const joinBookingQueue = async (matriculation_number, hall_id) => {
+    try {
+        const response = await axios.post(API_URL + 'queue/join/', {
+            matriculation_number: matriculation_number,
+            hall_id: hall_id
+        });
+        return response.data;
+    } catch (error) {
+        throw error;
+    }
+}
+
+// Ask "is it my turn yet?" - returns status, position and estimated wait
+export const getBookingQueueStatus = async (token) => {
+    try {
+        const response = await axios.get(`${API_URL}queue/status/?token=${token}`);
         return response.data;
     } catch (error) {
         throw error;
@@ -192,6 +330,34 @@ export const RecipetData = async (matriculation_number) => {
     }
 }
 
+// ==================================================
+// DOWNLOAD RECEIPT PDF - The official receipt file stored on the server
+// ==================================================
+// The same PDF that was emailed. The server answers with the file itself
+// (or "304 Not Modified" if the browser already has it), so nothing has to be
+// generated in the browser. Saves it as BU-Receipt_<matric>.pdf
+export const downloadReceiptPdf = async (matriculation_number) => {
+    const response = await axios.get(API_URL + 'allocation/receipt.pdf', {
+        params: { matriculation_number: matriculation_number },
+        responseType: 'blob',
+    });
+
+    //  Use the file name the server chose, if it sent one
+    const disposition = response.headers['content-disposition'] || '';
+    const match = disposition.match(/filename="([^"]+)"/);
+    const fileName = match ? match[1] : 'BU-Receipt.pdf';
+
+    //  Hand the file to the browser as a download
+    const url = window.URL.createObjectURL(response.data);
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = fileName;
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
+    window.URL.revokeObjectURL(url);
+}
+
 // ==================================================
 // ALLOCATION GRAPH - Fetches allocation trend data for admin's hall
 // ==================================================
@@ -219,9 +385,12 @@ export const allocationGraph = async (email) => {
 export const toggleRoomMaintenance = async (roomId, adminEmail) => {
     try {
         // Send PATCH request to toggle the room's maintenance status
-        const response = await axios.patch(
-            `${API_URL}rooms/${roomId}/toggle-maintenance/?email=${adminEmail}`
-        );
+        // Same Idempotency-Key on a resend, so a retried toggle can't flip the room back
+        const response = await withNetworkRetry((headers) => axios.patch(
+            `${API_URL}rooms/${roomId}/toggle-maintenance/?email=${adminEmail}`,
+            null,
+            { headers }
+        ));
 
         // Return the server's response (success message and new status)
         return response.data;
@@ -242,4 +411,81 @@ export const getAdminReceipts = async (email) => {
     } catch (error) {
         throw error;
     }
-}
\ No newline at end of file
+}
+
+// ==================================================
+// ADMIN EXPORT LINK - Address of a streamed CSV / NDJSON download
+// ==================================================
+// what: "receipts" or "allocations"; type: "csv" or "ndjson".
+// Used as a plain link, so the browser saves the file as it arrives
+// instead of holding the whole export in memory first.
+export const getAdminExportUrl = (email, what = "receipts", type = "csv", gzip = false) => {
+    const params = new URLSearchParams({ email, type });
+    if (gzip) params.append("gzip", "1");
+    return `${API_URL}admin/export/${what}/?${params.toString()}`;
+}
+// ==================================================
+// WATCH HALL - Get told when a hall's rooms change (instead of polling)
+// ==================================================
+// Opens a live stream (Server-Sent Events) for the hall. Every booking or
+// maintenance toggle arrives as a small "occupancy" event, e.g.
+//   { cursor: "42", version: 42, rooms: [17] }
+// If the server can't stream (e.g. running under runserver) we fall back to
+// polling: the server answers straight away (or waits for a change, if it can)
+// and says in retry_after how many seconds to wait before asking again.
+// onResync() means "you may have missed changes - reload the data once".
+// Returns a function that stops watching.
+export const watchHall = (hall_id, { onChange, onResync }) => {
+    let stopped = false;
+    let source = null;
+
+    // --- Fallback: long-poll in a loop ---
+    const longPoll = async () => {
+        let cursor = null;
+        while (!stopped) {
+            try {
+                const response = await axios.get(`${API_URL}halls/${hall_id}/live/poll/`, {
+                    params: cursor ? { cursor } : {},
+                    timeout: 60000
+                });
+                if (stopped) return;
+                const data = response.data;
+                if (data.resync && cursor) onResync && onResync();
+                (data.events || []).forEach((event) => onChange && onChange(event));
+                cursor = data.cursor;
+                if (data.retry_after) {
+                    await new Promise((resolve) => setTimeout(resolve, data.retry_after * 1000));
+                }
+            } catch (error) {
+                // Server down or network lost - wait a bit before asking again
+                await new Promise((resolve) => setTimeout(resolve, 5000));
+            }
+        }
+    };
+
+    // --- Preferred: one open stream ---
+    if (typeof EventSource === "undefined") {
+        longPoll();
+    } else {
+        source = new EventSource(`${API_URL}halls/${hall_id}/live/`);
+        source.addEventListener("occupancy", (message) => {
+            onChange && onChange(JSON.parse(message.data));
+        });
+        source.addEventListener("resync", () => {
+            onResync && onResync();
+        });
+        source.onerror = () => {
+            // CONNECTING = the browser is already reconnecting by itself.
+            // CLOSED = the server refused to stream (503) - switch to long-polling.
+            if (source.readyState === EventSource.CLOSED && !stopped) {
+                source = null;
+                longPoll();
+            }
+        };
+    }
+
+    return () => {
+        stopped = true;
+        if (source) source.close();
+    };
+}
@@ -7,15 +7,58 @@
 # - It's like a control panel for your database
 
 from django.contrib import admin
-from .models import Student, Room, Hall, Allocation, Payment, Log, Admin
+from django.utils import timezone
+from .models import Student, Room, Hall, Allocation, Payment, Log, Admin, ReceiptOutbox, BedHold, QueueTicket, Announcement, AnnouncementDelivery
+from .dashboards import rebuild_dashboards_on_commit
+from .identity import ADMIN, STUDENT, bump_status_version_on_commit
+from . import audit
 
-admin.site.register(Student)
+
+# Saving a student or payment here (e.g. verifying a payment) rebuilds that
+# student's ready-made dashboard (see dashboards.py). Saving a student also makes
+# their login tokens stale so the next request refreshes their claims (see identity.py)
+class StudentAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        # Saving sends updated_at back as it was read, which stops MySQL's
+        # ON UPDATE CURRENT_TIMESTAMP - set it, so the hall dashboard's ETag moves on
+        obj.updated_at = timezone.now()
+        super().save_model(request, obj, form, change)
+        rebuild_dashboards_on_commit(matric_numbers=[obj.matric_number])
+        bump_status_version_on_commit(STUDENT, [obj.matric_number])
+
+
+# Payment changes are audited straight away, in the same transaction (critical)
+class PaymentAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        rebuild_dashboards_on_commit(matric_numbers=[obj.matric_number_id])
+        audit.record(
+            "Payment changed" if change else "Payment added",
+            request.user.get_username() or 'django-admin',
+            description=f"Payment for {obj.matric_number_id}: status {obj.payment_status}, amount {obj.amount_paid}",
+            critical=True,
+        )
+
+
+# An admin moved to another hall (or given another role) must refresh their token
+class AdminAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_status_version_on_commit(ADMIN, [obj.admin_id])
+
+
+admin.site.register(Student, StudentAdmin)
 admin.site.register(Room)
 admin.site.register(Hall)
 admin.site.register(Allocation)
-admin.site.register(Payment)
+admin.site.register(Payment, PaymentAdmin)
 admin.site.register(Log)
-admin.site.register(Admin)
+admin.site.register(Admin, AdminAdmin)
+admin.site.register(ReceiptOutbox)
+admin.site.register(BedHold)
+admin.site.register(QueueTicket)
+admin.site.register(Announcement)
+admin.site.register(AnnouncementDelivery)
 
 # Register your models here.
 # To see a model in the admin panel, you need to register it here
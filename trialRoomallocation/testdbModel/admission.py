@@ -0,0 +1,412 @@
+# ==================================================
+# ADMISSION.PY - A "virtual waiting room" in front of booking
+# ==================================================
+# On allocation day the whole cohort logs in and presses "Book" in the same
+# minute. MySQL and the web workers can only do so much at once - past that
+# point everything gets slower for everybody until requests start timing out.
+#
+# Admission control keeps the load inside what the server can handle:
+#   1. A student takes a ticket for a hall (join_queue). Tickets are served in order.
+#   2. Only ADMISSION_SLOTS_PER_HALL students per hall are "admitted" at a time.
+#      Admitted students may hold/book for ADMISSION_WINDOW_SECONDS.
+#   3. Everybody else gets their position and an estimated wait, and is told
+#      (429 + Retry-After) to come back later instead of hammering the server.
+#   4. When an admitted student books (finish_ticket) the next ticket in line is
+#      admitted. Windows that run out and abandoned tickets are cleared - and their
+#      slots handed on - by manage.py process_booking_queue, every few seconds.
+#
+# Checking your place ("is it my turn yet?") is read-only: thousands of browsers
+# polling must not queue up on a lock. Handing out slots locks the hall's own
+# hall_admission row - never the hall row that bookings write to.
+# Login and the student dashboard are protected by limit_in_flight(), which caps
+# how many of those requests one web worker process handles at the same time.
+#
+# Everything is stored in the queue_ticket table (plus a few in-process counters),
+# so no extra service is needed. Turn it on with ADMISSION_CONTROL_ENABLED.
+
+import math
+import secrets
+import threading
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .booking import BookingError
+from .models import Hall, HallAdmission, QueueTicket, Student
+
+
+# Tunable settings (see settings.py) with safe defaults
+ENABLED = getattr(settings, 'ADMISSION_CONTROL_ENABLED', False)
+SLOTS_PER_HALL = getattr(settings, 'ADMISSION_SLOTS_PER_HALL', 20)
+WINDOW_SECONDS = getattr(settings, 'ADMISSION_WINDOW_SECONDS', 300)
+MAX_WAITING_PER_HALL = getattr(settings, 'ADMISSION_MAX_WAITING_PER_HALL', 5000)
+ABANDON_SECONDS = getattr(settings, 'ADMISSION_ABANDON_SECONDS', 90)
+DEFAULT_TURN_SECONDS = getattr(settings, 'ADMISSION_DEFAULT_TURN_SECONDS', 60)
+MAX_IN_FLIGHT = getattr(settings, 'ADMISSION_MAX_IN_FLIGHT', 16)
+
+# A waiting ticket's last_seen_at is only written when it is older than this, so
+# most status polls don't write anything (still well inside ABANDON_SECONDS)
+SEEN_EVERY_SECONDS = ABANDON_SECONDS / 3
+
+
+# ==================================================
+# ADMISSION ERROR - "Not yet, come back in N seconds"
+# ==================================================
+class AdmissionError(Exception):
+    def __init__(self, message, retry_after, status_code=status.HTTP_429_TOO_MANY_REQUESTS, extra=None):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        self.status_code = status_code
+        self.extra = extra or {}
+
+    def to_response(self):
+        return Response(
+            {"error": self.message, "retry_after": self.retry_after, **self.extra},
+            status=self.status_code,
+            headers={'Retry-After': str(self.retry_after)},
+        )
+
+
+# ==================================================
+# IN-PROCESS METRICS - What THIS web worker has let in or turned away
+# ==================================================
+_metrics_lock = threading.Lock()
+_metrics = {
+    'in_flight': 0,
+    'rejected_in_flight': 0,
+    'rejected_not_admitted': 0,
+    'rejected_queue_full': 0,
+    'admitted': 0,
+}
+
+
+def _bump(name, amount=1):
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+# ==================================================
+# IN-FLIGHT LIMIT - Cap concurrent login/dashboard requests per worker
+# ==================================================
+_in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT) if MAX_IN_FLIGHT else None
+
+
+def limit_in_flight(view):
+    """
+    Decorator for busy read/login views (put it directly above `def`).
+    When admission control is on and this worker is already handling
+    ADMISSION_MAX_IN_FLIGHT of these requests, answer 429 straight away
+    instead of queueing inside the web server.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not ENABLED or _in_flight is None:
+            return view(request, *args, **kwargs)
+        if not _in_flight.acquire(blocking=False):
+            _bump('rejected_in_flight')
+            return AdmissionError("The server is busy right now. Please try again in a moment.", 2).to_response()
+        _bump('in_flight')
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _bump('in_flight', -1)
+            _in_flight.release()
+    return wrapper
+
+
+# ==================================================
+# ADMITTING - Let the next students in line in
+# ==================================================
+def _lock_admission(hall_id, skip_locked=False):
+    """
+    Lock this hall's hall_admission row (created the first time it is needed).
+    With skip_locked, returns False straight away if another request holds it.
+    Must be called inside a transaction.
+    """
+    for _ in range(2):
+        locked = (
+            HallAdmission.objects.select_for_update(skip_locked=skip_locked)
+            .filter(hall_id=hall_id).values_list('hall_id', flat=True).first()
+        )
+        if locked is not None:
+            return True
+        if skip_locked and HallAdmission.objects.filter(hall_id=hall_id).exists():
+            return False  # Somebody else is admitting right now
+        HallAdmission.objects.bulk_create([HallAdmission(hall_id=hall_id)], ignore_conflicts=True)
+    return False
+
+
+def _admit_next(hall_id, now=None, skip_locked=False):
+    """
+    Expire stale tickets in this hall's queue and fill any free slots in ticket order.
+    Returns how many tickets were admitted.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Lock the hall's admission row so two requests can't both fill the same free slot
+        if not _lock_admission(hall_id, skip_locked=skip_locked):
+            return 0
+        HallAdmission.objects.filter(hall_id=hall_id).update(admitted_at=now)
+
+        tickets = QueueTicket.objects.filter(hall_id=hall_id)
+        # Admission window ran out
+        tickets.filter(status=QueueTicket.STATUS_ADMITTED, expires_at__lte=now).update(
+            status=QueueTicket.STATUS_EXPIRED
+        )
+        # Browser stopped asking for its place (tab closed) - don't give it a slot
+        tickets.filter(
+            status=QueueTicket.STATUS_WAITING,
+            last_seen_at__lt=now - timedelta(seconds=ABANDON_SECONDS),
+        ).update(status=QueueTicket.STATUS_EXPIRED)
+
+        free = SLOTS_PER_HALL - tickets.filter(status=QueueTicket.STATUS_ADMITTED).count()
+        if free <= 0:
+            return 0
+
+        next_ids = list(
+            tickets.filter(status=QueueTicket.STATUS_WAITING)
+            .order_by('ticket_id')
+            .values_list('ticket_id', flat=True)[:free]
+        )
+        if next_ids:
+            QueueTicket.objects.filter(ticket_id__in=next_ids).update(
+                status=QueueTicket.STATUS_ADMITTED,
+                admitted_at=now,
+                expires_at=now + timedelta(seconds=WINDOW_SECONDS),
+            )
+            _bump('admitted', len(next_ids))
+        return len(next_ids)
+
+
+def _admit_if_free(hall_id, now):
+    """
+    Fill a slot straight away when one is free (a quiet queue shouldn't wait for
+    process_booking_queue). Reads first, and never waits for the admission lock:
+    if another request holds it, that request is already filling the slots.
+    """
+    admitted = QueueTicket.objects.filter(
+        hall_id=hall_id, status=QueueTicket.STATUS_ADMITTED, expires_at__gt=now
+    ).count()
+    if admitted < SLOTS_PER_HALL:
+        _admit_next(hall_id, now, skip_locked=True)
+
+
+def process_queues(now=None):
+    """
+    Expire stale tickets and fill free slots in every hall that has a queue.
+    Run every few seconds by manage.py process_booking_queue. Returns {hall_id: admitted}.
+    """
+    now = now or timezone.now()
+    hall_ids = (
+        QueueTicket.objects.filter(status__in=[QueueTicket.STATUS_WAITING, QueueTicket.STATUS_ADMITTED])
+        .values_list('hall_id', flat=True).distinct()
+    )
+    return {hall_id: _admit_next(hall_id, now) for hall_id in sorted(set(hall_ids))}
+
+
+def _average_turn_seconds(hall_id):
+    """How long an admitted student usually takes to book (last 50 bookings in this hall)."""
+    recent = list(
+        QueueTicket.objects.filter(
+            hall_id=hall_id, status=QueueTicket.STATUS_DONE, admitted_at__isnull=False,
+        )
+        .order_by('-finished_at')
+        .values_list('admitted_at', 'finished_at')[:50]
+    )
+    if not recent:
+        return DEFAULT_TURN_SECONDS
+    total = sum((finished - admitted).total_seconds() for admitted, finished in recent)
+    return max(1.0, total / len(recent))
+
+
+def _estimated_wait(hall_id, position):
+    """position students ahead are served SLOTS_PER_HALL at a time."""
+    return math.ceil(position / SLOTS_PER_HALL) * _average_turn_seconds(hall_id)
+
+
+def describe_ticket(ticket):
+    """Everything the browser needs to show the student where they are in the queue."""
+    ticket_status = ticket.status
+    if ticket_status == QueueTicket.STATUS_ADMITTED and ticket.expires_at <= timezone.now():
+        ticket_status = QueueTicket.STATUS_EXPIRED  # Not swept yet, but the window is over
+    info = {
+        "token": ticket.token,
+        "hall_id": ticket.hall_id,
+        "status": ticket_status,
+        "position": 0,
+        "estimated_wait_seconds": 0,
+        "expires_at": ticket.expires_at,
+    }
+    if ticket_status == QueueTicket.STATUS_WAITING:
+        position = QueueTicket.objects.filter(
+            hall_id=ticket.hall_id,
+            status=QueueTicket.STATUS_WAITING,
+            ticket_id__lte=ticket.ticket_id,
+        ).count()
+        info["position"] = position
+        info["estimated_wait_seconds"] = round(_estimated_wait(ticket.hall_id, position))
+        # Ask again after a slice of the wait, but not more often than every 2s
+        info["retry_after"] = int(min(max(info["estimated_wait_seconds"] / 4, 2), 15))
+    return info
+
+
+# ==================================================
+# PUBLIC API - Used by the views
+# ==================================================
+def join_queue(matric, hall_id):
+    """
+    Give the student a ticket for this hall's queue (or return the one they have).
+    Raises BookingError if they can't book at all, AdmissionError if the queue is full.
+    """
+    student = Student.objects.get(matric_number=matric)
+    if student.room_id:
+        raise BookingError("Student already has a room")
+    if student.payment_status != "Verified":
+        raise BookingError("Payment not verified")
+    if not Hall.objects.filter(hall_id=hall_id).exists():
+        raise BookingError("Hall not found", status.HTTP_404_NOT_FOUND)
+
+    now = timezone.now()
+    existing = QueueTicket.objects.filter(student_id=student.student_id).first()
+    if existing and existing.hall_id == int(hall_id) and (
+        existing.status == QueueTicket.STATUS_WAITING
+        or (existing.status == QueueTicket.STATUS_ADMITTED and existing.expires_at > now)
+    ):
+        # Joining twice keeps your place
+        QueueTicket.objects.filter(ticket_id=existing.ticket_id).update(last_seen_at=now)
+        _admit_if_free(hall_id, now)
+        existing.refresh_from_db()
+        return existing
+
+    waiting = QueueTicket.objects.filter(hall_id=hall_id, status=QueueTicket.STATUS_WAITING).count()
+    if waiting >= MAX_WAITING_PER_HALL:
+        _bump('rejected_queue_full')
+        raise AdmissionError(
+            "The queue for this hall is full. Please try again shortly.",
+            _average_turn_seconds(hall_id),
+        )
+
+    try:
+        with transaction.atomic():
+            # One ticket per student: joining another hall's queue starts again at the back
+            QueueTicket.objects.filter(student_id=student.student_id).delete()
+            ticket = QueueTicket.objects.create(
+                token=secrets.token_hex(16),
+                student=student,
+                hall_id=hall_id,
+                status=QueueTicket.STATUS_WAITING,
+                created_at=now,
+                last_seen_at=now,
+            )
+    except IntegrityError:
+        # A second tab joined at the same moment - use its ticket
+        ticket = QueueTicket.objects.get(student_id=student.student_id)
+
+    _admit_if_free(hall_id, now)
+    ticket.refresh_from_db()
+    return ticket
+
+
+def check_ticket(token):
+    """
+    The browser asking "is it my turn yet?". Returns the ticket, or None for an
+    unknown token. Only reads (plus, now and then, the ticket's own last_seen_at):
+    slots are handed out by finish_ticket and process_queues, not by polling.
+    """
+    ticket = QueueTicket.objects.filter(token=token).first()
+    if ticket is None:
+        return None
+    now = timezone.now()
+    seen_recently = ticket.last_seen_at > now - timedelta(seconds=SEEN_EVERY_SECONDS)
+    if ticket.status == QueueTicket.STATUS_WAITING and not seen_recently:
+        QueueTicket.objects.filter(ticket_id=ticket.ticket_id).update(last_seen_at=now)
+        ticket.last_seen_at = now
+    return ticket
+
+
+def require_admission(matric, hall_id):
+    """
+    Raise AdmissionError unless this student currently holds an admitted ticket
+    for this hall. Does nothing while admission control is turned off.
+    """
+    if not ENABLED:
+        return
+    now = timezone.now()
+    ticket = QueueTicket.objects.filter(student__matric_number=matric).first()
+    if (
+        ticket is not None
+        and ticket.hall_id == int(hall_id)
+        and ticket.status == QueueTicket.STATUS_ADMITTED
+        and ticket.expires_at > now
+    ):
+        return
+
+    _bump('rejected_not_admitted')
+    if ticket is not None and ticket.hall_id == int(hall_id) and ticket.status == QueueTicket.STATUS_WAITING:
+        info = describe_ticket(ticket)
+        raise AdmissionError(
+            "It's not your turn to book yet. Please wait in the queue.",
+            info["retry_after"],
+            extra={"queue": info},
+        )
+    raise AdmissionError(
+        "Please join the booking queue for this hall first.",
+        1,
+        extra={"queue_required": True},
+    )
+
+
+def finish_ticket(matric):
+    """The student booked - free their slot for the next student in line."""
+    ticket = QueueTicket.objects.filter(
+        student__matric_number=matric, status=QueueTicket.STATUS_ADMITTED
+    ).first()
+    if ticket is None:
+        return
+    now = timezone.now()
+    QueueTicket.objects.filter(ticket_id=ticket.ticket_id).update(
+        status=QueueTicket.STATUS_DONE, finished_at=now
+    )
+    _admit_next(ticket.hall_id, now)
+
+
+def get_queue_metrics():
+    """Queue depth per hall (from the DB) plus this process's admission counters."""
+    now = timezone.now()
+    rows = (
+        QueueTicket.objects.filter(status__in=[QueueTicket.STATUS_WAITING, QueueTicket.STATUS_ADMITTED])
+        .values('hall_id', 'status')
+        .annotate(total=Count('ticket_id'), oldest=Min('created_at'))
+    )
+    halls = {}
+    for row in rows:
+        hall = halls.setdefault(row['hall_id'], {
+            'waiting': 0, 'admitted': 0, 'oldest_waiting_age_seconds': 0,
+        })
+        hall[row['status']] = row['total']
+        if row['status'] == QueueTicket.STATUS_WAITING:
+            hall['oldest_waiting_age_seconds'] = round((now - row['oldest']).total_seconds(), 1)
+    # How long ago each hall last handed out slots - grows without bound if
+    # manage.py process_booking_queue isn't running
+    admitted_at = dict(HallAdmission.objects.filter(hall_id__in=list(halls)).values_list('hall_id', 'admitted_at'))
+    for hall_id, hall in halls.items():
+        hall['estimated_wait_for_new_seconds'] = round(_estimated_wait(hall_id, hall['waiting'] + 1))
+        last = admitted_at.get(hall_id)
+        hall['last_admission_age_seconds'] = round((now - last).total_seconds(), 1) if last else None
+
+    with _metrics_lock:
+        process_counters = dict(_metrics)
+
+    return {
+        'enabled': ENABLED,
+        'slots_per_hall': SLOTS_PER_HALL,
+        'halls': halls,
+        'process': process_counters,
+    }
@@ -0,0 +1,348 @@
+# ==================================================
+# ALLOCATOR.PY - Give beds to ALL waiting students in one go
+# ==================================================
+# Booking 20,000 students one HTTP call at a time through book_room takes hours.
+# The batch allocator does the same job in one pass:
+#
+#   1. PLAN (read-only): load every verified student without a room, every hall
+#      and every room with free beds ONCE (rooms from the in-memory bed inventory,
+#      inventory.py), then match students to beds in memory using the same rules
+#      as the student dashboard:
+#        - same gender as the hall
+#        - student's level inside the hall's level range (Hall.level_min / level_max)
+#        - hall cost within what the student paid (Hall.cost vs Payment.amount_paid)
+#      Among the halls a student can afford we pick the most expensive one
+#      (the best hall they paid for), then fill its rooms in room-number order.
+#
+#   2. APPLY (optional - skipped in dry-run): write the plan in chunks. Each chunk
+#      is one transaction that re-checks the locked rows (a student may have booked
+#      by hand since we planned), then uses set-based writes:
+#        - one UPDATE per room for the students and one for the room counter
+#        - bulk INSERTs for receipts, allocations and receipt emails
+#        - LAST, one UPDATE per hall for its summary row (occupancy.py), so the
+#          hall-wide row is only locked for the moment before the commit
+
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.utils import timezone
+
+from .contention import run_with_retry
+from .models import Allocation, BedHold, Hall, Payment, Receipt, Room, Student
+from .inventory import hall_inventory
+from .occupancy import apply_delta, room_change_delta
+from .outbox import build_receipt_payload, enqueue_receipt_emails_bulk
+from .utils import _parse_level_number, generate_transaction_id
+
+
+# Why a student could not be placed (used in the plan summary)
+REASON_NO_MATCHING_HALL = 'no_hall_for_gender_and_level'
+REASON_OVER_BUDGET = 'no_hall_within_budget'
+REASON_NO_FREE_BEDS = 'no_free_beds_left'
+
+
+@dataclass
+class AllocationPlan:
+    # List of (student, room) pairs, in the order they will be written
+    assignments: list = field(default_factory=list)
+    # reason -> how many students could not be placed for that reason
+    unallocated: Counter = field(default_factory=Counter)
+    students_considered: int = 0
+
+    def summary(self):
+        per_hall = Counter(room.hall.hall_name for _student, room in self.assignments)
+        return {
+            'students_considered': self.students_considered,
+            'planned_allocations': len(self.assignments),
+            'unallocated': dict(self.unallocated),
+            'per_hall': dict(per_hall),
+        }
+
+
+@dataclass
+class AllocationRunResult:
+    allocated: int = 0
+    # Students/beds that changed between planning and writing (booked by hand meanwhile)
+    skipped_conflicts: int = 0
+    per_hall: Counter = field(default_factory=Counter)
+
+    def summary(self):
+        return {
+            'allocated': self.allocated,
+            'skipped_conflicts': self.skipped_conflicts,
+            'per_hall': dict(self.per_hall),
+        }
+
+
+def _active_hold_counts(room_ids=None):
+    """{room_id: number of beds currently held by students}"""
+    holds = BedHold.objects.filter(expires_at__gt=timezone.now())
+    if room_ids is not None:
+        holds = holds.filter(room_id__in=room_ids)
+    return dict(holds.values('room_id').annotate(total=Count('hold_id')).values_list('room_id', 'total'))
+
+
+# ==================================================
+# STEP 1: PLAN - Match students to beds in memory
+# ==================================================
+def plan_allocations(hall_ids=None, limit=None):
+    """
+    Build an AllocationPlan without writing anything.
+    hall_ids: only allocate into these halls (None = every hall)
+    limit: only consider the first N waiting students (oldest first)
+    """
+    plan = AllocationPlan()
+
+    halls = Hall.objects.all()
+    if hall_ids:
+        halls = halls.filter(hall_id__in=hall_ids)
+
+    # Most expensive first, so students get the best hall they paid for
+    # (level and cost come from the hall's numeric columns - no text parsing here)
+    halls_by_gender = defaultdict(list)
+    for hall in halls.order_by(F('cost').desc(nulls_last=True), 'hall_id'):
+        hall.parsed_cost = float(hall.cost or 0)
+        halls_by_gender[hall.gender].append(hall)
+
+    # Free beds per hall, as a list of [room, beds_left] in room-number order.
+    # Beds that students are holding right now (holds.py) don't count as free.
+    # The rooms come from the in-memory bed inventory (inventory.py) instead of a
+    # scan of the room table; apply_plan re-checks them under lock anyway.
+    held = _active_hold_counts()
+    free_rooms = defaultdict(list)
+    for gender_halls in halls_by_gender.values():
+        for hall in gender_halls:
+            for room_data in hall_inventory(hall.hall_id).rooms_with_free_beds():
+                room = Room(hall=hall, is_under_maintenance=False, **room_data)
+                beds_left = room.capacity - room.current_occupants - held.get(room.room_id, 0)
+                if beds_left > 0:
+                    free_rooms[hall.hall_id].append([room, beds_left])
+
+    # How much each student paid (one query for everybody)
+    amount_paid = {
+        matric: float(amount)
+        for matric, amount in Payment.objects.filter(payment_status="Verified")
+        .values_list('matric_number', 'amount_paid')
+    }
+
+    students = (
+        Student.objects.filter(payment_status="Verified", room__isnull=True)
+        .only('student_id', 'matric_number', 'full_name', 'email',
+              'department', 'level', 'gender')
+        .order_by('student_id')
+    )
+    if limit:
+        students = students[:limit]
+
+    for student in students:
+        plan.students_considered += 1
+        student_level_num = _parse_level_number(student.level)
+        paid = amount_paid.get(student.matric_number, 0.0)
+
+        level_matched = [
+            hall for hall in halls_by_gender.get(student.gender, [])
+            if hall.accepts_level(student_level_num)
+        ]
+        if not level_matched:
+            plan.unallocated[REASON_NO_MATCHING_HALL] += 1
+            continue
+
+        affordable = [hall for hall in level_matched if hall.parsed_cost <= paid]
+        if not affordable:
+            plan.unallocated[REASON_OVER_BUDGET] += 1
+            continue
+
+        hall = next((h for h in affordable if free_rooms.get(h.hall_id)), None)
+        if hall is None:
+            plan.unallocated[REASON_NO_FREE_BEDS] += 1
+            continue
+
+        # Take a bed from the first room with space in that hall
+        slot = free_rooms[hall.hall_id][0]
+        plan.assignments.append((student, slot[0]))
+        slot[1] -= 1
+        if slot[1] == 0:
+            free_rooms[hall.hall_id].pop(0)
+
+    return plan
+
+
+# ==================================================
+# STEP 2: APPLY - Write the plan with set-based queries
+# ==================================================
+def apply_plan(plan, batch_size=500, send_emails=True):
+    """Write the plan to the database in chunks of batch_size students."""
+    result = AllocationRunResult()
+    for start in range(0, len(plan.assignments), batch_size):
+        chunk = plan.assignments[start:start + batch_size]
+        # A chunk that hits a deadlock is rolled back as a whole, so it is safe to run again
+        run_with_retry(lambda: _apply_chunk(chunk, result, send_emails))
+    return result
+
+
+def _apply_chunk(chunk, result, send_emails):
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Lock the students and rooms of this chunk, always in the same order
+        # (students first, then rooms) as book_room, and re-check them
+        still_waiting = set(
+            Student.objects.select_for_update()
+            .filter(
+                student_id__in=[student.student_id for student, _room in chunk],
+                payment_status="Verified",
+                room__isnull=True,
+            )
+            .order_by('student_id')
+            .values_list('student_id', flat=True)
+        )
+        locked_rooms = {
+            row['room_id']: row
+            for row in Room.objects.select_for_update()
+            .filter(room_id__in={room.room_id for _student, room in chunk})
+            .order_by('room_id')
+            .values('room_id', 'capacity', 'current_occupants', 'is_under_maintenance')
+        }
+
+        held = _active_hold_counts(list(locked_rooms))
+
+        accepted = []
+        skipped = 0
+        taken = Counter()
+        for student, room in chunk:
+            row = locked_rooms.get(room.room_id)
+            if (
+                student.student_id not in still_waiting
+                or row is None
+                or row['is_under_maintenance']
+                or row['current_occupants'] + held.get(room.room_id, 0) + taken[room.room_id] >= row['capacity']
+            ):
+                skipped += 1
+                continue
+            taken[room.room_id] += 1
+            accepted.append((student, room))
+
+        if not accepted:
+            result.skipped_conflicts += skipped
+            return
+
+        # --- Students and room counters: one UPDATE each per room ---
+        students_by_room = defaultdict(list)
+        rooms_by_id = {}
+        for student, room in accepted:
+            students_by_room[room.room_id].append(student.student_id)
+            rooms_by_id[room.room_id] = room
+
+        hall_deltas = defaultdict(Counter)
+        hall_rooms = defaultdict(list)
+        for room_id, student_ids in sorted(students_by_room.items()):
+            room = rooms_by_id[room_id]
+            added = len(student_ids)
+            Student.objects.filter(student_id__in=student_ids).update(
+                room_id=room_id, hall_selected_id=room.hall_id, updated_at=now
+            )
+            # room_status first: MySQL applies SET clauses left to right
+            Room.objects.filter(room_id=room_id).update(
+                room_status=Case(
+                    When(current_occupants__gte=F('capacity') - added, then=Value('Full')),
+                    default=Value('Occupied'),
+                ),
+                current_occupants=F('current_occupants') + added,
+                updated_at=now,
+            )
+            row = locked_rooms[room_id]
+            hall_deltas[room.hall_id].update(room_change_delta(
+                (row['capacity'], row['current_occupants'], False),
+                (row['capacity'], row['current_occupants'] + added, False),
+            ))
+            hall_rooms[room.hall_id].append(room_id)
+
+        # --- Receipts: one bulk INSERT ---
+        amount_paid = dict(
+            Payment.objects.filter(
+                matric_number__in=[student.matric_number for student, _room in accepted],
+                payment_status="Verified",
+            ).values_list('matric_number', 'amount_paid')
+        )
+        transaction_ids = {}
+        used = set()
+        for student, _room in accepted:
+            transaction_id = generate_transaction_id()
+            while transaction_id in used:
+                transaction_id = generate_transaction_id()
+            used.add(transaction_id)
+            transaction_ids[student.student_id] = transaction_id
+
+        Receipt.objects.bulk_create([
+            Receipt(
+                payment_reference=transaction_ids[student.student_id],
+                student_name=student.full_name,
+                matric_number=student,
+                amount_paid=amount_paid.get(student.matric_number, 0),
+                date_paid=now,
+                verified=True,
+                created_at=now,
+            )
+            for student, _room in accepted
+        ], batch_size=500)
+
+        # MySQL does not return ids from bulk INSERTs, so read them back
+        receipt_ids = dict(
+            Receipt.objects.filter(
+                payment_reference__in=list(used),
+                matric_number__in=[student.matric_number for student, _room in accepted],
+            ).values_list('payment_reference', 'receipt_id')
+        )
+
+        # --- Allocations: one bulk INSERT ---
+        Allocation.objects.bulk_create([
+            Allocation(
+                student=student,
+                room=room,
+                receipt_id=receipt_ids.get(transaction_ids[student.student_id]),
+                allocation_date=now,
+                status='active',
+                created_at=now,
+            )
+            for student, room in accepted
+        ], batch_size=500)
+
+        # --- Receipt emails: one bulk INSERT into the outbox ---
+        if send_emails:
+            allocation_ids = dict(
+                Allocation.objects.filter(
+                    student_id__in=[student.student_id for student, _room in accepted],
+                    status='active',
+                ).values_list('student_id', 'allocation_id')
+            )
+            enqueue_receipt_emails_bulk({
+                allocation_ids[student.student_id]: build_receipt_payload(
+                    student,
+                    room,
+                    allocation_ids[student.student_id],
+                    transaction_ids[student.student_id],
+                    amount_paid.get(student.matric_number, 0),
+                )
+                for student, room in accepted
+            })
+
+        # --- Hall summaries: one UPDATE per hall, locked last (just before the commit) ---
+        for hall_id, delta in sorted(hall_deltas.items()):
+            apply_delta(hall_id, delta, hall_rooms[hall_id])
+
+    # Only counted once the chunk has committed (a retried chunk must not count twice)
+    result.skipped_conflicts += skipped
+    result.allocated += len(accepted)
+    for _student, room in accepted:
+        result.per_hall[room.hall.hall_name] += 1
+
+
+def auto_allocate(hall_ids=None, limit=None, dry_run=False, batch_size=500, send_emails=True):
+    """Plan and (unless dry_run) apply a batch allocation. Returns a summary dict."""
+    plan = plan_allocations(hall_ids=hall_ids, limit=limit)
+    summary = {'dry_run': dry_run, 'plan': plan.summary()}
+    if not dry_run:
+        summary['result'] = apply_plan(plan, batch_size=batch_size, send_emails=send_emails).summary()
+    return summary
@@ -0,0 +1,186 @@
+# ==================================================
+# ANNOUNCEMENTS.PY - Email one message to everyone living in a hall
+# ==================================================
+# POST /api/admin/announcements/ stores the announcement and one
+# AnnouncementDelivery row per student with an active allocation in the hall
+# (two queries, however big the hall). Nothing is emailed during the request.
+#
+# The receipt outbox workers (manage.py process_receipt_outbox) send them once
+# the receipts that are due have gone out - receipts come first:
+#   - deliveries are claimed MAIL_BATCH_SIZE at a time (SKIP LOCKED, like the
+#     outbox) and split over the worker threads
+#   - each thread sends its share over its one reused SMTP connection, throttled
+#     to MAIL_MAX_PER_MINUTE (mailer.py)
+#   - every delivery records its own outcome; failed ones are retried with the
+#     outbox's back-off (RECEIPT_OUTBOX_MAX_ATTEMPTS / _RETRY_BASE_SECONDS)
+#
+# GET /api/admin/announcements/<id>/ shows how many were sent / pending /
+# failed, and why the failed ones failed.
+
+import random
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Q
+from django.core.mail import EmailMessage
+from django.utils import timezone
+
+from .mailer import BATCH_SIZE, send_messages
+from .models import Allocation, Announcement, AnnouncementDelivery
+from .outbox import LEASE_SECONDS, MAX_ATTEMPTS, RETRY_BASE_SECONDS
+from .utils import FROM_EMAIL
+
+
+# ==================================================
+# QUEUE - Called by the view
+# ==================================================
+def create_announcement(hall, subject, body, sent_by):
+    """Store an announcement for `hall` (None = whole campus) and queue one delivery per resident."""
+    now = timezone.now()
+    residents = Allocation.objects.filter(status='active')
+    if hall is not None:
+        residents = residents.filter(room__hall=hall)
+
+    with transaction.atomic():
+        announcement = Announcement.objects.create(
+            hall=hall, subject=subject, body=body, sent_by=sent_by, created_at=now,
+        )
+        deliveries = [
+            AnnouncementDelivery(
+                announcement=announcement, student_id=student_id, email=email,
+                status=AnnouncementDelivery.STATUS_PENDING, next_attempt_at=now,
+            )
+            for student_id, email in residents.values_list('student_id', 'student__email').distinct()
+        ]
+        AnnouncementDelivery.objects.bulk_create(deliveries, batch_size=500, ignore_conflicts=True)
+    return announcement, len(deliveries)
+
+
+def announcement_status(announcement):
+    """Delivery counts per status, plus the failed addresses and their last error."""
+    deliveries = AnnouncementDelivery.objects.filter(announcement=announcement)
+    by_status = dict(deliveries.values_list('status').annotate(total=Count('delivery_id')))
+    failed = deliveries.filter(status=AnnouncementDelivery.STATUS_FAILED).values(
+        'email', 'attempts', 'last_error'
+    )
+    return {
+        'announcement_id': announcement.announcement_id,
+        'subject': announcement.subject,
+        'hall': announcement.hall.hall_name if announcement.hall_id else None,
+        'created_at': announcement.created_at,
+        'deliveries': {
+            status_name: by_status.get(status_name, 0)
+            for status_name in (
+                AnnouncementDelivery.STATUS_PENDING,
+                AnnouncementDelivery.STATUS_PROCESSING,
+                AnnouncementDelivery.STATUS_SENT,
+                AnnouncementDelivery.STATUS_FAILED,
+            )
+        },
+        'failed': list(failed[:100]),
+    }
+
+
+# ==================================================
+# SEND - Run by the outbox workers
+# ==================================================
+def claim_deliveries(worker_id, limit=None):
+    """Lock and mark up to `limit` due deliveries as 'processing' (same rules as outbox.claim_batch)."""
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=LEASE_SECONDS)
+
+    with transaction.atomic():
+        due = list(
+            AnnouncementDelivery.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=AnnouncementDelivery.STATUS_PENDING, next_attempt_at__lte=now)
+                | Q(status=AnnouncementDelivery.STATUS_PROCESSING, locked_at__lt=stale_before)
+            )
+            .order_by('next_attempt_at', 'delivery_id')
+            .values_list('delivery_id', 'status', 'attempts')[:limit or BATCH_SIZE]
+        )
+        # A lost lease (the worker crashed or hung) counts as an attempt, like in the outbox
+        stale = [(delivery_id, attempts) for delivery_id, status_name, attempts in due
+                 if status_name == AnnouncementDelivery.STATUS_PROCESSING]
+        given_up = {delivery_id for delivery_id, attempts in stale if attempts + 1 >= MAX_ATTEMPTS}
+        if given_up:
+            AnnouncementDelivery.objects.filter(delivery_id__in=given_up).update(
+                status=AnnouncementDelivery.STATUS_FAILED, attempts=F('attempts') + 1,
+                last_error="Worker lease expired too many times (the worker crashed or hung on this delivery)",
+                locked_at=None, locked_by=None,
+            )
+        reclaimed = [delivery_id for delivery_id, _attempts in stale if delivery_id not in given_up]
+        if reclaimed:
+            AnnouncementDelivery.objects.filter(delivery_id__in=reclaimed).update(attempts=F('attempts') + 1)
+        ids = [delivery_id for delivery_id, _status, _attempts in due if delivery_id not in given_up]
+        if not ids:
+            return []
+        AnnouncementDelivery.objects.filter(delivery_id__in=ids).update(
+            status=AnnouncementDelivery.STATUS_PROCESSING, locked_at=now, locked_by=worker_id
+        )
+    # Names and halls for the emails, read once the rows are ours (the lock above
+    # only covers the delivery rows, not the students or halls)
+    return list(
+        AnnouncementDelivery.objects.filter(delivery_id__in=ids)
+        .select_related('student', 'announcement__hall').order_by('delivery_id')
+    )
+
+
+def build_announcement_message(delivery):
+    announcement = delivery.announcement
+    sender = f"{announcement.hall.hall_name} management" if announcement.hall_id else "Student Affairs"
+    return EmailMessage(
+        subject=f"Babcock University: {announcement.subject}",
+        body=(
+            f"Hello {delivery.student.full_name},\n\n"
+            f"{announcement.body}\n\n"
+            f"— {sender}, Babcock University HAMS"
+        ),
+        from_email=FROM_EMAIL,
+        to=[delivery.email],
+    )
+
+
+def process_deliveries(deliveries, worker_id):
+    """Send claimed deliveries and record each one's outcome. Returns how many were sent."""
+    outcomes = send_messages([build_announcement_message(delivery) for delivery in deliveries])
+
+    sent_ids = [delivery.delivery_id for delivery, error in zip(deliveries, outcomes) if error is None]
+    if sent_ids:
+        # All the sent ones in one UPDATE
+        AnnouncementDelivery.objects.filter(delivery_id__in=sent_ids, locked_by=worker_id).update(
+            status=AnnouncementDelivery.STATUS_SENT, attempts=F('attempts') + 1, sent_at=timezone.now(),
+            last_error=None, locked_at=None, locked_by=None,
+        )
+
+    for delivery, error in zip(deliveries, outcomes):
+        if error is None:
+            continue
+        attempts = delivery.attempts + 1
+        if attempts >= MAX_ATTEMPTS:
+            new_status, next_attempt_at = AnnouncementDelivery.STATUS_FAILED, timezone.now()
+        else:
+            delay = RETRY_BASE_SECONDS * (2 ** (attempts - 1)) + random.uniform(0, RETRY_BASE_SECONDS)
+            new_status = AnnouncementDelivery.STATUS_PENDING
+            next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        AnnouncementDelivery.objects.filter(delivery_id=delivery.delivery_id, locked_by=worker_id).update(
+            status=new_status, attempts=attempts, next_attempt_at=next_attempt_at,
+            last_error=str(error)[:2000], locked_at=None, locked_by=None,
+        )
+    return len(sent_ids)
+
+
+def _process_in_thread(deliveries, worker_id):
+    try:
+        return process_deliveries(deliveries, worker_id)
+    finally:
+        close_old_connections()
+
+
+def drain_announcements_once(executor, worker_id, workers=1):
+    """Claim one batch of deliveries and split it over the thread pool. Returns how many were claimed."""
+    deliveries = claim_deliveries(worker_id)
+    if deliveries:
+        shares = [deliveries[start::workers] for start in range(min(workers, len(deliveries)))]
+        list(executor.map(lambda share: _process_in_thread(share, worker_id), shares))
+    return len(deliveries)
@@ -0,0 +1,184 @@
+# ==================================================
+# AUDIT.PY - Write audit log entries without slowing the request down
+# ==================================================
+# The Log table is our diary of important actions (who toggled which room,
+# who booked, who logged in, which payment was verified). Writing each entry
+# with Log.objects.create() is one more INSERT round trip on the hot path -
+# inside toggle_maintenance's locking transaction it even kept the room
+# locked while it ran.
+#
+# record() instead puts the entry in an in-memory buffer (microseconds) and a
+# background writer thread saves them in bulk:
+#   - one bulk INSERT per AUDIT_LOG_BATCH_SIZE entries, or every
+#     AUDIT_LOG_FLUSH_SECONDS, whichever comes first
+#   - an entry recorded inside a transaction joins the buffer only once that
+#     transaction COMMITS (a rolled-back toggle leaves no log entry)
+#   - the buffer holds at most AUDIT_LOG_BUFFER_LIMIT entries. When it is full
+#     (the database is down or very slow) new entries are written straight away
+#     by the caller instead of being dropped
+#   - whatever is still waiting is written when the process exits (flush on
+#     shutdown); a hard kill can lose the last AUDIT_LOG_FLUSH_SECONDS of entries
+#   - record(..., critical=True) - payments, for example - is written at once,
+#     in the caller's transaction, exactly like before
+#   - AUDIT_LOG_ASYNC=False writes every entry at once (the old behaviour)
+#
+# Buffer size and writer counters are at /api/audit/metrics/.
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Log
+
+
+logger = logging.getLogger(__name__)
+
+ASYNC = getattr(settings, 'AUDIT_LOG_ASYNC', True)
+BATCH_SIZE = getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 100)
+FLUSH_SECONDS = getattr(settings, 'AUDIT_LOG_FLUSH_SECONDS', 1.0)
+BUFFER_LIMIT = getattr(settings, 'AUDIT_LOG_BUFFER_LIMIT', 10000)
+
+_lock = threading.Lock()        # Guards _pending, _counters and _writer
+_flush_lock = threading.Lock()  # One flush at a time
+_pending = []
+_wake = threading.Event()       # "A full batch is waiting" / "stop now"
+_stopping = threading.Event()
+_writer = None
+_counters = Counter()
+
+
+def _bump(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+# ==================================================
+# RECORD - What the views call
+# ==================================================
+def record(action, user_role, description=None, user_id=None, critical=False):
+    """
+    Add an audit log entry. user_role is who did it (their email / matric
+    number, like the existing entries). critical=True writes it now, inside
+    the current transaction, instead of through the buffer.
+    """
+    entry = Log(
+        action=action[:255],
+        user_role=(user_role or 'unknown')[:100],
+        user_id=user_id,
+        description=description,
+        timestamp=timezone.now(),
+    )
+    if critical or not ASYNC:
+        entry.save()
+        _bump('written_sync')
+        return
+    # Runs straight away outside a transaction, after COMMIT inside one
+    transaction.on_commit(lambda: _enqueue(entry))
+
+
+def _enqueue(entry):
+    with _lock:
+        full = len(_pending) >= BUFFER_LIMIT
+        if not full:
+            _pending.append(entry)
+            batch_ready = len(_pending) >= BATCH_SIZE
+    if full:
+        # Never drop an audit entry: the caller writes this one itself
+        _bump('overflow_sync')
+        _write([entry])
+        return
+    _ensure_writer()
+    if batch_ready:
+        _wake.set()
+
+
+# ==================================================
+# WRITER - Bulk INSERTs from a background thread
+# ==================================================
+def _write(entries):
+    try:
+        Log.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+    except Exception:
+        # Keep them for the next flush (as far as the buffer has room)
+        with _lock:
+            room = max(BUFFER_LIMIT - len(_pending), 0)
+            _pending[:0] = entries[:room]
+            _counters['write_failures'] += 1
+            _counters['dropped'] += len(entries) - min(room, len(entries))
+        logger.exception("Audit log write failed (%s entries)", len(entries))
+        return 0
+    with _lock:
+        _counters['written'] += len(entries)
+        _counters['batches'] += 1
+    return len(entries)
+
+
+def flush():
+    """Write everything waiting in the buffer now (in this thread). Returns how many were written."""
+    with _flush_lock:
+        with _lock:
+            entries = _pending[:]
+            _pending.clear()
+        return _write(entries) if entries else 0
+
+
+def _run_writer():
+    while not _stopping.is_set():
+        _wake.wait(FLUSH_SECONDS)
+        _wake.clear()
+        try:
+            flush()
+        finally:
+            # This thread has its own database connection - don't let it go stale
+            close_old_connections()
+
+
+def _ensure_writer():
+    global _writer
+    with _lock:
+        if _writer is not None and _writer.is_alive():
+            return
+        _writer = threading.Thread(target=_run_writer, name='audit-log-writer', daemon=True)
+        _writer.start()
+
+
+@atexit.register
+def shutdown(timeout=5.0):
+    """Stop the writer and write whatever is still waiting (runs when the process exits)."""
+    _stopping.set()
+    _wake.set()
+    writer = _writer
+    if writer is not None and writer.is_alive() and writer is not threading.current_thread():
+        writer.join(timeout)
+    # Anything recorded while the writer was stopping
+    deadline = time.monotonic() + timeout
+    while _pending and time.monotonic() < deadline:
+        if not flush():
+            break
+
+
+def get_audit_metrics():
+    with _lock:
+        counters = dict(_counters)
+        pending = len(_pending)
+        writer_alive = _writer is not None and _writer.is_alive()
+    batches = counters.get('batches', 0)
+    return {
+        'mode': 'async' if ASYNC else 'sync',
+        'pending': pending,
+        'buffer_limit': BUFFER_LIMIT,
+        'writer_running': writer_alive,
+        'written': counters.get('written', 0),
+        'batches': batches,
+        'average_batch': round(counters.get('written', 0) / batches, 1) if batches else None,
+        'written_sync': counters.get('written_sync', 0),
+        'overflow_sync': counters.get('overflow_sync', 0),
+        'write_failures': counters.get('write_failures', 0),
+        'dropped': counters.get('dropped', 0),
+    }
@@ -0,0 +1,345 @@
+# ==================================================
+# BOOKING.PY - The actual "give this student that bed" logic
+# ==================================================
+# book_room in views.py only checks the request and turns the result into a
+# response. The real work happens here, in one of two booking engines:
+#
+#   'locking'  - The original approach. Lock the student and room rows with
+#                SELECT ... FOR UPDATE, check them in Python, then save.
+#                Simple, but every booking for the same room waits in line
+#                for the previous one to finish.
+#
+#   'guarded'  - Claim the bed with ONE conditional UPDATE:
+#                  UPDATE room SET current_occupants = current_occupants + 1
+#                  WHERE room_id = ... AND current_occupants < capacity
+#                    AND is_under_maintenance = 0
+#                If no row changed, somebody else took the last bed (or the room
+#                is under maintenance) and we stop straight away. The room row is
+#                only locked for the instant of the UPDATE itself instead of for
+#                a whole read-check-write round trip.
+#
+# Pick the engine with BOOKING_ENGINE in settings.py (or the .env file).
+#
+# Both engines respect bed holds (see holds.py): beds held by OTHER students
+# count as taken, and the booking student's own hold is used up on success.
+#
+# Both engines lock rows in the same order (student -> room -> hall, see
+# contention.py) and book() runs them again if MySQL reports a deadlock or
+# lock wait timeout.
+
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import status
+
+from . import audit
+from .contention import LockRetriesExhausted, lock_wait, record, run_with_retry
+from .models import Allocation, BedHold, Payment, Receipt, Room, Student
+from .occupancy import record_room_change
+from .outbox import build_receipt_payload, enqueue_receipt_email
+from .utils import generate_transaction_id
+
+
+ENGINE_LOCKING = 'locking'
+ENGINE_GUARDED = 'guarded'
+BOOKING_ENGINES = (ENGINE_LOCKING, ENGINE_GUARDED)
+
+
+# ==================================================
+# BOOKING ERROR - A booking that was refused for a known reason
+# ==================================================
+# Carries the message and HTTP status that book_room should send back
+class BookingError(Exception):
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+# ==================================================
+# BOOKING RESULT - What a successful booking hands back to the view
+# ==================================================
+@dataclass
+class BookingResult:
+    student: Student
+    room: Room
+    allocation: Allocation
+
+
+def get_booking_engine():
+    """Return the configured engine name, falling back to the original locking engine."""
+    engine = getattr(settings, 'BOOKING_ENGINE', ENGINE_LOCKING)
+    return engine if engine in BOOKING_ENGINES else ENGINE_LOCKING
+
+
+HOLD_CONFLICT_MESSAGE = "All remaining beds in this room are being held by other students. Try again shortly."
+
+
+def holds_required():
+    """True when students must hold a bed (holds.place_hold) before booking it."""
+    return getattr(settings, 'BED_HOLDS_REQUIRED', False)
+
+
+def _check_own_hold(student_id, room_id, now):
+    if holds_required() and not BedHold.objects.filter(
+        student_id=student_id, room_id=room_id, expires_at__gt=now
+    ).exists():
+        raise BookingError("Please hold a bed in this room before booking it", status.HTTP_409_CONFLICT)
+
+
+BUSY_MESSAGE = "The booking system is very busy right now. Please try again in a moment."
+
+
+def book(matric, hall_id, room_id, engine=None):
+    """
+    Book room_id in hall_id for the student with this matric number.
+    Deadlocks and lock wait timeouts are retried (contention.run_with_retry);
+    if they keep happening the student gets a 503 "try again" instead of a 500.
+    """
+    engine = engine or get_booking_engine()
+    run_engine = book_with_guarded_update if engine == ENGINE_GUARDED else book_with_locks
+    try:
+        return run_with_retry(lambda: run_engine(matric, hall_id, room_id), hall_id=hall_id, room_id=room_id)
+    except BookingError:
+        # Full / held / maintenance - counted so hot rooms show up in the metrics
+        record('refused', hall_id, room_id)
+        raise
+    except LockRetriesExhausted:
+        raise BookingError(BUSY_MESSAGE, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+# ==================================================
+# SHARED STEP - Receipt, allocation and receipt email
+# ==================================================
+# Both engines finish the same way once the bed and the student are claimed
+def _create_allocation_records(student, room):
+    # Create the autonomous receipt record first
+    transaction_id = generate_transaction_id()
+
+    # Get the student's payment record to retrieve the amount paid
+    try:
+        payment_record = Payment.objects.get(matric_number=student, payment_status="Verified")
+        amount = payment_record.amount_paid
+    except Payment.DoesNotExist:
+        amount = 0  # Default to 0 if no payment record found
+
+    new_receipt = Receipt.objects.create(
+        payment_reference=transaction_id,
+        student_name=student.full_name,
+        matric_number=student,
+        amount_paid=amount,
+        date_paid=timezone.now(),
+        verified=True,
+        created_at=timezone.now(),
+    )
+
+    # Create an allocation record (like a receipt of this booking)
+    allocation = Allocation.objects.create(
+        student=student,
+        room=room,
+        receipt=new_receipt,
+        allocation_date=timezone.now(),  # Current date and time
+        status='active',  # The allocation is active
+        created_at=timezone.now(),
+    )
+
+    # Queue the PDF receipt email in the SAME transaction.
+    # The receipt outbox worker builds the PDF and sends it AFTER we commit,
+    # so slow PDF/SMTP work never holds the student and room locks.
+    enqueue_receipt_email(allocation, build_receipt_payload(
+        student, room, allocation.allocation_id, transaction_id, amount
+    ))
+
+    # Buffered; joins the audit log only if this booking commits (audit.py)
+    audit.record(
+        f"Booked Room {room.room_number}", student.matric_number, user_id=student.student_id,
+        description=f"Allocation BU-HAMS-{allocation.allocation_id}: room {room.room_number} in hall {room.hall_id}",
+    )
+
+    return allocation
+
+
+# ==================================================
+# ENGINE 1: LOCKING - SELECT ... FOR UPDATE, check, then save
+# ==================================================
+def book_with_locks(matric, hall_id, room_id):
+    #  Use a "transaction" - this means if anything goes wrong,
+    # we undo ALL the changes (like a safety net)
+    with transaction.atomic():
+        #  Lock the student's record so they can't book twice at the same time
+        # (Like putting a "Reserved" sign while we process their booking)
+        with lock_wait(hall_id):
+            student = Student.objects.select_for_update().get(matric_number=matric)
+
+        #  VALIDATION - Check if the student is allowed to book
+
+        #  Check 1: Do they already have a room?
+        if student.room:
+            raise BookingError("Student already has a room")
+
+        # Check 2: Did they pay their hostel fees?
+        if student.payment_status != "Verified":
+            raise BookingError("Payment not verified")
+
+        #  Get the specific room the student selected
+        # Lock it for update to prevent race conditions
+        try:
+            with lock_wait(hall_id):
+                room = Room.objects.select_for_update().get(
+                    room_id=room_id,
+                    hall_id=hall_id,  # Must be in the correct hall
+                )
+        except Room.DoesNotExist:
+            raise BookingError("Room not found in this hall", status.HTTP_404_NOT_FOUND)
+
+        #  Validate the room is still available
+        if room.current_occupants >= room.capacity:
+            raise BookingError("This room is already full")
+        if room.is_under_maintenance:
+            raise BookingError("This room is under maintenance")
+
+        # Beds held by OTHER students are not available to this student
+        now = timezone.now()
+        _check_own_hold(student.student_id, room.room_id, now)
+        held_by_others = (
+            BedHold.objects.filter(room_id=room.room_id, expires_at__gt=now)
+            .exclude(student_id=student.student_id)
+            .count()
+        )
+        if room.current_occupants + held_by_others >= room.capacity:
+            raise BookingError(HOLD_CONFLICT_MESSAGE, status.HTTP_409_CONFLICT)
+
+        #  EXECUTE THE BOOKING!
+
+        # Add 1 to the number of students in this room
+        room.current_occupants += 1
+
+        # Fix #5: Update room status if room is now full
+        if room.current_occupants >= room.capacity:
+            room.room_status = 'Full'
+
+        room.save()  # Save the change to the database
+
+        # Assign the room and hall to the student
+        student.room = room
+        student.hall_selected = room.hall
+        student.save()  # Save the student's new room
+
+        # The student's hold (if any) has now been turned into a real bed
+        BedHold.objects.filter(student_id=student.student_id).delete()
+
+        allocation = _create_allocation_records(student, room)
+
+        # Fix #4: Update the hall's totals (one more bed taken, maybe one fewer
+        # available room). Every booking in the hall needs the summary row, so
+        # it is locked LAST - the statement right before the commit.
+        record_room_change(
+            room.hall_id,
+            (room.capacity, room.current_occupants - 1, False),
+            (room.capacity, room.current_occupants, False),
+            room_id=room.room_id,
+        )
+
+    return BookingResult(student=student, room=room, allocation=allocation)
+
+
+# ==================================================
+# ENGINE 2: GUARDED UPDATE - Claim the bed with one conditional UPDATE
+# ==================================================
+def _explain_failed_room_claim(hall_id, room_id):
+    """The guarded UPDATE changed nothing - work out why, for the error message."""
+    room = Room.objects.filter(room_id=room_id, hall_id=hall_id).values(
+        'current_occupants', 'capacity', 'is_under_maintenance'
+    ).first()
+    if room is None:
+        return BookingError("Room not found in this hall", status.HTTP_404_NOT_FOUND)
+    if room['is_under_maintenance']:
+        return BookingError("This room is under maintenance")
+    if room['current_occupants'] < room['capacity']:
+        return BookingError(HOLD_CONFLICT_MESSAGE, status.HTTP_409_CONFLICT)
+    return BookingError("This room is already full")
+
+
+def _holds_by_others(student_id, now):
+    """Subquery: active holds on the outer room that belong to somebody else."""
+    return Subquery(
+        BedHold.objects.filter(room_id=OuterRef('room_id'), expires_at__gt=now)
+        .exclude(student_id=student_id)
+        .values('room_id')
+        .annotate(total=Count('hold_id'))
+        .values('total')
+    )
+
+
+def book_with_guarded_update(matric, hall_id, room_id):
+    # Plain read (no lock) - only used for the checks' error messages and the receipt
+    student = Student.objects.get(matric_number=matric)
+    if student.room_id:
+        raise BookingError("Student already has a room")
+    if student.payment_status != "Verified":
+        raise BookingError("Payment not verified")
+
+    now = timezone.now()
+    _check_own_hold(student.student_id, room_id, now)
+
+    with transaction.atomic():
+        # Step 1: Claim the STUDENT - only succeeds if they still have no room.
+        # Two parallel requests from the same student can't both get past this.
+        with lock_wait(hall_id):
+            claimed_student = Student.objects.filter(
+                student_id=student.student_id,
+                room__isnull=True,
+                payment_status="Verified",
+            ).update(room_id=room_id, hall_selected_id=hall_id, updated_at=timezone.now())
+        if not claimed_student:
+            raise BookingError("Student already has a room")
+
+        # Step 2: Claim the BED - only succeeds if the room still has space
+        # (after beds held by other students) and is not under maintenance.
+        # room_status is listed first because MySQL applies SET clauses
+        # left to right, so it must see the OLD count.
+        with lock_wait(hall_id):
+            claimed_bed = Room.objects.filter(
+                room_id=room_id,
+                hall_id=hall_id,
+                current_occupants__lt=F('capacity') - Coalesce(_holds_by_others(student.student_id, now), 0),
+                is_under_maintenance=False,
+            ).update(
+                room_status=Case(
+                    When(current_occupants__gte=F('capacity') - 1, then=Value('Full')),
+                    default=Value('Occupied'),
+                ),
+                current_occupants=F('current_occupants') + 1,
+                updated_at=timezone.now(),
+            )
+        if not claimed_bed:
+            # Raising inside atomic() also undoes the student claim above
+            raise _explain_failed_room_claim(hall_id, room_id)
+
+        # We now hold the room row lock, so this read sees our own update
+        room = Room.objects.select_related('hall').get(room_id=room_id)
+
+        # The student's hold (if any) has now been turned into a real bed
+        BedHold.objects.filter(student_id=student.student_id).delete()
+
+        student.room = room
+        student.room_id = room.room_id
+        student.hall_selected_id = hall_id
+
+        allocation = _create_allocation_records(student, room)
+
+        # One more bed taken in this hall (and one fewer available room if it
+        # was the last). The hall-wide summary row is locked last, just before
+        # the commit, so bookings of different rooms only queue up for that moment.
+        record_room_change(
+            hall_id,
+            (room.capacity, room.current_occupants - 1, False),
+            (room.capacity, room.current_occupants, False),
+            room_id=room.room_id,
+        )
+
+    return BookingResult(student=student, room=room, allocation=allocation)
@@ -0,0 +1,118 @@
+# ==================================================
+# CACHING.PY - Keep each hall's bookable-room list in Django's cache
+# ==================================================
+# During room selection thousands of students look at the same few halls, and
+# every GET /api/available-rooms/ used to query and serialize the hall's rooms
+# again. Now the serialized list is kept in the cache:
+#
+#   key = "available-rooms:<hall_id>:<hall summary version>"
+#
+#   - Every booking, maintenance toggle or auto-allocation bumps the hall's
+#     HallSummary.version (occupancy.py), so once it commits the next request
+#     looks for a new key and rebuilds the list - in every process, since the
+#     version is read from the database (the same read the ETag uses, see
+#     conditional.py). Other halls keep their entries.
+#   - Stampede protection: when an entry is missing, only ONE request rebuilds
+#     it. Others in the same process wait on a lock; others in other processes
+#     wait (briefly) for the "rebuilding" marker to go away, then read the new
+#     entry instead of all hitting the database at once.
+#   - Entries also expire after ROOM_CACHE_SECONDS, as a safety net for rooms
+#     edited outside the app (Django admin, SQL).
+#
+# Bed holds are NOT cached - they change every few seconds and depend on who is
+# asking - so available_rooms still applies them per request.
+#
+# The cache backend is set in settings.py (CACHE_BACKEND). The default,
+# in-memory "locmem", is per process: with several server processes use the
+# file-based backend (or any shared one) so they can share the rebuilt lists.
+
+import threading
+import time
+import zlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+ROOM_CACHE_SECONDS = getattr(settings, 'ROOM_CACHE_SECONDS', 60)
+# How long other processes wait for a rebuild before doing it themselves
+REBUILD_WAIT_SECONDS = 2.0
+REBUILD_POLL_SECONDS = 0.05
+
+_lock = threading.Lock()
+_counters = Counter()
+# A small fixed set of locks; each cache key always uses the same one
+_rebuild_locks = [threading.Lock() for _ in range(64)]
+
+
+def record(name, amount=1):
+    """Count a cache event (hits, misses, rebuilds, coalesced)."""
+    with _lock:
+        _counters[name] += amount
+
+
+# ==================================================
+# READ - Cached value, or rebuild it once
+# ==================================================
+def _wait_for(key, rebuilding_key):
+    """Wait until another process has finished rebuilding `key` (or given up)."""
+    deadline = time.monotonic() + REBUILD_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(REBUILD_POLL_SECONDS)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.get(rebuilding_key) is None:
+            return None  # They failed - rebuild it ourselves
+    return None
+
+
+def cached_hall_rooms(hall_id, version, build):
+    """
+    The hall's room list at hall summary `version` from the cache, or from
+    build() (called by only one request at a time per hall) on a miss.
+    """
+    key = f"available-rooms:{hall_id}:{version}"
+    value = cache.get(key)
+    if value is not None:
+        record('hits')
+        return value
+    record('misses')
+
+    with _rebuild_locks[zlib.crc32(key.encode()) % len(_rebuild_locks)]:
+        # Somebody in this process may have rebuilt it while we waited for the lock
+        value = cache.get(key)
+        if value is not None:
+            record('coalesced')
+            return value
+
+        rebuilding_key = f"{key}:rebuilding"
+        if not cache.add(rebuilding_key, 1, timeout=REBUILD_WAIT_SECONDS * 2):
+            # Another process is already rebuilding it
+            value = _wait_for(key, rebuilding_key)
+            if value is not None:
+                record('coalesced')
+                return value
+
+        try:
+            value = build()
+            cache.set(key, value, timeout=ROOM_CACHE_SECONDS)
+            record('rebuilds')
+        finally:
+            cache.delete(rebuilding_key)
+    return value
+
+
+def get_cache_metrics():
+    with _lock:
+        counters = dict(_counters)
+    hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+    return {
+        'backend': settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1],
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        'rebuilds': counters.get('rebuilds', 0),
+        'coalesced': counters.get('coalesced', 0),  # Misses served by another request's rebuild
+    }
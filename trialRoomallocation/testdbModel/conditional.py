@@ -0,0 +1,141 @@
+# ==================================================
+# CONDITIONAL.PY - "Nothing changed since last time" (HTTP 304) for polled endpoints
+# ==================================================
+# The admin pages poll the dashboard every 10 seconds and the allocation graph
+# every minute, and almost every answer is the same as the one before.
+#
+# Each response now carries an ETag - a short "version stamp" of the data
+# behind it. The browser sends it back in If-None-Match on the next poll, and
+# if the stamp is unchanged Django answers 304 Not Modified straight away:
+# no serializer, no room/student queries, no response body.
+#
+# The stamps are cheap to work out:
+#   - a hall's HallSummary.version goes up on every booking / maintenance toggle
+#     (occupancy.py), so it covers the dashboard and allocation graph
+#   - the dashboard also lists the occupants (name, phone, department...), which
+#     can be edited without a booking, so the number of students in the hall and
+#     their latest updated_at are added
+#   - available_rooms also depends on bed holds, so their count/latest time is added
+#   - the hall list is tiny, so its stamp is a hash of the hall rows themselves
+#     and their summary versions (available_rooms comes from the summary)
+# These functions are used with Django's @condition decorator in views.py.
+
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .identity import request_admin, request_admin_record, request_matric
+from .models import BedHold, Hall, HallSummary, Student
+
+
+def _make_etag(*parts):
+    return hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:24]
+
+
+def admin_for_request(request):
+    """
+    The admin asking (from their login token, or named in ?email=), with their
+    hall and its summary row joined in (one query, cached on the request so the
+    view can reuse it). None if unknown.
+    """
+    if not hasattr(request, '_conditional_admin'):
+        admin = request_admin_record(request, request.GET.get('email'), related=['hall__summary'])
+        if admin is not None and request_admin(request) is not None:
+            # Built from the token: only the hall (and its summary) is read
+            admin.hall = (
+                Hall.objects.select_related('summary').filter(hall_id=admin.hall_id).first()
+                if admin.hall_id else None
+            )
+        request._conditional_admin = admin
+    return request._conditional_admin
+
+
+def _admin_hall_stamp(request):
+    """(hall, summary) of the requesting admin, or None if there is nothing to compare."""
+    admin = admin_for_request(request)
+    if admin is None or admin.hall is None:
+        return None
+    summary = getattr(admin.hall, 'summary', None)
+    if summary is None:
+        return None  # No summary row yet - just answer normally
+    return admin.hall, summary
+
+
+def _occupants_stamp(request, hall_id):
+    """(how many students live in the hall, their latest updated_at) - one query, cached on the request."""
+    if not hasattr(request, '_conditional_occupants'):
+        occupants = Student.objects.filter(room__hall_id=hall_id).aggregate(
+            total=Count('student_id'), latest=Max('updated_at')
+        )
+        request._conditional_occupants = (occupants['total'], occupants['latest'])
+    return request._conditional_occupants
+
+
+def hall_version(request, hall_id):
+    """The hall's summary version (None if it has no summary row yet) - one query, cached on the request."""
+    if not hasattr(request, '_conditional_hall_version'):
+        request._conditional_hall_version = (
+            HallSummary.objects.filter(hall_id=hall_id).values_list('version', flat=True).first()
+        )
+    return request._conditional_hall_version
+
+
+def _latest(*times):
+    times = [value for value in times if value is not None]
+    return max(times) if times else None
+
+
+# ==================================================
+# ADMIN DASHBOARD / ALLOCATION GRAPH
+# ==================================================
+def admin_hall_etag(request, *args, **kwargs):
+    stamp = _admin_hall_stamp(request)
+    if stamp is None:
+        return None
+    hall, summary = stamp
+    admin = admin_for_request(request)
+    occupants, occupants_updated = _occupants_stamp(request, hall.hall_id)
+    # The dashboard also shows who is asking, so the admin's row is part of the stamp
+    return _make_etag(
+        request.path, admin.email, admin.name, admin.updated_at, hall.hall_id, summary.version, hall.updated_at,
+        occupants, occupants_updated,
+    )
+
+
+def admin_hall_last_modified(request, *args, **kwargs):
+    stamp = _admin_hall_stamp(request)
+    if stamp is None:
+        return None
+    hall, summary = stamp
+    return _latest(summary.updated_at, hall.updated_at, _occupants_stamp(request, hall.hall_id)[1])
+
+
+# ==================================================
+# AVAILABLE ROOMS
+# ==================================================
+def available_rooms_etag(request, *args, **kwargs):
+    hall_id = request.GET.get('hall_id')
+    if not hall_id or not hall_id.isdigit():
+        return None  # The view answers 400
+    version = hall_version(request, hall_id)
+    if version is None:
+        return None
+    # Holds come and go (and expire) without touching the summary row
+    holds = BedHold.objects.filter(hall_id=hall_id, expires_at__gt=timezone.now()).aggregate(
+        total=Count('hold_id'), latest=Max('created_at')
+    )
+    return _make_etag(
+        'available-rooms', hall_id, version, holds['total'], holds['latest'],
+        request_matric(request, request.GET.get('matriculation_number', '')),
+    )
+
+
+# ==================================================
+# HALL LIST
+# ==================================================
+def hall_list_etag(request, *args, **kwargs):
+    # Fingerprint of every hall row and its summary version, plus the page / filters / fields asked for
+    columns = [field.attname for field in Hall._meta.concrete_fields]
+    rows = Hall.objects.order_by('hall_id').values_list(*columns, 'summary__version')
+    return _make_etag('halls', request.GET.urlencode(), *rows)
@@ -0,0 +1,168 @@
+# ==================================================
+# CONTENTION.PY - Retry deadlocks and measure who is fighting over which rows
+# ==================================================
+# When many students book the same room, MySQL sometimes gives up on one of
+# the transactions:
+#   1213 "Deadlock found when trying to get lock"
+#   1205 "Lock wait timeout exceeded"
+# Neither means the booking was wrong - the transaction was rolled back and
+# simply needs to run again. run_with_retry() does exactly that, with a short
+# random ("jittered") delay so the retries don't collide again.
+#
+# LOCK ORDER - every transaction that locks more than one kind of row takes them
+# in the same order, which is what keeps deadlocks rare in the first place:
+#       1. student   2. room   3. hall
+# and when several rows of the same kind are locked, lowest primary key first.
+# booking.py, holds.py and allocator.py all follow this order.
+#
+# Every attempt is also counted per room and per hall, and the time spent
+# waiting for row locks is recorded in a histogram, so
+# GET /api/contention/metrics/ shows where contention concentrates.
+
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+
+logger = logging.getLogger(__name__)
+
+# Tunable settings (see settings.py) with safe defaults
+MAX_ATTEMPTS = getattr(settings, 'LOCK_RETRY_MAX_ATTEMPTS', 4)
+RETRY_BASE_SECONDS = getattr(settings, 'LOCK_RETRY_BASE_SECONDS', 0.05)
+
+# MySQL error codes that mean "roll back and try again"
+MYSQL_DEADLOCK = 1213
+MYSQL_LOCK_WAIT_TIMEOUT = 1205
+
+# Lock-wait histogram buckets, in milliseconds (the last bucket catches everything slower)
+LOCK_WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def classify_lock_error(error):
+    """Return 'deadlock', 'lock_timeout' or None for a database error."""
+    if not isinstance(error, OperationalError):
+        return None
+    code = error.args[0] if error.args else None
+    if code == MYSQL_DEADLOCK:
+        return 'deadlock'
+    if code == MYSQL_LOCK_WAIT_TIMEOUT:
+        return 'lock_timeout'
+    # Other databases only give us a message (e.g. SQLite "database is locked")
+    message = str(error).lower()
+    if 'deadlock' in message:
+        return 'deadlock'
+    if 'lock wait timeout' in message or 'database is locked' in message:
+        return 'lock_timeout'
+    return None
+
+
+# ==================================================
+# IN-PROCESS METRICS - Counters and histograms for this web worker
+# ==================================================
+_metrics_lock = threading.Lock()
+_room_counters = defaultdict(Counter)
+_hall_counters = defaultdict(Counter)
+_hall_lock_wait = defaultdict(lambda: [0] * (len(LOCK_WAIT_BUCKETS_MS) + 1))
+_hall_lock_wait_total_ms = defaultdict(float)
+
+
+def record(event, hall_id=None, room_id=None, amount=1):
+    """Count an event ('attempts', 'retries', 'deadlock', 'refused'...) for a room and its hall."""
+    with _metrics_lock:
+        if room_id is not None:
+            _room_counters[room_id][event] += amount
+        if hall_id is not None:
+            _hall_counters[hall_id][event] += amount
+
+
+def record_lock_wait(seconds, hall_id=None):
+    milliseconds = seconds * 1000
+    bucket = next(
+        (i for i, limit in enumerate(LOCK_WAIT_BUCKETS_MS) if milliseconds <= limit),
+        len(LOCK_WAIT_BUCKETS_MS),
+    )
+    with _metrics_lock:
+        _hall_lock_wait[hall_id][bucket] += 1
+        _hall_lock_wait_total_ms[hall_id] += milliseconds
+
+
+@contextmanager
+def lock_wait(hall_id=None):
+    """Time a statement that takes row locks (SELECT ... FOR UPDATE or a guarded UPDATE)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_lock_wait(time.perf_counter() - started, hall_id)
+
+
+# ==================================================
+# RETRY - Run a transaction again after a deadlock / lock timeout
+# ==================================================
+class LockRetriesExhausted(Exception):
+    """The transaction kept deadlocking or timing out; the caller should answer 'busy, try again'."""
+
+
+def run_with_retry(fn, hall_id=None, room_id=None, max_attempts=None):
+    """
+    Call fn() (which must open its OWN transaction.atomic()) and run it again
+    if MySQL rolled it back because of a deadlock or lock wait timeout.
+    Inside an outer transaction nothing can be retried, so fn() just runs once.
+    """
+    max_attempts = max_attempts or MAX_ATTEMPTS
+    if connection.in_atomic_block:
+        return fn()
+
+    for attempt in range(1, max_attempts + 1):
+        record('attempts', hall_id, room_id)
+        try:
+            return fn()
+        except OperationalError as error:
+            kind = classify_lock_error(error)
+            if kind is None:
+                raise
+            record(kind, hall_id, room_id)
+            if attempt == max_attempts:
+                record('gave_up', hall_id, room_id)
+                logger.warning("Giving up after %s attempts (hall %s, room %s): %s", attempt, hall_id, room_id, error)
+                raise LockRetriesExhausted(str(error)) from error
+            record('retries', hall_id, room_id)
+            # Exponential back-off with full jitter
+            time.sleep(random.uniform(0, RETRY_BASE_SECONDS * (2 ** (attempt - 1))))
+
+
+def get_contention_metrics(top=20):
+    """Per-hall counters and lock-wait histograms, plus the `top` most contended rooms."""
+    with _metrics_lock:
+        halls = {}
+        for hall_id in set(_hall_counters) | set(_hall_lock_wait):
+            counts = _hall_lock_wait[hall_id]
+            samples = sum(counts)
+            halls[hall_id if hall_id is not None else 'unknown'] = {
+                'counters': dict(_hall_counters[hall_id]),
+                'lock_wait_ms': {
+                    'buckets': {
+                        **{f"<={limit}": counts[i] for i, limit in enumerate(LOCK_WAIT_BUCKETS_MS)},
+                        f">{LOCK_WAIT_BUCKETS_MS[-1]}": counts[-1],
+                    },
+                    'count': samples,
+                    'avg': round(_hall_lock_wait_total_ms[hall_id] / samples, 2) if samples else 0.0,
+                },
+            }
+        rooms = [
+            {'room_id': room_id, **dict(counters)}
+            for room_id, counters in _room_counters.items()
+        ]
+
+    # "Hot" rooms: most retries and refusals first
+    rooms.sort(
+        key=lambda row: (row.get('retries', 0) + row.get('refused', 0), row.get('attempts', 0)),
+        reverse=True,
+    )
+    return {'halls': halls, 'hot_rooms': rooms[:top]}
@@ -0,0 +1,215 @@
+# ==================================================
+# DASHBOARDS.PY - Ready-made student dashboards (one row per student)
+# ==================================================
+# student_dashboard used to rebuild the whole page on every refresh: the
+# student, their room and its hall, their payment, their roommates... Now the
+# student-specific part is built ONCE and stored as a JSON document in the
+# StudentDashboard table, and the endpoint reads it by primary key.
+#
+# When is a document rebuilt?
+#   - A room changes (booking, roommate moving in, maintenance toggle,
+#     auto-allocation): occupancy.apply_delta() asks for the documents of
+#     everybody in those rooms to be rebuilt once the transaction commits.
+#   - A student or payment is saved in the Django admin panel (e.g. a payment
+#     is verified) - see admin.py.
+#   - A student still waiting for payment verification: the endpoint compares
+#     their payment status / room with the student row on every read, so a
+#     payment verified straight in SQL shows up at once.
+#   - The document is missing, or was built with an older SCHEMA_VERSION.
+#   - python manage.py rebuild_student_dashboards (e.g. after a bulk import).
+#
+# What is NOT copied into the document: the hall rows. Every booking changes a
+# hall's "rooms left", and copying that into thousands of documents on each
+# booking would cost far more than it saves. The student's hall and the halls
+# they can choose from are read live with one query (see dashboard_response).
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import BooleanField, Case, Q, When
+from django.utils import timezone
+
+from .models import Hall, Payment, Student, StudentDashboard
+from .serializers import HallSerializer, RoomSerializer
+from .utils import _parse_level_number
+
+
+# Bump this whenever the document layout below changes: every stored document
+# with another version is rebuilt the next time it is read.
+SCHEMA_VERSION = 1
+
+BUILD_BATCH_SIZE = 500
+
+
+# ==================================================
+# BUILD - Turn students into documents
+# ==================================================
+def build_documents(students):
+    """
+    {matric_number: document} for the given students (loaded with
+    select_related('room__hall')). Three queries however many students there are.
+    """
+    students = list(students)
+    matrics = [student.matric_number for student in students]
+    room_ids = {student.room_id for student in students if student.room_id}
+
+    # Everyone in those rooms (the student is listed among their own roommates)
+    roommates = {}
+    for row in Student.objects.filter(room_id__in=room_ids).order_by('student_id').values(
+        'room_id', 'full_name', 'level'
+    ):
+        roommates.setdefault(row['room_id'], []).append({'full_name': row['full_name'], 'level': row['level']})
+
+    amount_paid = dict(
+        Payment.objects.filter(matric_number__in=matrics, payment_status="Verified")
+        .values_list('matric_number', 'amount_paid')
+    )
+
+    documents = {}
+    for student in students:
+        room_details = None
+        if student.room_id:
+            room_details = dict(RoomSerializer(student.room).data)
+            room_details['roommates'] = roommates.get(student.room_id, [])
+        documents[student.matric_number] = {
+            'profile': {
+                'full_name': student.full_name,
+                'matriculation_number': student.matric_number,
+                'level': student.level,
+                'payment_status': student.payment_status,
+                'department': student.department,
+                'room_details': room_details,
+            },
+            'hall_selected_id': student.hall_selected_id,
+            # What the hall list needs (only used while they have no room)
+            'gender': student.gender,
+            'level_number': _parse_level_number(student.level),
+            'amount_paid': amount_paid.get(student.matric_number, Decimal('0')),
+        }
+    return documents
+
+
+def _store(documents):
+    """Insert or replace the given {matric_number: document} rows (one query)."""
+    now = timezone.now()
+    StudentDashboard.objects.bulk_create(
+        [
+            StudentDashboard(student_id=matric, schema_version=SCHEMA_VERSION, document=document, built_at=now)
+            for matric, document in documents.items()
+        ],
+        update_conflicts=True,
+        update_fields=['schema_version', 'document', 'built_at'],
+        unique_fields=['student'],
+    )
+
+
+def rebuild_dashboards(students):
+    """Build and store the documents of `students` (a Student queryset), in batches. Returns how many."""
+    students = students.select_related('room__hall').order_by('student_id')
+    rebuilt = 0
+    last_id = 0
+    while True:
+        batch = list(students.filter(student_id__gt=last_id)[:BUILD_BATCH_SIZE])
+        if not batch:
+            return rebuilt
+        _store(build_documents(batch))
+        rebuilt += len(batch)
+        last_id = batch[-1].student_id
+
+
+def rebuild_dashboards_on_commit(room_ids=(), matric_numbers=()):
+    """
+    Rebuild the documents of everybody in `room_ids` and of `matric_numbers`
+    once the current transaction commits (nothing happens if it rolls back).
+    """
+    room_ids, matric_numbers = list(room_ids), list(matric_numbers)
+    if not room_ids and not matric_numbers:
+        return
+
+    def rebuild():
+        rebuild_dashboards(Student.objects.filter(Q(room_id__in=room_ids) | Q(matric_number__in=matric_numbers)))
+
+    # robust: a failed rebuild is logged, not turned into a failed booking -
+    # the next read (or the rebuild command) fixes the document
+    transaction.on_commit(rebuild, robust=True)
+
+
+# ==================================================
+# READ - What GET /api/student/dashboard/ sends
+# ==================================================
+def load_document(matric_number):
+    """The student's stored document, rebuilt first if missing or out of date. None = no such student."""
+    row = StudentDashboard.objects.filter(pk=matric_number).first()
+    if row is not None and row.schema_version == SCHEMA_VERSION:
+        document = row.document
+        profile = document['profile']
+        if profile['room_details'] is not None or profile['payment_status'] == "Verified":
+            return document
+        # Still waiting for their payment to be verified - which may happen
+        # outside Django - so check the student row for a change
+        current = Student.objects.filter(matric_number=matric_number).values_list(
+            'payment_status', 'room_id'
+        ).first()
+        if current == (profile['payment_status'], None):
+            return document
+
+    student = Student.objects.select_related('room__hall').filter(matric_number=matric_number).first()
+    if student is None:
+        return None
+    document = build_documents([student])[matric_number]
+    _store({matric_number: document})
+    return document
+
+
+def eligible_halls(gender, level_number, amount_paid):
+    """
+    The halls a student can pick, cheapest first, each annotated with
+    within_budget. ONE query:
+      - their gender, with empty rooms (read from the hall summary row;
+        halls without one yet use the old counter)
+      - their level inside the hall's level range (no range = every level)
+    level_min / level_max / cost are the numeric copies of the hall's
+    free-text level and cost (see Hall.save / backfill_hall_eligibility)
+    """
+    halls = Hall.objects.select_related('summary').filter(gender=gender).filter(
+        Q(summary__rooms_available__gt=0)
+        | Q(summary__isnull=True, available_rooms__gt=0)
+    )
+    if level_number is not None:
+        halls = halls.filter(
+            Q(level_min__isnull=True)
+            | Q(level_min__lte=level_number, level_max__gte=level_number)
+        )
+    return halls.annotate(
+        within_budget=Case(When(cost__lte=amount_paid, then=True), default=False, output_field=BooleanField())
+    ).order_by('cost', 'hall_id')
+
+
+def dashboard_response(document):
+    """The dashboard JSON: the stored document plus the live hall rows it points to."""
+    profile = dict(document['profile'])
+    response_data = {
+        "profile": profile,
+        "recommended_halls": [],     # Halls within/at student's budget (shown first)
+        "available_halls": []        # Halls above student's budget (shown below)
+    }
+
+    # The hall they booked into
+    hall = None
+    if document['hall_selected_id'] is not None:
+        hall = Hall.objects.select_related('summary').filter(hall_id=document['hall_selected_id']).first()
+    profile['hall_details'] = HallSerializer(hall).data if hall is not None else None
+
+    # If they DON'T have a room AND their payment is VERIFIED
+    # Show them the available halls they can choose from
+    if profile['room_details'] is None and profile['payment_status'] == "Verified":
+        recommended = []   # Within or at budget
+        other_halls = []   # Above budget
+        halls = eligible_halls(document['gender'], document['level_number'], Decimal(document['amount_paid']))
+        for h in halls:
+            (recommended if h.within_budget else other_halls).append(h)
+
+        response_data["recommended_halls"] = HallSerializer(recommended, many=True).data
+        response_data["available_halls"] = HallSerializer(other_halls, many=True).data
+
+    return response_data
@@ -0,0 +1,189 @@
+# ==================================================
+# EXPORT.PY - Stream receipts / allocations out as CSV or NDJSON files
+# ==================================================
+# Hall admins export the receipt list to spreadsheets. Building the whole list
+# in memory first (like admin_student_receipts does for the page) means a big
+# hall - or the whole campus - waits seconds for the first byte and holds every
+# row in memory at once. Here the file is written WHILE it is being read:
+#
+#   1. The header line is sent straight away, before any database query.
+#   2. Rows are read in batches of EXPORT_CHUNK_SIZE, by primary key
+#      ("allocation_id > last one sent"), with the student/room/hall/receipt
+#      joined in (select_related), so each batch is ONE query.
+#   3. Each batch is turned into text and sent, then forgotten - memory stays
+#      the same size whether the file has 100 rows or 100,000.
+#
+# Batching by primary key is used instead of .iterator(): the MySQL driver reads
+# a whole result set into memory even when Django iterates over it.
+#
+# Formats: csv (spreadsheets) or ndjson (one JSON object per line, for scripts).
+# Add gzip=1 to get a compressed .gz file (compressed batch by batch as well).
+
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Allocation
+
+
+CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 1000)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+# ==================================================
+# ROWS - What one line of each export contains
+# ==================================================
+def receipt_row(alloc):
+    """One allocated student with their receipt (same keys as GET /api/admin/receipts/)."""
+    student = alloc.student
+    return {
+        'receipt_no': f"BU-HAMS-{alloc.allocation_id}",
+        'full_name': student.full_name,
+        'matric_no': student.matric_number,
+        'department': student.department,
+        'level': student.level,
+        'gender': student.gender,
+        'email': student.email,
+        'phone_number': student.phone_number,
+        'house_address': student.house_address,
+        'hall_name': alloc.room.hall.hall_name,
+        'room_number': alloc.room.room_number,
+        'allocation_date': alloc.allocation_date,
+        'status': alloc.status,
+        'transaction_reference': alloc.receipt.payment_reference if alloc.receipt else 'N/A',
+        'amount_paid': str(alloc.receipt.amount_paid) if alloc.receipt else '0',
+    }
+
+
+def allocation_row(alloc):
+    """One allocation (any status)."""
+    student = alloc.student
+    return {
+        'allocation_id': alloc.allocation_id,
+        'matric_no': student.matric_number,
+        'full_name': student.full_name,
+        'gender': student.gender,
+        'level': student.level,
+        'department': student.department,
+        'hall_name': alloc.room.hall.hall_name,
+        'room_number': alloc.room.room_number,
+        'allocation_date': alloc.allocation_date,
+        'status': alloc.status,
+        'receipt_id': alloc.receipt_id,
+    }
+
+
+RECEIPT_COLUMNS = [
+    'receipt_no', 'full_name', 'matric_no', 'department', 'level', 'gender', 'email', 'phone_number',
+    'house_address', 'hall_name', 'room_number', 'allocation_date', 'status', 'transaction_reference',
+    'amount_paid',
+]
+ALLOCATION_COLUMNS = [
+    'allocation_id', 'matric_no', 'full_name', 'gender', 'level', 'department', 'hall_name',
+    'room_number', 'allocation_date', 'status', 'receipt_id',
+]
+
+
+def receipts_queryset(hall=None):
+    """Active allocations with everything a receipt row needs joined in."""
+    allocations = Allocation.objects.filter(status='active').select_related(
+        'student', 'room__hall', 'receipt'
+    )
+    return allocations.filter(room__hall=hall) if hall is not None else allocations
+
+
+def allocations_queryset(hall=None, status=None):
+    allocations = Allocation.objects.select_related('student', 'room__hall')
+    if status:
+        allocations = allocations.filter(status=status)
+    return allocations.filter(room__hall=hall) if hall is not None else allocations
+
+
+# ==================================================
+# STREAMING - Batches in, text (or gzip) out
+# ==================================================
+def _batches(queryset, chunk_size):
+    """Yield lists of up to chunk_size rows, walking the primary key (one query per batch)."""
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(allocation_id__gt=last_id).order_by('allocation_id')[:chunk_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].allocation_id
+
+
+def _csv_text(rows, columns, header=False):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def _ndjson_text(rows):
+    return ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+
+
+def export_chunks(queryset, make_row, columns, file_format, compress=False, chunk_size=None):
+    """Generator of bytes: the header first, then one piece per batch of rows."""
+    chunk_size = chunk_size or CHUNK_SIZE
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+
+    def encode(text, final=False):
+        data = text.encode('utf-8')
+        if compressor is None:
+            return data
+        # SYNC_FLUSH sends this batch now instead of waiting for more data
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    # First byte right away: the CSV header (or, for NDJSON, the gzip header)
+    yield encode(_csv_text([], columns, header=True) if file_format == 'csv' else '')
+
+    for batch in _batches(queryset, chunk_size):
+        rows = [make_row(alloc) for alloc in batch]
+        text = _csv_text(rows, columns) if file_format == 'csv' else _ndjson_text(rows)
+        yield encode(text)
+
+    if compressor is not None:
+        yield encode('', final=True)
+
+
+async def _async_chunks(chunks):
+    # Under ASGI, Django would read a plain generator to the END before sending
+    # anything - so hand it over one piece at a time instead
+    done = object()
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await next_chunk(chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+def streaming_export(request, chunks, name, file_format, compress=False):
+    """Wrap export_chunks() in a download response."""
+    content_type, extension = FORMATS[file_format]
+    filename = f"{name}-{timezone.now():%Y%m%d-%H%M}.{extension}"
+    if compress:
+        content_type, filename = 'application/gzip', filename + '.gz'
+
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    response['X-Accel-Buffering'] = 'no'  # Tell nginx to pass bytes on as they come
+    return response
@@ -0,0 +1,120 @@
+# ==================================================
+# HOLDS.PY - Short "this bed is mine for a few minutes" reservations
+# ==================================================
+# Without holds, hundreds of students look at the same free bed, all press
+# "Book", and all but one get "This room is already full" and try again.
+# With holds, the conflict is found ONCE, when the student opens the room:
+#   1. place_hold() locks the student and room rows for an instant, counts the beds
+#      that are already taken or held, and gives the student one bed for BED_HOLD_TTL_SECONDS
+#   2. book_room then simply converts the hold the student already owns
+#   3. Expired holds stop counting straight away and are deleted in bulk
+#      by sweep_expired_holds() (manage.py sweep_bed_holds)
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework import status
+
+from .booking import BUSY_MESSAGE, HOLD_CONFLICT_MESSAGE, BookingError
+from .contention import LockRetriesExhausted, lock_wait, record, run_with_retry
+from .models import BedHold, Room, Student
+
+
+# How long a hold lasts (see settings.py)
+HOLD_TTL_SECONDS = getattr(settings, 'BED_HOLD_TTL_SECONDS', 120)
+
+
+def place_hold(matric, hall_id, room_id):
+    """
+    Hold one bed in room_id for this student.
+    Replaces any hold the student already had. Raises BookingError if the
+    student can't book or every remaining bed is taken or held by someone else.
+    """
+    student = Student.objects.get(matric_number=matric)
+    if student.room_id:
+        raise BookingError("Student already has a room")
+    if student.payment_status != "Verified":
+        raise BookingError("Payment not verified")
+
+    try:
+        return run_with_retry(
+            lambda: _place_hold(student, hall_id, room_id), hall_id=hall_id, room_id=room_id
+        )
+    except BookingError:
+        record('refused', hall_id, room_id)
+        raise
+    except LockRetriesExhausted:
+        raise BookingError(BUSY_MESSAGE, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def _place_hold(student, hall_id, room_id):
+    with transaction.atomic():
+        # Lock the student row first (lock order: student -> room, see contention.py),
+        # so two hold requests from the same student run one after the other -
+        # otherwise both pass the DELETE below and the second INSERT breaks the
+        # one-hold-per-student rule
+        with lock_wait(hall_id):
+            locked = Student.objects.select_for_update().filter(student_id=student.student_id).values(
+                'room_id', 'payment_status'
+            ).first()
+        if locked['room_id']:
+            raise BookingError("Student already has a room")
+        if locked['payment_status'] != "Verified":
+            raise BookingError("Payment not verified")
+
+        # Lock the room row so two students can't both grab the last free bed
+        try:
+            with lock_wait(hall_id):
+                room = Room.objects.select_for_update().get(room_id=room_id, hall_id=hall_id)
+        except Room.DoesNotExist:
+            raise BookingError("Room not found in this hall", status.HTTP_404_NOT_FOUND)
+
+        if room.is_under_maintenance:
+            raise BookingError("This room is under maintenance")
+
+        now = timezone.now()
+        held_by_others = (
+            BedHold.objects.filter(room_id=room_id, expires_at__gt=now)
+            .exclude(student_id=student.student_id)
+            .count()
+        )
+        if room.current_occupants >= room.capacity:
+            raise BookingError("This room is already full")
+        if room.current_occupants + held_by_others >= room.capacity:
+            raise BookingError(HOLD_CONFLICT_MESSAGE, status.HTTP_409_CONFLICT)
+
+        # One hold per student: drop the old one (if any) and create the new one
+        BedHold.objects.filter(student_id=student.student_id).delete()
+        return BedHold.objects.create(
+            student=student,
+            room=room,
+            hall_id=room.hall_id,
+            expires_at=now + timedelta(seconds=HOLD_TTL_SECONDS),
+            created_at=now,
+        )
+
+
+def release_hold(matric):
+    """Give the held bed back (e.g. the student closed the room card). Returns True if one was released."""
+    deleted, _ = BedHold.objects.filter(student__matric_number=matric).delete()
+    return bool(deleted)
+
+
+def active_hold_counts(hall_id, exclude_student_id=None):
+    """
+    {room_id: number of active holds} for one hall.
+    Uses the (hall, expires_at) index, so only this hall's live holds are read.
+    """
+    holds = BedHold.objects.filter(hall_id=hall_id, expires_at__gt=timezone.now())
+    if exclude_student_id:
+        holds = holds.exclude(student_id=exclude_student_id)
+    return dict(holds.values('room_id').annotate(total=Count('hold_id')).values_list('room_id', 'total'))
+
+
+def sweep_expired_holds():
+    """Delete every expired hold with one DELETE. Returns how many were removed."""
+    deleted, _ = BedHold.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,151 @@
+# ==================================================
+# IDEMPOTENCY.PY - Make retried requests safe
+# ==================================================
+# A phone on a slow network sends bookRoom, times out, and sends it again.
+# The server may have finished the first one already - running it again would
+# repeat the whole locking transaction (and, before the outbox, send another email).
+#
+# If the request carries an Idempotency-Key header:
+#   1. The first request inserts (scope, owner, key) into idempotency_key - the
+#      owner is the student / admin from the login token, so two people who
+#      happen to pick the same key never see each other's answers. The unique
+#      index means only ONE request with that key can ever get past this point.
+#   2. It runs the view and saves the response on the row.
+#   3. Any retry with the same key gets the saved response back straight away
+#      (header Idempotent-Replayed: true) - it never reaches the booking code.
+# Requests without the header behave exactly as before.
+
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .identity import request_admin, request_student
+from .models import IdempotencyKey
+
+
+# How long a key is remembered (see settings.py)
+KEY_TTL_SECONDS = getattr(settings, 'IDEMPOTENCY_KEY_TTL_SECONDS', 24 * 60 * 60)
+# A key stuck "in progress" this long (the worker died mid-request) may be taken over
+LOCK_SECONDS = getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60)
+
+# "Try again shortly" answers are not saved - a retry should really try again
+TRANSIENT_STATUSES = {status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS}
+
+
+def _request_hash(request, args, kwargs):
+    """Fingerprint of what was asked for: method, path, query string, URL args and body."""
+    fingerprint = json.dumps(
+        [request.method, request.path, sorted(request.query_params.lists()), args, kwargs, request.data],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+
+def _request_owner(request):
+    """Whose key this is: "student:<matric>" / "admin:<id>" from the login token, '' without one."""
+    student = request_student(request)
+    if student is not None:
+        return f"student:{student.matric_number}"
+    admin = request_admin(request)
+    if admin is not None:
+        return f"admin:{admin.user_id}"
+    return ''
+
+
+def _claim_key(scope, owner, key, request_hash, now):
+    """
+    Insert the key as in progress. Returns (entry, created).
+    If the key already exists, returns the existing row instead.
+    """
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                scope=scope,
+                owner=owner,
+                key=key,
+                request_hash=request_hash,
+                status=IdempotencyKey.STATUS_IN_PROGRESS,
+                created_at=now,
+                expires_at=now + timedelta(seconds=KEY_TTL_SECONDS),
+            ), True
+    except IntegrityError:
+        return IdempotencyKey.objects.filter(scope=scope, owner=owner, key=key).first(), False
+
+
+def idempotent(scope):
+    """
+    Decorator for mutating views (put it directly above `def`, below @api_view).
+    scope separates keys per endpoint, so the same key on two endpoints doesn't clash.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({"error": "Idempotency-Key must be at most 255 characters"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            now = timezone.now()
+            owner = _request_owner(request)
+            request_hash = _request_hash(request, args, kwargs)
+            entry, created = _claim_key(scope, owner, key, request_hash, now)
+
+            if not created and entry is not None:
+                stale_lock = (
+                    entry.status == IdempotencyKey.STATUS_IN_PROGRESS
+                    and entry.created_at <= now - timedelta(seconds=LOCK_SECONDS)
+                )
+                if entry.expires_at <= now or stale_lock:
+                    # Forgotten (or abandoned) key - start over with a fresh claim
+                    IdempotencyKey.objects.filter(key_id=entry.key_id).delete()
+                    entry, created = _claim_key(scope, owner, key, request_hash, now)
+
+            if not created:
+                if entry is None:
+                    # The other request finished and gave the key back between our two queries
+                    return Response({"error": "Please retry this request"},
+                                    status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+                if entry.request_hash != request_hash:
+                    return Response({"error": "This Idempotency-Key was already used for a different request"},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                if entry.status == IdempotencyKey.STATUS_IN_PROGRESS:
+                    return Response({"error": "A request with this Idempotency-Key is still being processed"},
+                                    status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+                # Replay the saved response - no locks, no booking, no email
+                return Response(entry.response_body, status=entry.response_status,
+                                headers={'Idempotent-Replayed': 'true'})
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                # Give the key back so the client can retry
+                IdempotencyKey.objects.filter(key_id=entry.key_id).delete()
+                raise
+
+            if response.status_code >= 500 or response.status_code in TRANSIENT_STATUSES:
+                IdempotencyKey.objects.filter(key_id=entry.key_id).delete()
+            else:
+                IdempotencyKey.objects.filter(key_id=entry.key_id).update(
+                    status=IdempotencyKey.STATUS_COMPLETED,
+                    response_status=response.status_code,
+                    response_body=response.data,
+                )
+            return response
+        return wrapper
+    return decorator
+
+
+def sweep_expired_keys():
+    """Delete every expired key with one DELETE. Returns how many were removed."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,236 @@
+# ==================================================
+# IDENTITY.PY - Who is asking? Read it from the login token, not the database
+# ==================================================
+# Before: every dashboard / available-rooms / receipt request named the student
+# with ?matriculation_number= and looked them up again; every admin request
+# looked the admin up again by ?email=.
+#
+# Now the access token handed out at login carries what those endpoints need,
+# signed with SECRET_KEY so it can't be edited:
+#   student: role, user_id (student_id), matric_number, status_version
+#   admin:   role, user_id (admin_id), email, name, admin_role, hall_id,
+#            status_version
+# The frontend sends it as "Authorization: Bearer <access>" and TokenAuthentication
+# below turns it into request.user without loading the student / admin (only
+# their status version, usually from the cache). Views call request_student()
+# / request_admin() and trust those claims. Things that change while a student
+# is logged in (payment status, gender, level...) are NOT claims - the views
+# that need them read the student row.
+#
+# Keeping claims honest - the STATUS VERSION:
+#   - Every student / admin row has a status_version column. Whenever something
+#     in the claims changes (a student or admin is edited in the Django admin
+#     panel), bump_status_version_on_commit() moves it on in the same
+#     transaction as the change.
+#   - Checking a token reads that column through a short-lived cached copy
+#     (IDENTITY_STATUS_CACHE_SECONDS), so most requests still make no query.
+#     The process that made the change drops its copy at once; other server
+#     processes notice within IDENTITY_STATUS_CACHE_SECONDS.
+#   - A token with a different version - or for a person who no longer exists -
+#     is refused with 401 code "token_stale"; the frontend then calls
+#     POST /api/token/refresh/ with its refresh token, which re-reads the row
+#     ONCE and hands back tokens with up-to-date claims.
+#   - Changes made straight in SQL aren't seen until the access token expires
+#     (ACCESS_TOKEN_LIFETIME). Booking itself always re-checks the student row
+#     inside its transaction (booking.py), so stale claims can't book a bed.
+#
+# Requests without a token still work the old way (?matriculation_number= /
+# ?email=) unless IDENTITY_REQUIRE_TOKEN is turned on.
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Admin, Student
+
+
+REQUIRE_TOKEN = getattr(settings, 'IDENTITY_REQUIRE_TOKEN', False)
+STATUS_CACHE_SECONDS = getattr(settings, 'IDENTITY_STATUS_CACHE_SECONDS', 30)
+
+STUDENT = 'student'
+ADMIN = 'admin'
+
+
+# ==================================================
+# STATUS VERSION - Moves on whenever a person's claims change
+# ==================================================
+def _version_key(role, key):
+    return f"identity:status-version:{role}:{key}"
+
+
+def _people(role, keys):
+    """Student rows by matric number, or Admin rows by admin_id."""
+    if role == STUDENT:
+        return Student.objects.filter(matric_number__in=keys)
+    return Admin.objects.filter(admin_id__in=keys)
+
+
+def current_status_version(role, key):
+    """The person's status_version (a cached copy of the column), or None if they don't exist."""
+    cache_key = _version_key(role, key)
+    version = cache.get(cache_key)
+    if version is None:
+        version = _people(role, [key]).values_list('status_version', flat=True).first()
+        if version is not None:
+            cache.set(cache_key, version, STATUS_CACHE_SECONDS)
+    return version
+
+
+def bump_status_version_on_commit(role, keys):
+    """
+    Make every token issued so far for these people stale. The column moves on
+    in the current transaction; this process's cached copies are dropped once
+    it commits (nothing happens if it rolls back).
+    """
+    keys = list(keys)
+    _people(role, keys).update(status_version=F('status_version') + 1)
+    transaction.on_commit(lambda: cache.delete_many([_version_key(role, key) for key in keys]))
+
+
+# ==================================================
+# ISSUING TOKENS - At login and on refresh
+# ==================================================
+def student_tokens(student):
+    """{'refresh': ..., 'access': ...} carrying the student's claims."""
+    refresh = RefreshToken()
+    refresh['role'] = STUDENT
+    refresh['user_id'] = student.student_id
+    refresh['matric_number'] = student.matric_number
+    refresh['status_version'] = student.status_version
+    # The access token copies every claim above
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+def admin_tokens(admin):
+    """{'refresh': ..., 'access': ...} carrying the admin's claims."""
+    refresh = RefreshToken()
+    refresh['role'] = ADMIN
+    refresh['user_id'] = admin.admin_id
+    refresh['email'] = admin.email
+    refresh['name'] = admin.name
+    refresh['admin_role'] = admin.role
+    refresh['hall_id'] = admin.hall_id
+    refresh['status_version'] = admin.status_version
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+def refresh_tokens(raw_refresh):
+    """
+    New tokens (with claims read fresh from the database - one query) for a
+    valid refresh token. Raises TokenError if the token is bad or expired, or
+    the person no longer exists.
+    """
+    refresh = RefreshToken(raw_refresh)
+    role = refresh.get('role')
+    if role == STUDENT:
+        student = Student.objects.filter(student_id=refresh['user_id']).first()
+        if student is not None:
+            return student_tokens(student)
+    elif role == ADMIN:
+        admin = Admin.objects.filter(admin_id=refresh['user_id']).first()
+        if admin is not None:
+            return admin_tokens(admin)
+    raise TokenError("Token is for an unknown user")
+
+
+# ==================================================
+# AUTHENTICATION - Token -> request.user, no row lookup
+# ==================================================
+class TokenIdentity:
+    """request.user for a request with a valid access token: its claims as attributes."""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        self.role = token['role']
+        self.user_id = token['user_id']
+        self.status_version = token.get('status_version')
+        # Student claims
+        self.matric_number = token.get('matric_number')
+        # Admin claims
+        self.email = token.get('email')
+        self.name = token.get('name')
+        self.admin_role = token.get('admin_role')
+        self.hall_id = token.get('hall_id')
+
+    @property
+    def version_key(self):
+        return self.matric_number if self.role == STUDENT else self.user_id
+
+    def __str__(self):
+        return f"{self.role} {self.matric_number or self.email}"
+
+
+class TokenAuthentication(JWTStatelessUserAuthentication):
+    """
+    Signed-claims JWT authentication (REST_FRAMEWORK's default, see settings.py).
+    Refuses tokens without our claims, and tokens whose status version is not
+    the person's current one (401, code "token_stale" - refresh it).
+    """
+
+    def get_user(self, validated_token):
+        if validated_token.get('role') not in (STUDENT, ADMIN) or 'user_id' not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        identity = TokenIdentity(validated_token)
+        current = current_status_version(identity.role, identity.version_key)
+        # None = the person is gone: never take that as "nothing changed"
+        if current is None or current != identity.status_version:
+            # Same body shape as simplejwt's own errors: {"detail": ..., "code": ...}
+            raise AuthenticationFailed(
+                {'detail': "Your details have changed - refresh your token.", 'code': 'token_stale'}
+            )
+        return identity
+
+
+def request_student(request):
+    """The student's claims if the request carries a student token, else None."""
+    user = getattr(request, 'user', None)
+    return user if isinstance(user, TokenIdentity) and user.role == STUDENT else None
+
+
+def request_admin(request):
+    """The admin's claims if the request carries an admin token, else None."""
+    user = getattr(request, 'user', None)
+    return user if isinstance(user, TokenIdentity) and user.role == ADMIN else None
+
+
+def request_admin_record(request, email=None, related=()):
+    """
+    The admin asking, as an Admin object: built from their token's claims (no
+    query - only admin_id, name, email, role and hall_id are filled in), or
+    looked up by `email` for requests without a token. None if unknown.
+    """
+    claims = request_admin(request)
+    if claims is not None:
+        return Admin(
+            admin_id=claims.user_id, name=claims.name, email=claims.email,
+            role=claims.admin_role, hall_id=claims.hall_id,
+        )
+    if REQUIRE_TOKEN or not email:
+        return None
+    return Admin.objects.select_related(*related).filter(email=email).first()
+
+
+def request_matric(request, fallback=None):
+    """
+    Matric number of the student asking: from their token, or (without a token,
+    unless IDENTITY_REQUIRE_TOKEN) the `fallback` value they sent.
+    """
+    student = request_student(request)
+    if student is not None:
+        return student.matric_number
+    return None if REQUIRE_TOKEN else fallback
+
+
+def request_admin_email(request, fallback=None):
+    """Like request_matric, for the admin's email."""
+    admin = request_admin(request)
+    if admin is not None:
+        return admin.email
+    return None if REQUIRE_TOKEN else fallback
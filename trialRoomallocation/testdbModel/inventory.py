@@ -0,0 +1,249 @@
+# ==================================================
+# INVENTORY.PY - A compact in-memory copy of every hall's beds
+# ==================================================
+# "Which rooms in this hall still have a free bed?" used to be a query over the
+# room table (current_occupants < capacity AND not under maintenance) every time
+# a room list was built. Each server process now keeps a small copy of every
+# hall it has been asked about:
+#
+#   room_ids / capacity / occupants   -> compact arrays, one slot per room
+#                                        (rooms in room-number order)
+#   maintenance / free                -> bitsets (one bit per room): bit i is set
+#                                        when room i is being repaired / when it
+#                                        has a free bed and can be booked
+#   blocks                            -> one "free" bitset per block of rooms
+#
+# so the questions below are answered with a few bit operations, no query:
+#   rooms_with_free_beds()   first_free_room(...)   free_beds_per_block()
+#
+# Keeping it fresh:
+#   - A hall is loaded from the database the first time it is used (one query).
+#   - After a booking / maintenance toggle / auto-allocation in THIS process
+#     commits, the rooms it changed are re-read (one query) and patched in
+#     (occupancy.apply_delta -> refresh_rooms_on_commit).
+#   - Every copy remembers the hall summary version it matches. hall_inventory()
+#     compares it with the database (one primary-key read) and reloads the hall
+#     if another process changed it meanwhile.
+# The copy is only used to FIND rooms - booking itself still claims the bed with
+# a guarded UPDATE / row lock, so a stale copy can never double-book a bed.
+
+import threading
+from array import array
+from collections import Counter
+
+from django.db import transaction
+
+from .models import HallSummary, Room
+
+
+_lock = threading.Lock()
+_halls = {}  # hall_id -> HallInventory
+_counters = Counter()
+
+
+def record(name, amount=1):
+    """Count an inventory event (loads, patches, reads, stale_reloads)."""
+    with _lock:
+        _counters[name] += amount
+
+
+def room_block(room_number):
+    """The block a room belongs to: its number without the last two digits ("B1" for B100-B199)."""
+    room_number = str(room_number)
+    return room_number[:-2] if len(room_number) > 2 else room_number[:1]
+
+
+def _bits(mask):
+    """Positions of the set bits of mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# ==================================================
+# ONE HALL
+# ==================================================
+class HallInventory:
+    """Beds of one hall, as arrays and bitsets (see the top of this file)."""
+
+    def __init__(self, hall_id, version, rows):
+        # rows: (room_id, room_number, capacity, current_occupants, is_under_maintenance, room_status)
+        # in room-number order
+        self.hall_id = hall_id
+        self.version = version
+        self.stale = False  # Set when a change we haven't seen may have happened
+        self.room_ids = array('q')
+        self.capacity = array('H')
+        self.occupants = array('H')
+        self.room_numbers = []
+        self.statuses = []
+        self.position = {}
+        self.maintenance = 0
+        self.free = 0
+        self.block_masks = {}
+
+        for index, (room_id, room_number, capacity, occupants, under_maintenance, room_status) in enumerate(rows):
+            self.room_ids.append(room_id)
+            self.capacity.append(capacity)
+            self.occupants.append(occupants)
+            self.room_numbers.append(room_number)
+            self.statuses.append(room_status)
+            self.position[room_id] = index
+            block = room_block(room_number)
+            self.block_masks[block] = self.block_masks.get(block, 0) | (1 << index)
+            self._set_flags(index, under_maintenance)
+
+    def _set_flags(self, index, under_maintenance):
+        bit = 1 << index
+        if under_maintenance:
+            self.maintenance |= bit
+        else:
+            self.maintenance &= ~bit
+        if not under_maintenance and self.occupants[index] < self.capacity[index]:
+            self.free |= bit
+        else:
+            self.free &= ~bit
+
+    def update_room(self, room_id, capacity, occupants, under_maintenance, room_status):
+        """Patch one room in place. Returns False for a room we don't know (reload the hall)."""
+        index = self.position.get(room_id)
+        if index is None:
+            return False
+        self.capacity[index] = capacity
+        self.occupants[index] = occupants
+        self.statuses[index] = room_status
+        self._set_flags(index, under_maintenance)
+        return True
+
+    # ---------- Questions ----------
+    def free_beds(self, index):
+        return self.capacity[index] - self.occupants[index]
+
+    def rooms_with_free_beds(self):
+        """Bookable rooms (not full, not under maintenance), in room-number order, as dicts."""
+        return [
+            {
+                'room_id': self.room_ids[index],
+                'room_number': self.room_numbers[index],
+                'capacity': self.capacity[index],
+                'current_occupants': self.occupants[index],
+                'room_status': self.statuses[index],
+            }
+            for index in _bits(self.free)
+        ]
+
+    def first_free_room(self, beds=1, block=None, held=None):
+        """
+        room_id of the first bookable room (room-number order) with at least
+        `beds` free beds, optionally only in `block`. held: {room_id: beds held}.
+        None if there is no such room.
+        """
+        mask = self.free & self.block_masks.get(block, 0) if block is not None else self.free
+        for index in _bits(mask):
+            room_id = self.room_ids[index]
+            if self.free_beds(index) - (held or {}).get(room_id, 0) >= beds:
+                return room_id
+        return None
+
+    def free_beds_per_block(self):
+        """{block: free bookable beds}"""
+        return {
+            block: sum(self.free_beds(index) for index in _bits(self.free & mask))
+            for block, mask in sorted(self.block_masks.items())
+        }
+
+
+# ==================================================
+# ALL HALLS - Load, check, patch
+# ==================================================
+def _summary_version(hall_id):
+    return HallSummary.objects.filter(hall_id=hall_id).values_list('version', flat=True).first()
+
+
+def load_hall(hall_id):
+    """(Re)build a hall's inventory from the database."""
+    # Read the version FIRST: if a change lands in between, the copy is marked
+    # with the older version and simply reloaded next time
+    version = _summary_version(hall_id)
+    rows = list(
+        Room.objects.filter(hall_id=hall_id).order_by('room_number').values_list(
+            'room_id', 'room_number', 'capacity', 'current_occupants', 'is_under_maintenance', 'room_status'
+        )
+    )
+    inventory = HallInventory(hall_id, version, rows)
+    with _lock:
+        _halls[hall_id] = inventory
+        _counters['loads'] += 1
+    return inventory
+
+
+def hall_inventory(hall_id, check=True):
+    """
+    The hall's inventory. check=True compares it with the hall summary version
+    in the database (one small query) and reloads it if it is out of date.
+    """
+    with _lock:
+        inventory = _halls.get(hall_id)
+        _counters['reads'] += 1
+    if inventory is None:
+        return load_hall(hall_id)
+    if inventory.stale or (check and _summary_version(hall_id) != inventory.version):
+        record('stale_reloads')
+        return load_hall(hall_id)
+    return inventory
+
+
+def refresh_rooms(hall_id, room_ids, version=None):
+    """Re-read the given rooms and patch them into the hall's inventory (if it is loaded)."""
+    with _lock:
+        inventory = _halls.get(hall_id)
+    if inventory is None or not room_ids:
+        return
+    rows = Room.objects.filter(room_id__in=room_ids).values_list(
+        'room_id', 'capacity', 'current_occupants', 'is_under_maintenance', 'room_status'
+    )
+    with _lock:
+        known = all([inventory.update_room(*row) for row in rows])
+        # Only "one version on from ours" means we have seen every change in between;
+        # a bigger jump (or a room we never loaded) means: reload on next use
+        caught_up = known and inventory.version is not None and version == inventory.version + 1
+        if caught_up:
+            inventory.version = version
+        elif not known or version is None or inventory.version is None or version > inventory.version:
+            inventory.stale = True
+        _counters['patches'] += 1
+
+
+def refresh_rooms_on_commit(hall_id, room_ids, version=None):
+    """Patch the inventory once the current transaction commits (nothing happens if it rolls back)."""
+    room_ids = list(room_ids)
+    transaction.on_commit(lambda: refresh_rooms(hall_id, room_ids, version), robust=True)
+
+
+def clear_inventory():
+    """Forget every loaded hall (each is loaded again on next use)."""
+    with _lock:
+        _halls.clear()
+
+
+def get_inventory_metrics():
+    with _lock:
+        halls = {
+            hall_id: {
+                'rooms': len(inventory.room_ids),
+                'rooms_with_free_beds': inventory.free.bit_count(),
+                'rooms_under_maintenance': inventory.maintenance.bit_count(),
+                'version': inventory.version,
+                'stale': inventory.stale,
+            }
+            for hall_id, inventory in _halls.items()
+        }
+        counters = dict(_counters)
+    return {
+        'halls': halls,
+        'loads': counters.get('loads', 0),
+        'stale_reloads': counters.get('stale_reloads', 0),
+        'patches': counters.get('patches', 0),
+        'reads': counters.get('reads', 0),
+    }
@@ -0,0 +1,72 @@
+# ==================================================
+# LISTING.PY - Paged, filtered, trimmed lists for the bulk endpoints
+# ==================================================
+# /api/student/, /api/admin/, /api/payment/ and /api/hall/ used to send EVERY
+# row with EVERY column in one response - tens of MB once 30,000 students are
+# registered. Now each answer is one page:
+#
+#   GET /api/student/?gender=Female&level=200&limit=200&fields=matric_number,full_name
+#   {"next": "http://.../api/student/?cursor=cD0xMjM0...", "previous": null, "results": [...]}
+#
+#   - Paging is by KEYSET ("cursor"): the next page is "rows with an id after the
+#     last one you got", which the primary key index answers directly. Unlike
+#     ?page=300 it doesn't get slower the further you go, and rows added while
+#     you page don't shift everything by one. Follow "next" until it is null.
+#   - ?limit= sets the page size (default LIST_PAGE_SIZE, at most LIST_MAX_PAGE_SIZE).
+#   - ?fields= sends only those columns, and only those are read from the database.
+#   - Filters (gender, level, payment_status, hall...) are applied in SQL.
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    page_size = getattr(settings, 'LIST_PAGE_SIZE', 100)
+    page_size_query_param = 'limit'
+    max_page_size = getattr(settings, 'LIST_MAX_PAGE_SIZE', 500)
+
+    def __init__(self, ordering):
+        # Always a unique, indexed column (the primary key), so the cursor is exact
+        self.ordering = ordering
+
+
+def _requested_fields(request, serializer_class):
+    """
+    The ?fields= list, checked against what the serializer may send.
+    Returns (fields or None for "all", error message or None).
+    """
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None, None
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    readable = [name for name, field in serializer_class().fields.items() if not field.write_only]
+    unknown = [name for name in fields if name not in readable]
+    if unknown:
+        return None, f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(readable)}"
+    return fields, None
+
+
+def paged_list(request, queryset, serializer_class, filters=None, ordering='pk'):
+    """
+    One page of `queryset` for a list endpoint.
+    filters maps a query parameter to the column lookup it filters on,
+    e.g. {'hall': 'hall_selected_id'}; empty parameters are ignored.
+    """
+    for param, lookup in (filters or {}).items():
+        value = request.query_params.get(param)
+        if value not in (None, ''):
+            queryset = queryset.filter(**{lookup: value})
+
+    fields, error = _requested_fields(request, serializer_class)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    if fields:
+        # Only read the requested columns (the primary key always comes along)
+        queryset = queryset.only(*fields)
+
+    paginator = KeysetPagination(ordering)
+    page = paginator.paginate_queryset(queryset, request)
+    data = serializer_class(page, many=True, fields=fields).data
+    return paginator.get_paginated_response(data)
@@ -0,0 +1,186 @@
+# ==================================================
+# LIVE.PY - Push hall occupancy changes to open dashboards
+# ==================================================
+# The admin dashboard used to ask "anything new?" every 10 seconds, and with
+# dozens of admins and porters watching halls almost every answer was "no".
+# Now the dashboard keeps ONE connection open per hall and the server tells it
+# when something changed:
+#
+#   1. A booking / maintenance toggle / auto-allocation bumps the hall summary
+#      version and logs the rooms it touched in hall_change (occupancy.py).
+#   2. The open connections compare the hall's version in the DATABASE with the
+#      last one they sent, and send one small event per new version, e.g.
+#          {"cursor": "42", "hall_id": 3, "version": 42, "rooms": [17]}
+#      (GET /api/halls/<hall_id>/live/ as Server-Sent Events, or as the answer
+#      to a long-poll: GET /api/halls/<hall_id>/live/poll/).
+#
+# Because the cursor is the hall summary version, every server process - and
+# manage.py auto_allocate - is seen by every dashboard, whichever process it is
+# connected to. A connection checks the database every LIVE_DB_CHECK_SECONDS;
+# changes committed by its own process wake it up straight away (publish()).
+#
+#   - streaming needs the ASGI server (uvicorn/daphne trialRoomallocation.asgi);
+#     under runserver/WSGI the stream answers 503 and the page falls back to
+#     polling, which then answers at once instead of holding a worker thread
+#   - a client that is too far behind (or whose cursor is older than the pruned
+#     change log) is told to "resync", i.e. reload the dashboard once and carry
+#     on from the new cursor
+
+import asyncio
+import json
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import HallChange, HallSummary
+
+
+# Tunable settings (see settings.py) with safe defaults
+BUFFER_SIZE = getattr(settings, 'LIVE_BUFFER_SIZE', 200)
+HEARTBEAT_SECONDS = getattr(settings, 'LIVE_HEARTBEAT_SECONDS', 15)
+LONG_POLL_SECONDS = getattr(settings, 'LIVE_LONG_POLL_SECONDS', 25)
+DB_CHECK_SECONDS = getattr(settings, 'LIVE_DB_CHECK_SECONDS', 2)
+POLL_INTERVAL_SECONDS = getattr(settings, 'LIVE_POLL_INTERVAL_SECONDS', 10)
+
+_lock = threading.Lock()
+_subscribers = defaultdict(set)  # hall_id -> {Subscriber}
+_counters = Counter()
+
+
+def record(name, amount=1):
+    """Count a live-update event (streams_opened, long_polls, published...)."""
+    with _lock:
+        _counters[name] += amount
+
+
+def parse_cursor(cursor):
+    """Hall version of a cursor, or None (missing or garbage)."""
+    cursor = cursor or ''
+    return int(cursor) if cursor.isdigit() else None
+
+
+# ==================================================
+# SUBSCRIBERS - One per open stream / waiting long-poll
+# ==================================================
+class Subscriber:
+    """Lets a connection sleep until the next DB check, or until this process commits a change to its hall."""
+
+    def __init__(self, hall_id):
+        self.hall_id = hall_id
+        self.loop = asyncio.get_running_loop()
+        self.changed = asyncio.Event()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.changed.clear()
+
+
+@contextmanager
+def subscription(hall_id):
+    """Watch a hall for as long as the with-block runs (call from async code)."""
+    subscriber = Subscriber(hall_id)
+    with _lock:
+        _subscribers[hall_id].add(subscriber)
+    try:
+        yield subscriber
+    finally:
+        with _lock:
+            _subscribers[hall_id].discard(subscriber)
+            if not _subscribers[hall_id]:
+                del _subscribers[hall_id]
+
+
+# ==================================================
+# CURSORS - Read from the hall summary / change log
+# ==================================================
+def _hall_versions(hall_id):
+    """(version, changes_pruned_upto) of the hall's summary row - (0, 0) if it has none yet."""
+    row = HallSummary.objects.filter(hall_id=hall_id).values_list('version', 'changes_pruned_upto').first()
+    return row or (0, 0)
+
+
+def current_cursor(hall_id):
+    """Cursor of the hall right now (a new client starts from here)."""
+    return str(_hall_versions(hall_id)[0])
+
+
+def events_since(hall_id, cursor):
+    """
+    (events after `cursor`, current cursor, complete). complete is False when the
+    cursor is unknown, older than the pruned change log, newer than the hall
+    (summaries rebuilt) or more than LIVE_BUFFER_SIZE versions behind - the
+    client has missed changes and must reload the dashboard.
+    """
+    version, pruned_upto = _hall_versions(hall_id)
+    seq = parse_cursor(cursor)
+    if seq is None or seq < pruned_upto or seq > version or version - seq > BUFFER_SIZE:
+        return [], str(version), False
+    if seq == version:
+        return [], str(version), True  # Nothing new - no second query
+
+    rooms = defaultdict(list)
+    changes = HallChange.objects.filter(hall_id=hall_id, version__gt=seq, version__lte=version)
+    for change_version, room_id in changes.order_by('version', 'room_id').values_list('version', 'room_id'):
+        rooms[change_version].append(room_id)
+    # Changes that didn't name any rooms still move the cursor
+    rooms.setdefault(version, [])
+    events = [
+        {'cursor': str(change_version), 'hall_id': hall_id, 'version': change_version, 'rooms': room_ids}
+        for change_version, room_ids in sorted(rooms.items())
+    ]
+    return events, str(version), True
+
+
+# ==================================================
+# PUBLISH - Wake this process's connections after a commit
+# ==================================================
+def publish(hall_id):
+    """Tell connections watching the hall to check the database now (call AFTER the commit)."""
+    with _lock:
+        subscribers = list(_subscribers.get(hall_id, ()))
+        _counters['published'] += 1
+
+    for subscriber in subscribers:
+        try:
+            # Thread-safe hand-over to the connection's event loop
+            subscriber.loop.call_soon_threadsafe(subscriber.changed.set)
+        except RuntimeError:
+            pass  # That connection's loop already closed
+
+
+def publish_on_commit(hall_id):
+    """Publish once the current transaction commits (nothing happens if it rolls back)."""
+    transaction.on_commit(lambda: publish(hall_id))
+
+
+# ==================================================
+# WIRE FORMAT
+# ==================================================
+def sse_message(data, event=None, event_id=None):
+    """One Server-Sent Event (text/event-stream) frame."""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def get_live_metrics():
+    with _lock:
+        watching = {hall_id: len(subscribers) for hall_id, subscribers in _subscribers.items()}
+        counters = dict(_counters)
+    return {
+        'watching_per_hall': watching,
+        'connections': sum(watching.values()),
+        'published': counters.get('published', 0),
+        'streams_opened': counters.get('streams_opened', 0),
+        'long_polls': counters.get('long_polls', 0),
+    }
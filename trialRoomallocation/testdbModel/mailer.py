@@ -0,0 +1,165 @@
+# ==================================================
+# MAILER.PY - Send lots of emails over a few reused SMTP connections
+# ==================================================
+# send_mail() / EmailMessage.send() open a brand new SMTP connection for every
+# single email: connect, STARTTLS handshake, log in, send ONE message, quit.
+# For a hall's worth of receipts or an announcement to 1,000 students that is
+# 1,000 handshakes - slow, and mail providers start refusing logins.
+#
+# Here each worker thread keeps ONE logged-in connection (Django's
+# get_connection()) and sends message after message over it:
+#   - send_messages(messages) sends a whole batch (the outbox / announcement
+#     workers claim MAIL_BATCH_SIZE rows at a time) and returns one outcome per
+#     message (None = sent, or the exception), so the caller can record exactly
+#     which ones failed - in one UPDATE for the sent ones - and retry only those.
+#   - The connection is replaced after MAIL_MESSAGES_PER_CONNECTION messages,
+#     after MAIL_IDLE_SECONDS without use, or when the server drops it (the
+#     message is tried once more on a fresh connection).
+#   - MAIL_MAX_PER_MINUTE (shared by every thread in the process) keeps us under
+#     the provider's sending limit: messages are spaced out evenly instead of
+#     being refused. 0 = no limit.
+#
+# Works with any EMAIL_BACKEND - SMTP in production, Django's locmem backend in
+# the tests, the file/console backends (or `python -m aiosmtpd -n`) locally.
+# Used by the receipt outbox (outbox.py) and hall announcements (announcements.py).
+
+import threading
+import time
+from collections import Counter
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+
+BATCH_SIZE = getattr(settings, 'MAIL_BATCH_SIZE', 50)
+MESSAGES_PER_CONNECTION = getattr(settings, 'MAIL_MESSAGES_PER_CONNECTION', 100)
+MAX_PER_MINUTE = getattr(settings, 'MAIL_MAX_PER_MINUTE', 60)
+IDLE_SECONDS = getattr(settings, 'MAIL_IDLE_SECONDS', 30)
+
+_lock = threading.Lock()
+_counters = Counter()
+_local = threading.local()  # This thread's connection
+
+
+def _bump(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+# ==================================================
+# THROTTLE - Evenly spaced sends, shared by every thread
+# ==================================================
+class _Throttle:
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Sleep until this process may send one more message."""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            _bump('throttle_wait_seconds', slot - now)
+            time.sleep(slot - now)
+
+
+_throttle = _Throttle(MAX_PER_MINUTE)
+
+
+# ==================================================
+# CONNECTION - One per thread, reused
+# ==================================================
+def _connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and (
+        _local.sent >= MESSAGES_PER_CONNECTION or time.monotonic() - _local.used_at > IDLE_SECONDS
+    ):
+        close_connection()
+        connection = None
+    if connection is None:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        _local.connection, _local.sent = connection, 0
+        _bump('connections_opened')
+    _local.used_at = time.monotonic()
+    return connection
+
+
+def close_connection():
+    """Log out of this thread's connection (if it has one)."""
+    connection = getattr(_local, 'connection', None)
+    _local.connection = None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass  # Already gone
+
+
+def _send_one(message):
+    for attempt in (1, 2):
+        try:
+            _connection().send_messages([message])
+            _local.sent += 1
+            return None
+        except SMTPServerDisconnected as error:
+            # The server hung up (idle timeout, its own per-connection limit...)
+            close_connection()
+            _bump('reconnects')
+            if attempt == 2:
+                return error
+        except SMTPRecipientsRefused as error:
+            # Only this address is bad - the connection is still fine
+            return error
+        except Exception as error:
+            close_connection()
+            return error
+
+
+# ==================================================
+# SEND - What the outbox / announcements call
+# ==================================================
+def send_messages(messages):
+    """
+    Send a batch of EmailMessages, one after another over this thread's
+    connection. Returns one outcome per message, in order: None if it was
+    sent, otherwise the exception it failed with. Never raises for a failed message.
+    """
+    outcomes = []
+    for message in messages:
+        _throttle.wait()
+        outcome = _send_one(message)
+        _bump('sent' if outcome is None else 'failed')
+        outcomes.append(outcome)
+    _bump('batches')
+    return outcomes
+
+
+def send_now(message):
+    """Send one message over this thread's connection; raises if it failed."""
+    outcome = send_messages([message])[0]
+    if outcome is not None:
+        raise outcome
+
+
+def get_mail_metrics():
+    with _lock:
+        counters = dict(_counters)
+    connections = counters.get('connections_opened', 0)
+    return {
+        'batch_size': BATCH_SIZE,
+        'max_per_minute': MAX_PER_MINUTE,
+        'sent': counters.get('sent', 0),
+        'failed': counters.get('failed', 0),
+        'batches': counters.get('batches', 0),
+        'connections_opened': connections,
+        'reconnects': counters.get('reconnects', 0),
+        'messages_per_connection': round(counters.get('sent', 0) / connections, 1) if connections else None,
+        'throttle_wait_seconds': round(counters.get('throttle_wait_seconds', 0.0), 1),
+    }
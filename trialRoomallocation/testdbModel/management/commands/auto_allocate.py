@@ -0,0 +1,45 @@
+# ==================================================
+# AUTO ALLOCATE - Give beds to every verified student without a room
+# ==================================================
+#   python manage.py auto_allocate --dry-run          # just show what would happen
+#   python manage.py auto_allocate                    # allocate everybody
+#   python manage.py auto_allocate --hall 1 --hall 2  # only fill these halls
+# Uses the same gender / level / budget rules as the student dashboard.
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from testdbModel.allocator import auto_allocate
+
+
+class Command(BaseCommand):
+    help = 'Batch-allocate rooms to all verified students who do not have one yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Plan the allocation and print it without writing anything.')
+        parser.add_argument('--hall', type=int, action='append', dest='halls',
+                            help='Only allocate into this hall id (repeat for several halls).')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Only consider the first N waiting students.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Students written per transaction.')
+        parser.add_argument('--no-email', action='store_true',
+                            help='Do not queue receipt emails for the new allocations.')
+
+    def handle(self, *args, **options):
+        summary = auto_allocate(
+            hall_ids=options['halls'],
+            limit=options['limit'],
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+            send_emails=not options['no_email'],
+        )
+        self.stdout.write(json.dumps(summary, indent=2))
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run - nothing was written.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Allocated {summary['result']['allocated']} students"
+            ))
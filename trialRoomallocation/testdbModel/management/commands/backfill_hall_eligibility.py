@@ -0,0 +1,45 @@
+# ==================================================
+# BACKFILL HALL ELIGIBILITY - Fill in the numeric level / cost columns of each hall
+# ==================================================
+# The student dashboard picks halls with one SQL query on Hall.level_min,
+# level_max and cost. Hall.save() keeps them in step with the free-text level and
+# ACCOMODATION_COST, but rows edited by hand (SQL, imports) need a backfill:
+#   python manage.py backfill_hall_eligibility             # fix every hall
+#   python manage.py backfill_hall_eligibility --dry-run   # only report what is out of date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from testdbModel.models import Hall
+from testdbModel.utils import hall_eligibility_values
+
+
+class Command(BaseCommand):
+    help = 'Recompute Hall.level_min / level_max / cost from the free-text level and cost columns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report which halls are out of date; change nothing.')
+
+    def handle(self, *args, **options):
+        fixed = 0
+        with transaction.atomic():
+            for hall in Hall.objects.select_for_update().order_by('hall_id'):
+                values = hall_eligibility_values(hall.level, hall.accomodation_cost)
+                changes = {
+                    field: (getattr(hall, field), value)
+                    for field, value in values.items()
+                    if getattr(hall, field) != value
+                }
+                if not changes:
+                    continue
+                fixed += 1
+                described = ', '.join(f"{field} {old}->{new}" for field, (old, new) in changes.items())
+                self.stdout.write(f"{hall.hall_name} (#{hall.hall_id}): {described}")
+                if not options['dry_run']:
+                    # update() rather than save(): don't touch updated_at or anything else
+                    Hall.objects.filter(hall_id=hall.hall_id).update(**values)
+
+        verb = 'would be updated' if options['dry_run'] else 'updated'
+        message = f"{fixed} halls {verb}"
+        self.stdout.write(self.style.SUCCESS(message) if not fixed else self.style.WARNING(message))
@@ -0,0 +1,172 @@
+# ==================================================
+# BENCHMARK BOOKING - Compare the booking engines under contention
+# ==================================================
+# Creates a throw-away hall with a few "hot" rooms and lots of students,
+# then lets many threads race to book those rooms at the same time.
+#   python manage.py benchmark_booking --students 400 --threads 32
+#   python manage.py benchmark_booking --engine guarded --rooms 2
+# All benchmark rows are deleted again when the run finishes.
+# Run it against a real MySQL database - SQLite serialises all writes anyway.
+
+import queue
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from testdbModel.booking import BOOKING_ENGINES, BookingError, book
+from testdbModel.models import Allocation, BedHold, Hall, HallSummary, Receipt, ReceiptOutbox, Room, Student
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the locking vs guarded-update booking engines with many concurrent bookers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', default='both', choices=BOOKING_ENGINES + ('both',))
+        parser.add_argument('--students', type=int, default=200,
+                            help='How many students race for beds.')
+        parser.add_argument('--rooms', type=int, default=5,
+                            help='How many (hot) rooms the hall has.')
+        parser.add_argument('--capacity', type=int, default=4,
+                            help='Beds per room.')
+        parser.add_argument('--threads', type=int, default=16,
+                            help='How many bookings run at the same time.')
+
+    def handle(self, *args, **options):
+        if options['students'] < 1 or options['rooms'] < 1 or options['threads'] < 1:
+            raise CommandError('--students, --rooms and --threads must all be at least 1')
+
+        engines = BOOKING_ENGINES if options['engine'] == 'both' else (options['engine'],)
+        for engine in engines:
+            run_id = uuid.uuid4().hex[:6]
+            hall, rooms, students = self._create_fixture(run_id, options)
+            try:
+                stats = self._run(engine, hall, rooms, students, options['threads'])
+            finally:
+                self._delete_fixture(run_id, hall)
+            self._report(engine, stats)
+
+    # --------------------------------------------------
+    # Fixture: one hall, a few rooms, many verified students
+    # --------------------------------------------------
+    def _create_fixture(self, run_id, options):
+        now = timezone.now()
+        hall = Hall.objects.create(
+            hall_name=f"BENCH {run_id}", gender='Male',
+            total_rooms=options['rooms'], available_rooms=options['rooms'],
+            hall_description='Temporary hall created by benchmark_booking',
+            created_at=now,
+        )
+        Room.objects.bulk_create([
+            Room(hall=hall, room_number=f"B{i:03d}", capacity=options['capacity'],
+                 current_occupants=0, room_status='Available',
+                 is_under_maintenance=False, created_at=now)
+            for i in range(options['rooms'])
+        ])
+        rooms = list(Room.objects.filter(hall=hall).order_by('room_number'))
+        Student.objects.bulk_create([
+            Student(matric_number=f"BN-{run_id}-{i:05d}", full_name=f"Bench Student {i}",
+                    email=f"bench-{run_id}-{i}@example.invalid", password='!',
+                    level='100', gender='Male', payment_status='Verified', created_at=now)
+            for i in range(options['students'])
+        ])
+        students = list(
+            Student.objects.filter(matric_number__startswith=f"BN-{run_id}-")
+            .values_list('matric_number', flat=True)
+        )
+        return hall, rooms, students
+
+    def _delete_fixture(self, run_id, hall):
+        students = Student.objects.filter(matric_number__startswith=f"BN-{run_id}-")
+        allocations = Allocation.objects.filter(room__hall=hall)
+        receipt_ids = list(allocations.values_list('receipt_id', flat=True))
+        ReceiptOutbox.objects.filter(allocation__in=allocations).delete()
+        allocations.delete()
+        Receipt.objects.filter(receipt_id__in=receipt_ids).delete()
+        BedHold.objects.filter(room__hall=hall).delete()
+        students.update(room=None, hall_selected=None)
+        students.delete()
+        Room.objects.filter(hall=hall).delete()
+        HallSummary.objects.filter(hall=hall).delete()
+        hall.delete()
+
+    # --------------------------------------------------
+    # The race: every student tries the rooms in order until one works
+    # --------------------------------------------------
+    def _run(self, engine, hall, rooms, students, threads):
+        work = queue.Queue()
+        for matric in students:
+            work.put(matric)
+
+        lock = threading.Lock()
+        stats = {'latencies': [], 'booked': 0, 'conflicts': 0, 'errors': 0}
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        matric = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    for room in rooms:
+                        started = time.perf_counter()
+                        outcome = 'booked'
+                        try:
+                            book(matric, hall.hall_id, room.room_id, engine=engine)
+                        except BookingError:
+                            outcome = 'conflicts'
+                        except Exception:
+                            outcome = 'errors'
+                        elapsed = time.perf_counter() - started
+                        with lock:
+                            stats['latencies'].append(elapsed)
+                            stats[outcome] += 1
+                        if outcome == 'booked':
+                            break
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        stats['wall_seconds'] = time.perf_counter() - started
+
+        # Sanity check: no room may be over capacity and every booking must be counted once
+        room_rows = Room.objects.filter(hall=hall)
+        stats['overbooked_rooms'] = sum(1 for r in room_rows if r.current_occupants > r.capacity)
+        stats['occupants'] = room_rows.aggregate(total=Sum('current_occupants'))['total'] or 0
+        stats['allocations'] = Allocation.objects.filter(room__hall=hall).count()
+        return stats
+
+    def _report(self, engine, stats):
+        latencies = sorted(stats['latencies']) or [0.0]
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        attempts = len(stats['latencies'])
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nEngine: {engine}"))
+        self.stdout.write(f"  attempts            {attempts}")
+        self.stdout.write(f"  booked              {stats['booked']}")
+        self.stdout.write(f"  conflicts           {stats['conflicts']}")
+        self.stdout.write(f"  errors              {stats['errors']}")
+        self.stdout.write(f"  wall time           {stats['wall_seconds']:.2f}s")
+        self.stdout.write(f"  attempts/second     {attempts / stats['wall_seconds']:.1f}")
+        self.stdout.write(f"  latency p50/p95/p99 {percentile(0.50):.1f} / {percentile(0.95):.1f} / "
+                          f"{percentile(0.99):.1f} ms (mean {statistics.mean(latencies) * 1000:.1f} ms)")
+
+        consistent = (
+            stats['overbooked_rooms'] == 0
+            and stats['occupants'] == stats['booked'] == stats['allocations']
+        )
+        message = (f"  consistency         occupants={stats['occupants']} "
+                   f"allocations={stats['allocations']} overbooked_rooms={stats['overbooked_rooms']}")
+        self.stdout.write(self.style.SUCCESS(message) if consistent else self.style.ERROR(message))
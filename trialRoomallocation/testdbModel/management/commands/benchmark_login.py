@@ -0,0 +1,97 @@
+# ==================================================
+# BENCHMARK LOGIN - Password checks per second, in the web worker vs the helper pool
+# ==================================================
+# Runs many password checks at the same time (like a cohort logging in at once)
+# and reports logins per second - in total and per CPU core used - plus latency
+# and how many were turned away as "busy":
+#   python manage.py benchmark_login                       # both modes
+#   python manage.py benchmark_login --mode pool --logins 500 --threads 64
+# "inline" is the old behaviour (hash in the web worker thread), "pool" is
+# passwords.verify_password with the helper processes. No database rows needed.
+
+import os
+import statistics
+import threading
+import time
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from testdbModel.admission import AdmissionError
+from testdbModel.passwords import pool_size, verify_password
+
+
+class Command(BaseCommand):
+    help = 'Benchmark login password checks in the web worker vs the helper process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', default='both', choices=('inline', 'pool', 'both'))
+        parser.add_argument('--logins', type=int, default=200,
+                            help='How many password checks to run.')
+        parser.add_argument('--threads', type=int, default=16,
+                            help='How many logins arrive at the same time.')
+
+    def handle(self, *args, **options):
+        if options['logins'] < 1 or options['threads'] < 1:
+            raise CommandError('--logins and --threads must both be at least 1')
+
+        encoded = make_password('benchmark-password')  # Same hasher/iterations as real accounts
+        modes = ('inline', 'pool') if options['mode'] == 'both' else (options['mode'],)
+        if 'pool' in modes:
+            verify_password('warm-up', encoded, use_pool=True)  # Start the helpers before timing
+        for mode in modes:
+            stats = self._run(mode, encoded, options['logins'], options['threads'])
+            self._report(mode, stats, options['threads'])
+
+    def _run(self, mode, encoded, logins, threads):
+        remaining = iter(range(logins))
+        lock = threading.Lock()
+        stats = {'latencies': [], 'ok': 0, 'busy': 0}
+
+        def check():
+            if mode == 'inline':
+                return check_password('benchmark-password', encoded)
+            return verify_password('benchmark-password', encoded, use_pool=True)
+
+        def worker():
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                started = time.perf_counter()
+                try:
+                    outcome = 'ok' if check() else 'busy'
+                except AdmissionError:
+                    outcome = 'busy'
+                elapsed = time.perf_counter() - started
+                with lock:
+                    stats[outcome] += 1
+                    if outcome == 'ok':
+                        stats['latencies'].append(elapsed)
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        stats['wall_seconds'] = time.perf_counter() - started
+        return stats
+
+    def _report(self, mode, stats, threads):
+        latencies = sorted(stats['latencies']) or [0.0]
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        cores = os.cpu_count() or 1
+        cores_used = min(threads, cores) if mode == 'inline' else min(pool_size(), cores)
+        per_second = stats['ok'] / stats['wall_seconds']
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nMode: {mode}"))
+        self.stdout.write(f"  logins checked      {stats['ok']}")
+        self.stdout.write(f"  turned away (busy)  {stats['busy']}")
+        self.stdout.write(f"  wall time           {stats['wall_seconds']:.2f}s")
+        self.stdout.write(f"  logins/second       {per_second:.1f}")
+        self.stdout.write(f"  logins/second/core  {per_second / cores_used:.1f} ({cores_used} of {cores} cores)")
+        self.stdout.write(f"  latency p50/p95/p99 {percentile(0.50):.1f} / {percentile(0.95):.1f} / "
+                          f"{percentile(0.99):.1f} ms (mean {statistics.mean(latencies) * 1000:.1f} ms)")
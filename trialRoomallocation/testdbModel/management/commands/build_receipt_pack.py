@@ -0,0 +1,56 @@
+# ==================================================
+# BUILD RECEIPT PACK - Every receipt PDF of a hall in one ZIP file
+# ==================================================
+# The same ZIP as GET /api/admin/receipts/pack/, written to a file - handy to
+# prepare the porters' pack the evening before check-in:
+#   python manage.py build_receipt_pack --hall 3                # one hall (by id)
+#   python manage.py build_receipt_pack --hall "Queen Esther"   # ... or by name
+#   python manage.py build_receipt_pack --output pack.zip       # every hall
+# Receipts already rendered are reused; the rest are rendered by
+# RECEIPT_RENDER_WORKERS helper processes in parallel (receipt_packs.py).
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from testdbModel.export import receipts_queryset
+from testdbModel.models import Hall
+from testdbModel.receipt_packs import new_pack, pack_filename, receipt_pack_chunks
+
+
+class Command(BaseCommand):
+    help = 'Write every active receipt of a hall (or the campus) to one ZIP file of PDFs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hall', help='Hall id or name (default: every hall).')
+        parser.add_argument('--output', help='ZIP file to write (default: receipts-<hall>-<date>.zip).')
+
+    def handle(self, *args, **options):
+        hall = None
+        if options['hall']:
+            halls = Hall.objects.all()
+            value = options['hall']
+            hall = (halls.filter(hall_id=value) if value.isdigit() else halls.filter(hall_name__iexact=value)).first()
+            if hall is None:
+                raise CommandError(f"No hall called {value!r}")
+
+        allocations = receipts_queryset(hall)
+        pack_id, total = new_pack(allocations)
+        output = options['output'] or pack_filename(hall)
+        started = time.monotonic()
+        last_report = [0.0]
+
+        def report(done, total):
+            now = time.monotonic()
+            if done == total or now - last_report[0] >= 2:
+                last_report[0] = now
+                rate = done / max(now - started, 0.001)
+                self.stdout.write(f"  {done}/{total} receipts ({rate:.1f}/s)")
+
+        with open(output, 'wb') as zip_file:
+            for chunk in receipt_pack_chunks(allocations, pack_id, total, on_progress=report):
+                zip_file.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} receipts written to {output} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,37 @@
+# ==================================================
+# PROCESS BOOKING QUEUE - Hand expired / abandoned slots to the next students
+# ==================================================
+# A slot is handed on at once when its student books. When their admission
+# window runs out instead (or a waiting student closes the tab) nobody is
+# there to do it - this command is. Run it all through allocation day:
+#   python manage.py process_booking_queue              # once (e.g. from cron)
+#   python manage.py process_booking_queue --interval 5 # keep going every 5 seconds
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from testdbModel.admission import process_queues
+
+
+class Command(BaseCommand):
+    help = 'Expire stale booking queue tickets and admit the next students in line.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and process the queues every N seconds.')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            admitted = process_queues()
+            if admitted:
+                self.stdout.write(
+                    "Admitted " + ", ".join(f"{count} in hall {hall_id}" for hall_id, count in admitted.items())
+                )
+            if not interval:
+                return
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,54 @@
+# ==================================================
+# PROCESS RECEIPT OUTBOX - Background worker for receipt emails
+# ==================================================
+# Run this next to the web server:
+#   python manage.py process_receipt_outbox --workers 4
+# It keeps picking up receipts queued by book_room, builds the PDF and emails it,
+# and sends hall announcements whenever no receipt is waiting.
+# Use --once to send everything that is currently due and exit (handy for cron).
+
+import json
+import threading
+
+from django.core.management.base import BaseCommand
+
+from testdbModel.outbox import get_outbox_metrics, run_worker_pool
+
+
+class Command(BaseCommand):
+    help = 'Build and send queued allocation receipt emails (receipt outbox worker pool).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='How many receipts to build/send in parallel (threads).')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='How many outbox entries to claim per database round trip.')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when the outbox is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Process everything that is due now, then exit.')
+        parser.add_argument('--metrics', action='store_true',
+                            help='Print outbox metrics as JSON and exit.')
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            self.stdout.write(json.dumps(get_outbox_metrics(), indent=2))
+            return
+
+        stop_event = threading.Event()
+        self.stdout.write(f"Receipt outbox worker started with {options['workers']} workers")
+        try:
+            processed = run_worker_pool(
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+                stop_event=stop_event,
+            )
+        except KeyboardInterrupt:
+            stop_event.set()
+            self.stdout.write('Stopping receipt outbox worker...')
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} outbox entries"))
+        self.stdout.write(json.dumps(get_outbox_metrics()['queue']))
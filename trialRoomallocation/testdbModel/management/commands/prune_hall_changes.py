@@ -0,0 +1,34 @@
+# ==================================================
+# PRUNE HALL CHANGES - Forget old entries of the hall change log
+# ==================================================
+# The change log only needs to go back as far as the oldest dashboard that might
+# still sync from it (default HALL_CHANGE_RETENTION_DAYS = 7). Run this from cron
+# (e.g. daily):
+#   python manage.py prune_hall_changes
+#   python manage.py prune_hall_changes --days 2
+# A dashboard holding an older cursor is simply told to reload everything.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from testdbModel.occupancy import prune_hall_changes
+
+
+class Command(BaseCommand):
+    help = 'Delete hall change-log rows older than the retention period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'HALL_CHANGE_RETENTION_DAYS', 7),
+            help='Keep this many days of changes (default: HALL_CHANGE_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted = prune_hall_changes(cutoff)
+        self.stdout.write(f"Deleted {deleted} hall changes older than {options['days']} days")
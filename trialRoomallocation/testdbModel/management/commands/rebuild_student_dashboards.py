@@ -0,0 +1,40 @@
+# ==================================================
+# REBUILD STUDENT DASHBOARDS - Rebuild the ready-made student dashboards
+# ==================================================
+# Each student's dashboard is stored as one document (dashboards.py) and rebuilt
+# automatically when a booking / maintenance toggle / admin-panel edit changes it.
+# Run this after changes made outside the app (SQL, imports) or to build every
+# document up front after a deploy that bumped dashboards.SCHEMA_VERSION:
+#   python manage.py rebuild_student_dashboards               # every student
+#   python manage.py rebuild_student_dashboards --outdated    # only missing / old-layout documents
+#   python manage.py rebuild_student_dashboards --student 22/0101
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from testdbModel.dashboards import SCHEMA_VERSION, rebuild_dashboards
+from testdbModel.models import Student
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored student dashboard documents.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--outdated', action='store_true',
+                            help='Only students without a document or with an older schema version.')
+        parser.add_argument('--student', action='append', dest='students',
+                            help='Only this matric number (can be given more than once).')
+
+    def handle(self, *args, **options):
+        students = Student.objects.all()
+        if options['students']:
+            students = students.filter(matric_number__in=options['students'])
+        if options['outdated']:
+            students = students.filter(
+                Q(dashboard__isnull=True) | ~Q(dashboard__schema_version=SCHEMA_VERSION)
+            )
+
+        rebuilt = rebuild_dashboards(students)
+        self.stdout.write(self.style.SUCCESS(
+            f"{rebuilt} student dashboards rebuilt (schema version {SCHEMA_VERSION})"
+        ))
@@ -0,0 +1,37 @@
+# ==================================================
+# RECONCILE HALL SUMMARY - Recount hall totals and fix any drift
+# ==================================================
+# The booking and maintenance code keep each hall's summary row up to date by
+# adding their changes to it. If rooms are edited some other way (Django admin,
+# SQL by hand), the totals drift. This recounts them from the room table:
+#   python manage.py reconcile_hall_summary             # fix every hall
+#   python manage.py reconcile_hall_summary --dry-run   # only report the drift
+#   python manage.py reconcile_hall_summary --hall 3
+# Run it once after the first migrate to build the rows, then e.g. nightly from cron.
+
+from django.core.management.base import BaseCommand
+
+from testdbModel.occupancy import rebuild_hall_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recount each hall summary row from the room table and fix any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report which halls drifted; change nothing.')
+        parser.add_argument('--hall', type=int, action='append', dest='halls',
+                            help='Only this hall id (can be given more than once).')
+
+    def handle(self, *args, **options):
+        drift = rebuild_hall_summaries(hall_ids=options['halls'], dry_run=options['dry_run'])
+
+        for hall in drift:
+            changes = ', '.join(
+                f"{field} {stored}->{counted}" for field, (stored, counted) in hall['changes'].items()
+            )
+            self.stdout.write(f"{hall['hall_name']} (#{hall['hall_id']}): {changes}")
+
+        verb = 'would be fixed' if options['dry_run'] else 'fixed'
+        message = f"{len(drift)} hall summaries {verb}"
+        self.stdout.write(self.style.SUCCESS(message) if not drift else self.style.WARNING(message))
@@ -0,0 +1,33 @@
+# ==================================================
+# SWEEP BED HOLDS - Delete expired bed holds in bulk
+# ==================================================
+# Expired holds already stop counting the moment they expire; this just keeps
+# the bed_hold table small.
+#   python manage.py sweep_bed_holds               # sweep once (e.g. from cron)
+#   python manage.py sweep_bed_holds --interval 30 # keep sweeping every 30 seconds
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from testdbModel.holds import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Delete expired bed holds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and sweep every N seconds.')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            deleted = sweep_expired_holds()
+            self.stdout.write(f"Deleted {deleted} expired bed holds")
+            if not interval:
+                return
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                return
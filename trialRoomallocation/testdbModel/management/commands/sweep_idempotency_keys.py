@@ -0,0 +1,18 @@
+# ==================================================
+# SWEEP IDEMPOTENCY KEYS - Forget expired Idempotency-Keys
+# ==================================================
+# Keys are kept for IDEMPOTENCY_KEY_TTL_SECONDS (default one day). Run this
+# from cron (e.g. hourly) so the idempotency_key table stays small:
+#   python manage.py sweep_idempotency_keys
+
+from django.core.management.base import BaseCommand
+
+from testdbModel.idempotency import sweep_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency keys.'
+
+    def handle(self, *args, **options):
+        deleted = sweep_expired_keys()
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys")
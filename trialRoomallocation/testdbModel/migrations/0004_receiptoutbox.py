@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0003_alter_log_options_alter_room_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptOutbox',
+            fields=[
+                ('outbox_id', models.AutoField(primary_key=True, serialize=False)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField()),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('locked_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('allocation', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, related_name='receipt_outbox', to='testdbModel.allocation')),
+            ],
+            options={
+                'db_table': 'receipt_outbox',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='receipt_outbox_due_idx')],
+            },
+        ),
+    ]
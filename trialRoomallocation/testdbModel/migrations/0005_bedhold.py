@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0004_receiptoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BedHold',
+            fields=[
+                ('hold_id', models.AutoField(primary_key=True, serialize=False)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField()),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='testdbModel.hall')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='testdbModel.room')),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, related_name='bed_hold', to='testdbModel.student')),
+            ],
+            options={
+                'db_table': 'bed_hold',
+                'indexes': [models.Index(fields=['hall', 'expires_at'], name='bed_hold_hall_active_idx'), models.Index(fields=['room', 'expires_at'], name='bed_hold_room_active_idx')],
+            },
+        ),
+    ]
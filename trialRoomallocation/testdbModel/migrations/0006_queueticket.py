@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0005_bedhold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueTicket',
+            fields=[
+                ('ticket_id', models.AutoField(primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=32, unique=True)),
+                ('status', models.CharField(default='waiting', max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('last_seen_at', models.DateTimeField()),
+                ('admitted_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='testdbModel.hall')),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, related_name='queue_ticket', to='testdbModel.student')),
+            ],
+            options={
+                'db_table': 'queue_ticket',
+                'indexes': [models.Index(fields=['hall', 'status', 'ticket_id'], name='queue_ticket_hall_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0007_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HallSummary',
+            fields=[
+                ('hall', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='summary', serialize=False, to='testdbModel.hall')),
+                ('rooms_total', models.IntegerField(default=0)),
+                ('rooms_available', models.IntegerField(default=0)),
+                ('rooms_under_maintenance', models.IntegerField(default=0)),
+                ('beds_total', models.IntegerField(default=0)),
+                ('beds_occupied', models.IntegerField(default=0)),
+                ('beds_under_maintenance', models.IntegerField(default=0)),
+                ('beds_available', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'hall_summary',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0008_hallsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hallsummary',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0009_hallsummary_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hallsummary',
+            name='changes_pruned_upto',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='HallChange',
+            fields=[
+                ('change_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='testdbModel.hall')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='testdbModel.room')),
+            ],
+            options={
+                'db_table': 'hall_change',
+                'indexes': [models.Index(fields=['hall', 'version'], name='hall_change_hall_version_idx'), models.Index(fields=['created_at'], name='hall_change_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# The student table is not managed by Django (it comes from DataBaseForProject.sql),
+# so this adds the index used by the /api/student/ filters by hand - and only if the
+# table exists and doesn't have it yet.
+
+from django.db import migrations, models
+
+
+STUDENT_FILTER_INDEX = models.Index(
+    fields=['gender', 'payment_status', 'level'], name='idx_student_gender_status_level'
+)
+
+
+def _existing_indexes(schema_editor, table):
+    connection = schema_editor.connection
+    if table not in connection.introspection.table_names():
+        return None
+    with connection.cursor() as cursor:
+        return connection.introspection.get_constraints(cursor, table)
+
+
+def add_student_filter_index(apps, schema_editor):
+    Student = apps.get_model('testdbModel', 'Student')
+    existing = _existing_indexes(schema_editor, Student._meta.db_table)
+    if existing is not None and STUDENT_FILTER_INDEX.name not in existing:
+        schema_editor.add_index(Student, STUDENT_FILTER_INDEX)
+
+
+def remove_student_filter_index(apps, schema_editor):
+    Student = apps.get_model('testdbModel', 'Student')
+    existing = _existing_indexes(schema_editor, Student._meta.db_table)
+    if existing is not None and STUDENT_FILTER_INDEX.name in existing:
+        schema_editor.remove_index(Student, STUDENT_FILTER_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0010_hallchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_student_filter_index, remove_student_filter_index),
+    ]
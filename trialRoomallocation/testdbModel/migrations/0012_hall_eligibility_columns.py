@@ -0,0 +1,86 @@
+# The hall table is not managed by Django (it comes from DataBaseForProject.sql),
+# so this adds the numeric level_min / level_max / cost columns and their index by
+# hand - only where they are missing - and fills them in from the text columns.
+
+from django.db import migrations, models
+
+from testdbModel.utils import hall_eligibility_values
+
+
+HALL_ELIGIBILITY_INDEX = models.Index(
+    fields=['gender', 'cost', 'level_min', 'level_max'], name='idx_hall_eligibility'
+)
+
+
+def _eligibility_fields():
+    fields = {
+        'level_min': models.PositiveSmallIntegerField(blank=True, null=True),
+        'level_max': models.PositiveSmallIntegerField(blank=True, null=True),
+        'cost': models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True),
+    }
+    for name, field in fields.items():
+        field.set_attributes_from_name(name)
+    return fields
+
+
+def add_hall_eligibility_columns(apps, schema_editor):
+    Hall = apps.get_model('testdbModel', 'Hall')
+    connection = schema_editor.connection
+    table = Hall._meta.db_table
+    if table not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+        constraints = connection.introspection.get_constraints(cursor, table)
+
+    for name, field in _eligibility_fields().items():
+        if name not in columns:
+            field.model = Hall
+            schema_editor.add_field(Hall, field)
+            Hall._meta.add_field(field)  # So the index below can refer to it
+    if HALL_ELIGIBILITY_INDEX.name not in constraints:
+        schema_editor.add_index(Hall, HALL_ELIGIBILITY_INDEX)
+
+    # Backfill (same as manage.py backfill_hall_eligibility)
+    quote = schema_editor.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT hall_id, level, ACCOMODATION_COST FROM {quote(table)}")
+        for hall_id, level, cost in cursor.fetchall():
+            values = hall_eligibility_values(level, cost)
+            cursor.execute(
+                f"UPDATE {quote(table)} SET level_min = %s, level_max = %s, cost = %s WHERE hall_id = %s",
+                [values['level_min'], values['level_max'], values['cost'], hall_id],
+            )
+
+
+def remove_hall_eligibility_columns(apps, schema_editor):
+    Hall = apps.get_model('testdbModel', 'Hall')
+    connection = schema_editor.connection
+    table = Hall._meta.db_table
+    if table not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+        constraints = connection.introspection.get_constraints(cursor, table)
+
+    fields = _eligibility_fields()
+    for name, field in fields.items():
+        if name in columns:
+            field.model = Hall
+            Hall._meta.add_field(field)
+    if HALL_ELIGIBILITY_INDEX.name in constraints:
+        schema_editor.remove_index(Hall, HALL_ELIGIBILITY_INDEX)
+    for name, field in fields.items():
+        if name in columns:
+            schema_editor.remove_field(Hall, field)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0011_student_filter_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_hall_eligibility_columns, remove_hall_eligibility_columns),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:40
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0012_hall_eligibility_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentDashboard',
+            fields=[
+                ('student', models.OneToOneField(db_column='matric_number', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='dashboard', serialize=False, to='testdbModel.student', to_field='matric_number')),
+                ('schema_version', models.PositiveSmallIntegerField()),
+                ('document', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('built_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'student_dashboard',
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0013_studentdashboard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Announcement',
+            fields=[
+                ('announcement_id', models.AutoField(primary_key=True, serialize=False)),
+                ('subject', models.CharField(max_length=200)),
+                ('body', models.TextField()),
+                ('sent_by', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField()),
+                ('hall', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='testdbModel.hall')),
+            ],
+            options={
+                'db_table': 'announcement',
+            },
+        ),
+        migrations.CreateModel(
+            name='AnnouncementDelivery',
+            fields=[
+                ('delivery_id', models.AutoField(primary_key=True, serialize=False)),
+                ('email', models.CharField(max_length=100)),
+                ('status', models.CharField(default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField()),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('locked_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('announcement', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='deliveries', to='testdbModel.announcement')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='testdbModel.student')),
+            ],
+            options={
+                'db_table': 'announcement_delivery',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='announcement_delivery_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('announcement', 'student'), name='announcement_delivery_once')],
+            },
+        ),
+    ]
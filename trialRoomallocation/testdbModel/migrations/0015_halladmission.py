@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0014_announcements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HallAdmission',
+            fields=[
+                ('hall', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='admission', serialize=False, to='testdbModel.hall')),
+                ('admitted_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'hall_admission',
+            },
+        ),
+    ]
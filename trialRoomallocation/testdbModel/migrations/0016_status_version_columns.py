@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:30
+
+# The student and admin tables are not managed by Django (they come from
+# DataBaseForProject.sql), so this adds their status_version column by hand -
+# only where it is missing. Every existing row starts at version 0.
+
+from django.db import migrations, models
+
+
+STATUS_VERSION_TABLES = ('Student', 'Admin')
+
+
+def _status_version_field(model):
+    field = models.PositiveIntegerField(default=0)
+    field.set_attributes_from_name('status_version')
+    field.model = model
+    return field
+
+
+def _has_column(schema_editor, table, name):
+    connection = schema_editor.connection
+    if table not in connection.introspection.table_names():
+        return None
+    with connection.cursor() as cursor:
+        return name in {column.name for column in connection.introspection.get_table_description(cursor, table)}
+
+
+def add_status_version_columns(apps, schema_editor):
+    for model_name in STATUS_VERSION_TABLES:
+        model = apps.get_model('testdbModel', model_name)
+        if _has_column(schema_editor, model._meta.db_table, 'status_version') is False:
+            schema_editor.add_field(model, _status_version_field(model))
+
+
+def remove_status_version_columns(apps, schema_editor):
+    for model_name in STATUS_VERSION_TABLES:
+        model = apps.get_model('testdbModel', model_name)
+        if _has_column(schema_editor, model._meta.db_table, 'status_version'):
+            schema_editor.remove_field(model, _status_version_field(model))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0015_halladmission'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_status_version_columns, remove_status_version_columns),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:50
+
+# The update_hall_availability trigger (DataBaseForProject.sql) recounted every
+# room of the hall and rewrote hall.available_rooms after EACH room update. That
+# COUNT(*) plus the hall row lock made every booking in a hall wait for the one
+# before it. The hall summary row (occupancy.py) now keeps the same number, so
+# the trigger is dropped. It only exists on MySQL.
+
+from django.db import migrations
+
+
+HALL_AVAILABILITY_TRIGGER = """
+CREATE TRIGGER `update_hall_availability` AFTER UPDATE ON `room` FOR EACH ROW BEGIN
+    DECLARE available_count INT;
+    SELECT COUNT(*) INTO available_count
+    FROM Room
+    WHERE hall_id = NEW.hall_id AND room_status IN ('Available', 'Occupied');
+
+    UPDATE Hall SET available_rooms = available_count WHERE hall_id = NEW.hall_id;
+END
+"""
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute("DROP TRIGGER IF EXISTS `update_hall_availability`")
+
+
+def create_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute("DROP TRIGGER IF EXISTS `update_hall_availability`")
+        schema_editor.execute(HALL_AVAILABILITY_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testdbModel', '0017_idempotencykey_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_trigger, create_trigger),
+    ]
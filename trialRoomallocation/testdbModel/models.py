@@ -4,7 +4,10 @@
 # Think of this as creating different boxes (tables) to organize student hostel information
 # Each "class" below is like a different box/folder to keep different types of information
 
-from django.db import models 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from .utils import hall_eligibility_values
 
  
 # ==================================================
@@ -36,6 +39,10 @@ class Admin(models.Model):
     # updated_at: When this admin's information was last changed
     updated_at = models.DateTimeField(blank=True, null=True)
 
+    # status_version: Goes up whenever the claims in this admin's login token
+    # change - older tokens are then refused (see identity.py)
+    status_version = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         managed = False
         db_table = 'admin'
@@ -93,7 +100,8 @@ class Hall(models.Model):
     # total_rooms: How many rooms are in this hall altogether
     total_rooms = models.IntegerField()
     
-    # available_rooms: How many rooms are still empty and can be given to students
+    # available_rooms: How many rooms are still empty and can be given to students.
+    # No longer kept up to date - the hall summary row (HallSummary) has the live number
     available_rooms = models.IntegerField()
     
     # created_at: When this hall was first added to the system
@@ -106,6 +114,32 @@ class Hall(models.Model):
     hall_description = models.TextField(db_column='Hall_DESCRIPTION')  # Field name made lowercase.
     accomodation_cost = models.CharField(db_column='ACCOMODATION_COST', max_length=200, blank=True, null=True)  # Field name made lowercase.
 
+    # level_min / level_max / cost: the free-text level and ACCOMODATION_COST above as
+    # numbers, so "which halls can this student pick?" is one indexed query.
+    # They are worked out again on every save(); for rows changed outside Django run
+    #   python manage.py backfill_hall_eligibility
+    # level_min = NULL means the hall takes every level.
+    level_min = models.PositiveSmallIntegerField(blank=True, null=True)
+    level_max = models.PositiveSmallIntegerField(blank=True, null=True)
+    cost = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+
+    def sync_eligibility(self):
+        """Fill level_min / level_max / cost in from level and accomodation_cost."""
+        for field, value in hall_eligibility_values(self.level, self.accomodation_cost).items():
+            setattr(self, field, value)
+
+    def save(self, *args, **kwargs):
+        self.sync_eligibility()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'level', 'accomodation_cost'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'level_min', 'level_max', 'cost'}
+        super().save(*args, **kwargs)
+
+    def accepts_level(self, level_number):
+        """Does this hall take students of level_number? (None = unknown level -> yes)"""
+        if self.level_min is None or level_number is None:
+            return True
+        return self.level_min <= level_number <= self.level_max
 
     class Meta:
         managed = False
@@ -303,6 +337,388 @@ class Student(models.Model):
     # updated_at: When this student's information was last changed
     updated_at = models.DateTimeField(blank=True, null=True)
 
+    # status_version: Goes up whenever the claims in this student's login token
+    # change (e.g. their payment is verified) - see identity.py
+    status_version = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         managed = False
         db_table = 'student'
+
+
+# ==================================================
+# RECEIPT OUTBOX MODEL - Receipt emails waiting to be sent
+# ==================================================
+# This is like an "outgoing mail" tray at the porter's lodge.
+# book_room drops a note in the tray (inside the booking transaction) and a
+# separate worker picks it up later to build the PDF and send the email.
+# That way the slow PDF/SMTP work never holds the student and room locks.
+class ReceiptOutbox(models.Model):
+    # The different states an outbox entry can be in
+    STATUS_PENDING = 'pending'        # Waiting for a worker to pick it up
+    STATUS_PROCESSING = 'processing'  # A worker is building/sending it right now
+    STATUS_SENT = 'sent'              # The email went out successfully
+    STATUS_FAILED = 'failed'          # Gave up after too many attempts
+
+    # outbox_id: A unique number for each outbox entry
+    outbox_id = models.AutoField(primary_key=True)
+
+    # allocation: Which booking this receipt is for
+    # OneToOne means each allocation can only ever be queued ONCE (no duplicate emails)
+    allocation = models.OneToOneField(Allocation, models.DO_NOTHING, related_name='receipt_outbox')
+
+    # payload: Everything send_receipt_email needs (student name, hall, room, amount...)
+    payload = models.JSONField()
+
+    # status: pending / processing / sent / failed
+    status = models.CharField(max_length=10, default=STATUS_PENDING)
+
+    # attempts: How many times a worker has tried to send this email
+    attempts = models.IntegerField(default=0)
+
+    # next_attempt_at: Don't try again before this time (used for retry back-off)
+    next_attempt_at = models.DateTimeField()
+
+    # locked_at / locked_by: Which worker claimed this entry and when
+    # If a worker crashes, another worker can re-claim the entry after the lease runs out
+    locked_at = models.DateTimeField(blank=True, null=True)
+    locked_by = models.CharField(max_length=100, blank=True, null=True)
+
+    # last_error: The error message from the last failed attempt (for debugging)
+    last_error = models.TextField(blank=True, null=True)
+
+    # created_at: When the booking queued this email
+    created_at = models.DateTimeField()
+
+    # sent_at: When the email was actually delivered to the mail server
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'receipt_outbox'
+        indexes = [
+            # Workers always look for "pending entries that are due", so index exactly that
+            models.Index(fields=['status', 'next_attempt_at'], name='receipt_outbox_due_idx'),
+        ]
+
+
+# ==================================================
+# BED HOLD MODEL - A bed "reserved" for a few minutes
+# ==================================================
+# When a student opens a room to book it, we hold one bed for them for a short
+# time (like putting your bag on a seat). Other students can't take that bed
+# while the hold is active, so the final booking never finds the room full.
+# Holds simply stop counting once expires_at has passed; sweep_bed_holds
+# deletes the old rows in bulk.
+class BedHold(models.Model):
+    # hold_id: A unique number for each hold
+    hold_id = models.AutoField(primary_key=True)
+
+    # student: Who is holding the bed (OneToOne = a student can only hold ONE bed at a time)
+    student = models.OneToOneField(Student, models.DO_NOTHING, related_name='bed_hold')
+
+    # room: Which room the held bed is in
+    room = models.ForeignKey(Room, models.DO_NOTHING)
+
+    # hall: Copied from the room so the available-rooms list can find a hall's
+    # active holds through an index instead of joining through every room
+    hall = models.ForeignKey(Hall, models.DO_NOTHING)
+
+    # expires_at: After this time the hold no longer counts
+    expires_at = models.DateTimeField()
+
+    # created_at: When the hold was placed
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'bed_hold'
+        indexes = [
+            models.Index(fields=['hall', 'expires_at'], name='bed_hold_hall_active_idx'),
+            models.Index(fields=['room', 'expires_at'], name='bed_hold_room_active_idx'),
+        ]
+
+
+# ==================================================
+# QUEUE TICKET MODEL - A student's place in the booking queue
+# ==================================================
+# On allocation day everybody tries to book in the same minute. Instead of
+# letting all of them hit the database at once, students take a ticket for a
+# hall and only ADMISSION_SLOTS_PER_HALL of them are let in to book at a time
+# (see admission.py). Everybody else waits their turn and is told roughly how long.
+class QueueTicket(models.Model):
+    # The different states a ticket can be in
+    STATUS_WAITING = 'waiting'    # In the queue, not allowed to book yet
+    STATUS_ADMITTED = 'admitted'  # Allowed to book until expires_at
+    STATUS_DONE = 'done'          # Booked (or gave up) - slot handed to the next student
+    STATUS_EXPIRED = 'expired'    # Admission ran out, or stopped checking the queue
+
+    # ticket_id: A unique number for each ticket (also the queue order)
+    ticket_id = models.AutoField(primary_key=True)
+
+    # token: The random string the browser keeps to ask "is it my turn yet?"
+    token = models.CharField(max_length=32, unique=True)
+
+    # student: Who is queueing (OneToOne = one ticket per student at a time)
+    student = models.OneToOneField(Student, models.DO_NOTHING, related_name='queue_ticket')
+
+    # hall: Which hall's queue they are in
+    hall = models.ForeignKey(Hall, models.DO_NOTHING)
+
+    # status: waiting / admitted / done / expired
+    status = models.CharField(max_length=10, default=STATUS_WAITING)
+
+    # created_at: When the student joined the queue
+    created_at = models.DateTimeField()
+
+    # last_seen_at: Last time the browser checked its place (tickets nobody checks are dropped)
+    last_seen_at = models.DateTimeField()
+
+    # admitted_at / expires_at: When the student was let in, and until when they may book
+    admitted_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+
+    # finished_at: When the student booked (used to estimate how long each turn takes)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'queue_ticket'
+        indexes = [
+            models.Index(fields=['hall', 'status', 'ticket_id'], name='queue_ticket_hall_status_idx'),
+        ]
+
+
+# ==================================================
+# HALL ADMISSION MODEL - The lock for handing out a hall's booking slots
+# ==================================================
+# One row per hall. Admitting the next students in line locks THIS row, not the
+# hall row itself - bookings update the hall, and they shouldn't have to wait
+# behind the queue (or the queue behind them). See admission.py.
+class HallAdmission(models.Model):
+    # hall: Whose queue this row guards
+    hall = models.OneToOneField(Hall, models.DO_NOTHING, primary_key=True, related_name='admission')
+
+    # admitted_at: Last time free slots were handed out (the metrics show how long ago)
+    admitted_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'hall_admission'
+
+
+# ==================================================
+# IDEMPOTENCY KEY MODEL - "I've already done this request" memory
+# ==================================================
+# Phones retry bookRoom when the network is slow. Without this, every retry runs
+# the whole booking again. The app sends an Idempotency-Key header; the FIRST
+# request with a key does the work and its response is saved here. Retries with
+# the same key get the saved response back without touching rooms or students.
+class IdempotencyKey(models.Model):
+    STATUS_IN_PROGRESS = 'in_progress'  # The first request is still running
+    STATUS_COMPLETED = 'completed'      # Finished - response saved for replays
+
+    # key_id: A unique number for each stored key
+    key_id = models.AutoField(primary_key=True)
+
+    # scope: Which endpoint the key belongs to (e.g. 'book_room')
+    scope = models.CharField(max_length=50)
+
+    # key: The Idempotency-Key header the app sent
+    key = models.CharField(max_length=255)
+
+    # owner: Who sent it ("student:<matric>" / "admin:<id>" from their login
+    # token, '' without one) - two people's keys never clash
+    owner = models.CharField(max_length=64, default='')
+
+    # request_hash: Fingerprint of the request, so a key can't be reused for a DIFFERENT request
+    request_hash = models.CharField(max_length=64)
+
+    # status: in_progress / completed
+    status = models.CharField(max_length=12, default=STATUS_IN_PROGRESS)
+
+    # response_status / response_body: The saved response that retries get back
+    response_status = models.IntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+
+    # created_at: When the first request arrived
+    created_at = models.DateTimeField()
+
+    # expires_at: After this the key is forgotten (sweep_idempotency_keys deletes it)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'idempotency_key'
+        constraints = [
+            # The unique index is what stops two copies of a request running at once
+            models.UniqueConstraint(fields=['scope', 'owner', 'key'], name='idempotency_key_owner_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_key_expires_idx'),
+        ]
+
+
+# ==================================================
+# HALL SUMMARY MODEL - Running totals for each hall
+# ==================================================
+# Instead of counting every room of a hall each time a dashboard loads, each hall
+# has ONE summary row that the booking and maintenance code keep up to date by
+# adding/subtracting the change they just made (see occupancy.py).
+# manage.py reconcile_hall_summary recounts from the room table and fixes any drift.
+class HallSummary(models.Model):
+    # hall: Which hall these totals are for (one row per hall)
+    hall = models.OneToOneField(Hall, models.DO_NOTHING, primary_key=True, related_name='summary')
+
+    # Rooms: all of them / bookable right now (not full, not under maintenance) / being repaired
+    rooms_total = models.IntegerField(default=0)
+    rooms_available = models.IntegerField(default=0)
+    rooms_under_maintenance = models.IntegerField(default=0)
+
+    # Beds: all of them / taken by students / in rooms being repaired /
+    # free AND bookable (free beds in rooms that are not under maintenance)
+    beds_total = models.IntegerField(default=0)
+    beds_occupied = models.IntegerField(default=0)
+    beds_under_maintenance = models.IntegerField(default=0)
+    beds_available = models.IntegerField(default=0)
+
+    # version: Goes up by one on every change - used as the hall's ETag, so
+    # polling dashboards can be told "nothing changed" (304) without any work
+    version = models.BigIntegerField(default=0)
+
+    # changes_pruned_upto: HallChange rows up to this version have been deleted,
+    # so a client asking for changes since an older version must reload everything
+    changes_pruned_upto = models.BigIntegerField(default=0)
+
+    # updated_at: When the totals last changed
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'hall_summary'
+
+
+# ==================================================
+# HALL CHANGE MODEL - Which rooms changed in which hall version
+# ==================================================
+# Written in the same transaction as the booking / maintenance toggle, right after
+# the hall summary row is updated. Because every change to a hall bumps
+# HallSummary.version while holding that row's lock, versions are handed out in
+# commit order - so "give me everything after version N" never skips a change.
+# The admin dashboard uses it to sync only the rooms that changed
+# (GET /api/admin/dashboard/changes/?since=N). Old rows are removed by
+# manage.py prune_hall_changes.
+class HallChange(models.Model):
+    # change_id: A unique number for each log row
+    change_id = models.BigAutoField(primary_key=True)
+
+    # hall: Which hall changed
+    hall = models.ForeignKey(Hall, models.DO_NOTHING)
+
+    # version: The hall summary version this change produced (the sync cursor)
+    version = models.BigIntegerField()
+
+    # room: Which room changed (its occupants, count or maintenance status)
+    room = models.ForeignKey(Room, models.DO_NOTHING)
+
+    # created_at: When the change was made
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'hall_change'
+        indexes = [
+            models.Index(fields=['hall', 'version'], name='hall_change_hall_version_idx'),
+            models.Index(fields=['created_at'], name='hall_change_created_idx'),
+        ]
+
+
+# ==================================================
+# STUDENT DASHBOARD MODEL - A ready-made copy of each student's dashboard
+# ==================================================
+# Students refresh their dashboard constantly, and building it meant reading the
+# student, their room and hall, their payment and their roommates every time.
+# This row keeps the finished student-specific part as one JSON document, so the
+# dashboard is one primary-key read. It is rebuilt whenever something in it
+# changes (a booking or maintenance toggle in their room, a payment verified in
+# the admin panel) - see dashboards.py.
+class StudentDashboard(models.Model):
+    # student: Whose dashboard this is (keyed by matric number, which is what the
+    # dashboard endpoint is called with)
+    student = models.OneToOneField(
+        Student, models.DO_NOTHING, primary_key=True, to_field='matric_number',
+        db_column='matric_number', related_name='dashboard',
+    )
+
+    # schema_version: Which document layout this row was built with. Rows from an
+    # older layout are rebuilt the next time they are read (or by
+    # manage.py rebuild_student_dashboards)
+    schema_version = models.PositiveSmallIntegerField()
+
+    # document: The dashboard itself (profile, room, roommates, what they paid...)
+    document = models.JSONField(encoder=DjangoJSONEncoder)
+
+    # built_at: When the document was last rebuilt
+    built_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'student_dashboard'
+
+
+# ==================================================
+# ANNOUNCEMENT MODELS - One message to a whole hall, and who it reached
+# ==================================================
+# A hall admin writes one announcement ("water will be off on Saturday") and
+# it is emailed to every student living in the hall. Each student gets an
+# AnnouncementDelivery row, which records - per message - whether it was sent,
+# how many tries it took and why it failed (see announcements.py).
+class Announcement(models.Model):
+    # announcement_id: A unique number for each announcement
+    announcement_id = models.AutoField(primary_key=True)
+
+    # hall: Whose students receive it (empty = the whole campus, Super Admin only)
+    hall = models.ForeignKey(Hall, models.DO_NOTHING, blank=True, null=True)
+
+    # subject / body: The email itself
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+
+    # sent_by: The email of the admin who wrote it
+    sent_by = models.CharField(max_length=100)
+
+    # created_at: When it was written (and queued)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'announcement'
+
+
+class AnnouncementDelivery(models.Model):
+    # Same states as a receipt outbox entry
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    # delivery_id: A unique number for each delivery
+    delivery_id = models.AutoField(primary_key=True)
+
+    # announcement / student: Which announcement, to whom
+    announcement = models.ForeignKey(Announcement, models.DO_NOTHING, related_name='deliveries')
+    student = models.ForeignKey(Student, models.DO_NOTHING)
+
+    # email: The address it goes to (copied when the announcement was queued)
+    email = models.CharField(max_length=100)
+
+    # status / attempts / next_attempt_at / locked_* / last_error / sent_at:
+    # the per-message outcome, worked through exactly like ReceiptOutbox
+    status = models.CharField(max_length=10, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    locked_at = models.DateTimeField(blank=True, null=True)
+    locked_by = models.CharField(max_length=100, blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'announcement_delivery'
+        constraints = [
+            # Queuing an announcement twice never emails a student twice
+            models.UniqueConstraint(fields=['announcement', 'student'], name='announcement_delivery_once'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='announcement_delivery_due_idx'),
+        ]
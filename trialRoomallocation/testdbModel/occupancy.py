@@ -0,0 +1,225 @@
+# ==================================================
+# OCCUPANCY.PY - Keep each hall's summary row (HallSummary) up to date
+# ==================================================
+# Before: every dashboard load counted all the rooms of a hall, the
+# update_hall_availability trigger recounted them on EVERY room update, and
+# book_room also subtracted from Hall.available_rooms by hand - so the two
+# write paths fought over the hall row and didn't even agree on the number.
+#
+# Now each room change is turned into a small "delta" (e.g. +1 bed occupied,
+# -1 room available) and added to the hall's summary row with one UPDATE, in the
+# same transaction as the room change. Every booking in a hall needs that row,
+# so callers apply the delta as the LAST statement before the commit (student ->
+# room -> hall, see contention.py): the hall-wide lock is held only for a moment.
+# The old update_hall_availability trigger is dropped (migration 0018), so
+# Hall.available_rooms is no longer kept up to date - it is only a fallback for
+# halls that have no summary row yet (run reconcile_hall_summary once).
+#
+# The changed rooms are also written to the hall's change log (HallChange), so
+# dashboards can fetch only what changed since the version they last saw (the
+# live dashboards watching the hall follow the same version, live.py). Once the
+# transaction commits, this process's live connections are woken up and the
+# dashboards of the students in the changed rooms are rebuilt (dashboards.py),
+# and the changed rooms are patched into this process's in-memory bed inventory
+# (inventory.py). The hall's cached room list is keyed by the version, so the
+# next request rebuilds it (caching.py).
+#
+# If the totals ever drift (rooms edited by hand, an old code path...),
+#   python manage.py reconcile_hall_summary
+# recounts them from the room table and fixes the rows.
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from .dashboards import rebuild_dashboards_on_commit
+from .inventory import refresh_rooms_on_commit
+from .live import publish_on_commit
+from .models import Hall, HallChange, HallSummary, Room
+
+
+SUMMARY_FIELDS = (
+    'rooms_total',
+    'rooms_available',
+    'rooms_under_maintenance',
+    'beds_total',
+    'beds_occupied',
+    'beds_under_maintenance',
+    'beds_available',
+)
+
+
+def room_totals(capacity, occupants, under_maintenance):
+    """What ONE room adds to its hall's summary."""
+    bookable = not under_maintenance and occupants < capacity
+    return {
+        'rooms_total': 1,
+        'rooms_available': 1 if bookable else 0,
+        'rooms_under_maintenance': 1 if under_maintenance else 0,
+        'beds_total': capacity,
+        'beds_occupied': occupants,
+        'beds_under_maintenance': capacity if under_maintenance else 0,
+        'beds_available': capacity - occupants if bookable else 0,
+    }
+
+
+def room_change_delta(before, after):
+    """
+    How the hall totals change when a room goes from `before` to `after`.
+    Each is (capacity, current_occupants, is_under_maintenance), or None for
+    a room that didn't exist / no longer exists.
+    """
+    old = room_totals(*before) if before else dict.fromkeys(SUMMARY_FIELDS, 0)
+    new = room_totals(*after) if after else dict.fromkeys(SUMMARY_FIELDS, 0)
+    return {field: new[field] - old[field] for field in SUMMARY_FIELDS}
+
+
+def apply_delta(hall_id, delta, room_ids=()):
+    """
+    Add delta to the hall's summary row with one UPDATE (and bump its version).
+    Call it AFTER the room change has been written (same transaction): if the
+    hall has no summary row yet, it is built by counting the rooms instead.
+    room_ids (the rooms that changed) go into the change log (which the live dashboards read),
+    and the student dashboards of everybody in them are rebuilt after the commit.
+    """
+    changes = {field: F(field) + amount for field, amount in delta.items() if amount}
+    if not changes:
+        return
+    changes['version'] = F('version') + 1
+    updated = HallSummary.objects.filter(hall_id=hall_id).update(updated_at=timezone.now(), **changes)
+    if not updated:
+        try:
+            # First change to this hall: count its rooms (this already includes our change)
+            with transaction.atomic():
+                HallSummary.objects.create(
+                    hall_id=hall_id,
+                    version=1,
+                    updated_at=timezone.now(),
+                    **count_hall_totals([hall_id]).get(hall_id, dict.fromkeys(SUMMARY_FIELDS, 0)),
+                )
+        except IntegrityError:
+            # Another booking created the row at the same moment - it couldn't see our
+            # uncommitted change, so add our delta to it after all
+            HallSummary.objects.filter(hall_id=hall_id).update(updated_at=timezone.now(), **changes)
+
+    version = log_room_changes(hall_id, room_ids)
+    publish_on_commit(hall_id)
+    rebuild_dashboards_on_commit(room_ids=room_ids)
+    refresh_rooms_on_commit(hall_id, room_ids, version)
+
+
+def log_room_changes(hall_id, room_ids):
+    """
+    Write one HallChange row per changed room, tagged with the hall's new version.
+    We still hold the summary row lock from the UPDATE above, so nobody else can
+    get a version in between. Returns the version (None if no rooms were given).
+    """
+    if not room_ids:
+        return None
+    version = HallSummary.objects.filter(hall_id=hall_id).values_list('version', flat=True).get()
+    now = timezone.now()
+    HallChange.objects.bulk_create([
+        HallChange(hall_id=hall_id, version=version, room_id=room_id, created_at=now)
+        for room_id in sorted(set(room_ids))
+    ])
+    return version
+
+
+def record_room_change(hall_id, before, after, room_id=None):
+    """Shortcut: apply the delta for one room going from `before` to `after`."""
+    apply_delta(hall_id, room_change_delta(before, after), [room_id] if room_id is not None else ())
+
+
+# ==================================================
+# RECOUNT - Work the totals out from the room table
+# ==================================================
+def count_hall_totals(hall_ids=None):
+    """{hall_id: totals} counted from the room table with one GROUP BY query."""
+    rooms = Room.objects.all()
+    if hall_ids is not None:
+        rooms = rooms.filter(hall_id__in=hall_ids)
+    bookable = Q(is_under_maintenance=False, current_occupants__lt=F('capacity'))
+    rows = rooms.values('hall_id').annotate(
+        rooms_total=Count('room_id'),
+        rooms_available=Count('room_id', filter=bookable),
+        rooms_under_maintenance=Count('room_id', filter=Q(is_under_maintenance=True)),
+        beds_total=Sum('capacity'),
+        beds_occupied=Sum('current_occupants'),
+        beds_under_maintenance=Sum('capacity', filter=Q(is_under_maintenance=True)),
+        beds_available=Sum(F('capacity') - F('current_occupants'), filter=bookable),
+    ).order_by()
+    return {
+        row['hall_id']: {field: row[field] or 0 for field in SUMMARY_FIELDS}
+        for row in rows
+    }
+
+
+def rebuild_hall_summaries(hall_ids=None, dry_run=False):
+    """
+    Recount the summaries (all halls, or just hall_ids) and fix any that drifted.
+    Returns a list of {'hall_id', 'hall_name', 'changes': {field: (stored, counted)}}
+    for every hall whose stored row was missing or wrong.
+    """
+    halls = Hall.objects.all()
+    if hall_ids is not None:
+        halls = halls.filter(hall_id__in=hall_ids)
+    halls = list(halls.order_by('hall_id').values_list('hall_id', 'hall_name'))
+    ids = [hall_id for hall_id, _name in halls]
+
+    drift = []
+    with transaction.atomic():
+        # Lock the summary rows FIRST: bookings that are half-way through wait
+        # for us and add their delta on top of the recounted totals afterwards
+        stored = {
+            summary.hall_id: summary
+            for summary in HallSummary.objects.select_for_update().filter(hall_id__in=ids).order_by('hall_id')
+        }
+        counted = count_hall_totals(ids)
+        now = timezone.now()
+
+        for hall_id, hall_name in halls:
+            totals = counted.get(hall_id, dict.fromkeys(SUMMARY_FIELDS, 0))
+            summary = stored.get(hall_id)
+            changes = {
+                field: (getattr(summary, field) if summary else None, totals[field])
+                for field in SUMMARY_FIELDS
+                if summary is None or getattr(summary, field) != totals[field]
+            }
+            if not changes:
+                continue
+            drift.append({'hall_id': hall_id, 'hall_name': hall_name, 'changes': changes})
+            if dry_run:
+                continue
+            if summary is None:
+                try:
+                    with transaction.atomic():
+                        HallSummary.objects.create(hall_id=hall_id, updated_at=now, **totals)
+                except IntegrityError:
+                    # A booking created it meanwhile (counting its own change) - leave it
+                    pass
+            else:
+                HallSummary.objects.filter(hall_id=hall_id).update(
+                    updated_at=now, version=F('version') + 1, **totals
+                )
+
+    return drift
+
+
+# ==================================================
+# PRUNE - Forget old change-log rows
+# ==================================================
+def prune_hall_changes(older_than):
+    """
+    Delete HallChange rows created before `older_than`. Each hall remembers up to
+    which version it was pruned, so a client with an older cursor is told to
+    reload everything instead of silently missing changes. Returns rows deleted.
+    """
+    old = HallChange.objects.filter(created_at__lt=older_than)
+    with transaction.atomic():
+        pruned = old.values('hall_id').annotate(upto=Max('version')).order_by('hall_id')
+        for row in pruned:
+            HallSummary.objects.filter(
+                hall_id=row['hall_id'], changes_pruned_upto__lt=row['upto']
+            ).update(changes_pruned_upto=row['upto'])
+        deleted, _ = old.delete()
+    return deleted
@@ -0,0 +1,344 @@
+# ==================================================
+# OUTBOX.PY - Sends receipt emails AFTER the booking has finished
+# ==================================================
+# Building a PDF and talking to the SMTP server can take several seconds.
+# If book_room did that work inside its transaction, the student and room rows
+# would stay locked the whole time and every other booking would have to wait.
+#
+# Instead:
+#   1. book_room writes a small ReceiptOutbox row in the SAME transaction
+#      (so the email can never be "lost" if the booking commits)
+#   2. A pool of workers (manage.py process_receipt_outbox) picks up due rows,
+#      builds the PDF, sends the email and marks the row as sent. Each worker
+#      thread sends its share of a claimed batch over ONE reused SMTP
+#      connection (mailer.py) and marks all of its sent rows in one UPDATE
+#   3. Failed sends are retried with a growing delay until MAX_ATTEMPTS
+#   4. When no receipt is due, the same workers send hall announcements
+#      (announcements.py)
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .mailer import send_messages
+from .models import ReceiptOutbox
+from .receipt_pdfs import receipt_pdf
+from .utils import build_receipt_message
+
+
+logger = logging.getLogger(__name__)
+
+# Tunable settings (see settings.py) with safe defaults
+MAX_ATTEMPTS = getattr(settings, 'RECEIPT_OUTBOX_MAX_ATTEMPTS', 5)
+RETRY_BASE_SECONDS = getattr(settings, 'RECEIPT_OUTBOX_RETRY_BASE_SECONDS', 30)
+LEASE_SECONDS = getattr(settings, 'RECEIPT_OUTBOX_LEASE_SECONDS', 300)
+
+
+# ==================================================
+# IN-PROCESS METRICS - Simple counters for this worker process
+# ==================================================
+# The database tells us how many entries are in each state;
+# these counters tell us what THIS process has done since it started.
+_metrics_lock = threading.Lock()
+_metrics = {
+    'claimed': 0,
+    'sent': 0,
+    'retried': 0,
+    'failed': 0,
+    'send_seconds_total': 0.0,
+}
+
+
+def _bump(name, amount=1):
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+def get_outbox_metrics():
+    """Return queue depth per status (from the DB) plus this process's counters."""
+    by_status = dict(
+        ReceiptOutbox.objects.values_list('status').annotate(total=Count('outbox_id'))
+    )
+    oldest_pending = (
+        ReceiptOutbox.objects.filter(status=ReceiptOutbox.STATUS_PENDING)
+        .order_by('created_at')
+        .values_list('created_at', flat=True)
+        .first()
+    )
+    with _metrics_lock:
+        process_counters = dict(_metrics)
+
+    sent = process_counters['sent']
+    process_counters['avg_send_seconds'] = (
+        round(process_counters['send_seconds_total'] / sent, 3) if sent else 0.0
+    )
+    return {
+        'queue': {
+            status_name: by_status.get(status_name, 0)
+            for status_name in (
+                ReceiptOutbox.STATUS_PENDING,
+                ReceiptOutbox.STATUS_PROCESSING,
+                ReceiptOutbox.STATUS_SENT,
+                ReceiptOutbox.STATUS_FAILED,
+            )
+        },
+        'oldest_pending_age_seconds': (
+            round((timezone.now() - oldest_pending).total_seconds(), 1) if oldest_pending else 0
+        ),
+        'process': process_counters,
+    }
+
+
+# ==================================================
+# PAYLOAD - Everything send_receipt_email needs for one allocation
+# ==================================================
+def build_receipt_payload(student, room, allocation_id, transaction_id, amount):
+    """Build the send_receipt_email keyword arguments for one allocation."""
+    return {
+        'student_email': student.email,
+        'student_name': student.full_name,
+        'matric_number': student.matric_number,
+        'hall_name': room.hall.hall_name,
+        'room_number': room.room_number,
+        'receipt_no': f"BU-HAMS-{allocation_id}",
+        'transaction_id': transaction_id,
+        'amount_paid': str(amount),
+        'date': timezone.now().strftime('%B %d, %Y'),
+        'department': student.department or '',
+        'level': student.level or '',
+        'email': student.email,
+    }
+
+
+# ==================================================
+# ENQUEUE - Called by book_room INSIDE its transaction
+# ==================================================
+def enqueue_receipt_email(allocation, payload):
+    """
+    Queue a receipt email for this allocation.
+    Must be called inside the booking transaction so the outbox row
+    commits (or rolls back) together with the allocation.
+    The OneToOne on allocation means calling this twice never queues two emails.
+    """
+    now = timezone.now()
+    entry, _created = ReceiptOutbox.objects.get_or_create(
+        allocation=allocation,
+        defaults={
+            'payload': payload,
+            'status': ReceiptOutbox.STATUS_PENDING,
+            'next_attempt_at': now,
+            'created_at': now,
+        },
+    )
+    return entry
+
+
+def enqueue_receipt_emails_bulk(payloads_by_allocation_id):
+    """
+    Queue many receipt emails with one INSERT (used by the batch allocator).
+    payloads_by_allocation_id: {allocation_id: payload}
+    Allocations that already have an outbox entry are skipped.
+    """
+    now = timezone.now()
+    ReceiptOutbox.objects.bulk_create(
+        [
+            ReceiptOutbox(
+                allocation_id=allocation_id,
+                payload=payload,
+                status=ReceiptOutbox.STATUS_PENDING,
+                next_attempt_at=now,
+                created_at=now,
+            )
+            for allocation_id, payload in payloads_by_allocation_id.items()
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+# ==================================================
+# CLAIM - A worker grabs a batch of due entries
+# ==================================================
+def claim_batch(worker_id, limit=20):
+    """
+    Lock and mark up to `limit` due entries as 'processing' for this worker.
+    SKIP LOCKED lets several workers claim batches at the same time without
+    waiting on each other. Entries stuck in 'processing' longer than the lease
+    (e.g. the worker crashed) are picked up again - that lost run counts as an
+    attempt, so an entry that kills its worker every time ends up 'failed'
+    after MAX_ATTEMPTS instead of being reclaimed forever.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=LEASE_SECONDS)
+
+    with transaction.atomic():
+        entries = list(
+            ReceiptOutbox.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ReceiptOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+                | Q(status=ReceiptOutbox.STATUS_PROCESSING, locked_at__lt=stale_before)
+            )
+            .order_by('next_attempt_at', 'outbox_id')[:limit]
+        )
+        stale = [entry for entry in entries if entry.status == ReceiptOutbox.STATUS_PROCESSING]
+        given_up = [entry.outbox_id for entry in stale if entry.attempts + 1 >= MAX_ATTEMPTS]
+        if given_up:
+            ReceiptOutbox.objects.filter(outbox_id__in=given_up).update(
+                status=ReceiptOutbox.STATUS_FAILED,
+                attempts=F('attempts') + 1,
+                last_error="Worker lease expired too many times (the worker crashed or hung on this entry)",
+                locked_at=None,
+                locked_by=None,
+            )
+            _bump('failed', len(given_up))
+            entries = [entry for entry in entries if entry.outbox_id not in given_up]
+        if entries:
+            ReceiptOutbox.objects.filter(
+                outbox_id__in=[entry.outbox_id for entry in entries]
+            ).update(status=ReceiptOutbox.STATUS_PROCESSING, locked_at=now, locked_by=worker_id)
+        # The run that lost its lease was an attempt too
+        reclaimed = [entry for entry in stale if entry.outbox_id not in given_up]
+        if reclaimed:
+            ReceiptOutbox.objects.filter(outbox_id__in=[entry.outbox_id for entry in reclaimed]).update(
+                attempts=F('attempts') + 1
+            )
+            for entry in reclaimed:
+                entry.attempts += 1
+
+    _bump('claimed', len(entries))
+    return entries
+
+
+# ==================================================
+# PROCESS - Build the PDFs and send the emails for a batch of entries
+# ==================================================
+def _record_failure(entry, worker_id, error):
+    attempts = entry.attempts + 1
+    if attempts >= MAX_ATTEMPTS:
+        # Give up - an admin can look at last_error and re-queue it
+        new_status = ReceiptOutbox.STATUS_FAILED
+        next_attempt_at = timezone.now()
+        _bump('failed')
+    else:
+        # Exponential back-off with a little jitter so retries don't all fire at once
+        delay = RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+        delay += random.uniform(0, RETRY_BASE_SECONDS)
+        new_status = ReceiptOutbox.STATUS_PENDING
+        next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        _bump('retried')
+
+    # Only update if this worker still owns the entry
+    ReceiptOutbox.objects.filter(outbox_id=entry.outbox_id, locked_by=worker_id).update(
+        status=new_status,
+        attempts=attempts,
+        next_attempt_at=next_attempt_at,
+        last_error=str(error)[:2000],
+        locked_at=None,
+        locked_by=None,
+    )
+    logger.warning("Receipt outbox #%s failed (attempt %s): %s", entry.outbox_id, attempts, error, exc_info=error)
+
+
+def process_entries(entries, worker_id):
+    """Send claimed entries and record each outcome. Returns how many were sent."""
+    started = time.monotonic()
+    built = []
+    for entry in entries:
+        try:
+            # The PDF is rendered once and kept on disk, so a retry only re-reads it (receipt_pdfs.py)
+            pdf_bytes = receipt_pdf(entry.payload, entry.allocation_id)
+            built.append((entry, build_receipt_message(**entry.payload, pdf_bytes=pdf_bytes)))
+        except Exception as error:
+            _record_failure(entry, worker_id, error)
+
+    # One connection for the whole batch; a failed message doesn't stop the rest
+    outcomes = send_messages([message for _entry, message in built])
+    sent_ids = []
+    for (entry, _message), error in zip(built, outcomes):
+        if error is None:
+            sent_ids.append(entry.outbox_id)
+        else:
+            _record_failure(entry, worker_id, error)
+
+    if sent_ids:
+        ReceiptOutbox.objects.filter(outbox_id__in=sent_ids, locked_by=worker_id).update(
+            status=ReceiptOutbox.STATUS_SENT,
+            attempts=F('attempts') + 1,
+            sent_at=timezone.now(),
+            last_error=None,
+            locked_at=None,
+            locked_by=None,
+        )
+        _bump('sent', len(sent_ids))
+        _bump('send_seconds_total', time.monotonic() - started)
+    return len(sent_ids)
+
+
+def process_entry(entry, worker_id):
+    """Send one claimed entry and record the outcome. Returns True if it was sent."""
+    return process_entries([entry], worker_id) == 1
+
+
+def _process_in_thread(entries, worker_id):
+    # Each thread gets its own DB connection - close it when we are done.
+    # Its SMTP connection (mailer.py) stays open for the next batch.
+    try:
+        return process_entries(entries, worker_id)
+    finally:
+        close_old_connections()
+
+
+# ==================================================
+# WORKER POOL - Keeps claiming and sending until told to stop
+# ==================================================
+def make_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def drain_once(executor, worker_id, batch_size, workers=1):
+    """Claim one batch and split it over the thread pool. Returns how many were claimed."""
+    entries = claim_batch(worker_id, limit=batch_size)
+    if entries:
+        shares = [entries[start::workers] for start in range(min(workers, len(entries)))]
+        list(executor.map(lambda share: _process_in_thread(share, worker_id), shares))
+    return len(entries)
+
+
+def run_worker_pool(workers=4, batch_size=20, poll_interval=2.0, once=False, stop_event=None):
+    """
+    Run the outbox worker pool.
+    - workers: how many emails can be built/sent at the same time (threads)
+    - batch_size: how many entries to claim per round trip to the database
+    - once: process everything that is due right now, then return
+    """
+    # Imported here: announcements.py uses this module's retry settings
+    from .announcements import drain_announcements_once
+
+    worker_id = make_worker_id()
+    stop_event = stop_event or threading.Event()
+    total = 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='receipt-outbox') as executor:
+        while not stop_event.is_set():
+            claimed = drain_once(executor, worker_id, batch_size, workers)
+            if not claimed:
+                # Receipts first; announcements only when none is due
+                claimed = drain_announcements_once(executor, worker_id, workers)
+            total += claimed
+            if claimed:
+                continue  # There may be more waiting - go straight back for another batch
+            if once:
+                break
+            stop_event.wait(poll_interval)
+
+    return total
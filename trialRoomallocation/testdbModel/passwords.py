@@ -0,0 +1,160 @@
+# ==================================================
+# PASSWORDS.PY - Check login passwords in a small pool of helper processes
+# ==================================================
+# Passwords are stored as PBKDF2 hashes, which are SLOW to check on purpose
+# (that is what makes stolen hashes hard to crack). When the whole cohort logs
+# in at once, every web worker thread ends up busy hashing and nothing else -
+# room lists, dashboards, bookings - gets served.
+#
+# So student_login / admin_login no longer hash in the web worker. They hand the
+# check to a pool of PASSWORD_WORKERS helper processes:
+#   - At most PASSWORD_QUEUE_LIMIT checks per server process may be waiting or
+#     running at a time. One more gets a 429 + Retry-After straight away ("busy,
+#     try again") instead of piling up - the rest of the site stays responsive.
+#   - A check that takes longer than PASSWORD_TIMEOUT_SECONDS also answers 429.
+#   - If a helper process dies, the pool is started again on the next login.
+#   - PASSWORD_POOL_ENABLED=False checks passwords in the web worker as before
+#     (still bounded by PASSWORD_QUEUE_LIMIT and timed).
+#
+# Timings of recent logins (waiting for a helper / hashing / total) are at
+# /api/login/metrics/. manage.py benchmark_login compares logins per second
+# with and without the pool.
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from rest_framework import status
+
+
+POOL_ENABLED = getattr(settings, 'PASSWORD_POOL_ENABLED', True)
+# 0 = as many helpers as CPU cores
+WORKERS = getattr(settings, 'PASSWORD_WORKERS', 0)
+QUEUE_LIMIT = getattr(settings, 'PASSWORD_QUEUE_LIMIT', 32)
+TIMEOUT_SECONDS = getattr(settings, 'PASSWORD_TIMEOUT_SECONDS', 10)
+RETRY_AFTER_SECONDS = 2
+TIMINGS_KEPT = 1000
+
+_lock = threading.Lock()
+_counters = Counter()
+_timings = deque(maxlen=TIMINGS_KEPT)  # (wait, hash, total) seconds of recent checks
+_slots = threading.BoundedSemaphore(QUEUE_LIMIT)
+_pool = None
+
+
+def pool_size():
+    return WORKERS if WORKERS > 0 else (os.cpu_count() or 1)
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # "spawn": fresh helper processes, not a copy of this (threaded) web
+            # worker. They only import this module and Django's hashers.
+            _pool = ProcessPoolExecutor(
+                max_workers=pool_size(), mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _discard_pool(broken):
+    global _pool
+    with _lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _timed_check(password, encoded, submitted_at):
+    """Runs in a helper process: (matches?, seconds waited for a helper, seconds hashing)."""
+    started = time.time()
+    matches = check_password(password, encoded)
+    return matches, started - submitted_at, time.time() - started
+
+
+def _busy(message, counter):
+    # Imported here: helper processes import this module to run _timed_check,
+    # before Django's models are loaded (admission.py needs them)
+    from .admission import AdmissionError
+
+    with _lock:
+        _counters[counter] += 1
+    return AdmissionError(message, RETRY_AFTER_SECONDS, status_code=status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+# ==================================================
+# CHECK - What the login views call
+# ==================================================
+def verify_password(password, encoded, use_pool=None):
+    """
+    True if `password` matches the stored hash. Raises AdmissionError (429)
+    when too many checks are already waiting, or this one took too long.
+    use_pool: None = PASSWORD_POOL_ENABLED (the benchmark compares both).
+    """
+    use_pool = POOL_ENABLED if use_pool is None else use_pool
+    if not _slots.acquire(blocking=False):
+        raise _busy("Too many people are logging in right now. Please try again in a moment.", 'rejected_busy')
+    started = time.perf_counter()
+    try:
+        if not use_pool:
+            matches, waited, hashing = _timed_check(password, encoded, time.time())
+        else:
+            pool = _get_pool()
+            try:
+                future = pool.submit(_timed_check, password, encoded, time.time())
+                matches, waited, hashing = future.result(timeout=TIMEOUT_SECONDS)
+            except FutureTimeout:
+                future.cancel()
+                raise _busy("Logging in is taking too long right now. Please try again in a moment.", 'timeouts')
+            except BrokenProcessPool:
+                # A helper died (e.g. killed for memory): start a new pool next
+                # time, and check this one here so the student isn't turned away
+                _discard_pool(pool)
+                with _lock:
+                    _counters['pool_restarts'] += 1
+                matches, waited, hashing = _timed_check(password, encoded, time.time())
+    finally:
+        _slots.release()
+
+    total = time.perf_counter() - started
+    with _lock:
+        _counters['matched' if matches else 'mismatched'] += 1
+        _timings.append((max(waited, 0.0), hashing, total))
+    return matches
+
+
+def get_login_metrics():
+    with _lock:
+        counters = dict(_counters)
+        timings = list(_timings)
+
+    def percentiles(values):
+        if not values:
+            return None
+        values = sorted(values)
+
+        def pick(p):
+            return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+        return {'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99)}
+
+    return {
+        'mode': 'process_pool' if POOL_ENABLED else 'inline',
+        'workers': pool_size(),
+        'queue_limit': QUEUE_LIMIT,
+        'matched': counters.get('matched', 0),
+        'mismatched': counters.get('mismatched', 0),
+        'rejected_busy': counters.get('rejected_busy', 0),
+        'timeouts': counters.get('timeouts', 0),
+        'pool_restarts': counters.get('pool_restarts', 0),
+        # Over the last TIMINGS_KEPT checks
+        'wait': percentiles([timing[0] for timing in timings]),
+        'hash': percentiles([timing[1] for timing in timings]),
+        'total': percentiles([timing[2] for timing in timings]),
+    }
@@ -0,0 +1,149 @@
+# ==================================================
+# RECEIPT_DOWNLOADS.PY - Hand out the stored receipt PDF files
+# ==================================================
+# Right after allocation day every student downloads their receipt - often
+# several times. The PDF is already on disk (receipt_pdfs.py), so a download
+# should cost as little Django time as possible:
+#
+#   - ETag: the file's name IS a hash of its content, so it doubles as the
+#     ETag. A browser that already has the file sends If-None-Match and gets
+#     "304 Not Modified" without a byte of the PDF being read.
+#   - Range: "Range: bytes=1000-" (a resumed or partial download) gets just
+#     those bytes back ("206 Partial Content"); If-Range makes sure the part
+#     belongs to the same file.
+#   - RECEIPT_SENDFILE: in production let the web server send the file itself.
+#     Django only checks who is asking and answers with a header naming the
+#     file; nginx / Apache streams it (and handles Range) while the Django
+#     worker moves on to the next request:
+#         'x-accel-redirect'  nginx: X-Accel-Redirect: RECEIPT_SENDFILE_PREFIX + path
+#                             (an `internal` location aliased to RECEIPT_PDF_DIR)
+#         'x-sendfile'        Apache mod_xsendfile / lighttpd: X-Sendfile: <full path>
+#     Left empty, Django streams the file with FileResponse (the OS's sendfile
+#     is used when the server supports wsgi.file_wrapper).
+
+import os
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+from . import receipt_pdfs
+
+
+SENDFILE = getattr(settings, 'RECEIPT_SENDFILE', '').lower()
+SENDFILE_PREFIX = getattr(settings, 'RECEIPT_SENDFILE_PREFIX', '/protected-receipts/')
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def _bump(name):
+    with _lock:
+        _counters[name] += 1
+
+
+class _FileSlice:
+    """Reads only `length` bytes of an open file, starting at `start` (for 206 answers)."""
+
+    def __init__(self, handle, start, length):
+        handle.seek(start)
+        self.handle, self.remaining = handle, length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.handle.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.handle.close()
+
+
+def _byte_range(header, size):
+    """
+    (start, end) of a single "bytes=" range, None to send the whole file
+    (no / several / unreadable ranges), or False if it is outside the file.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # "bytes=-500" = the last 500 bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def serve_receipt_file(request, relative_path, download_name):
+    """The response for one stored receipt PDF (relative to RECEIPT_PDF_DIR)."""
+    path = receipt_pdfs.PDF_DIR / relative_path
+    stat = path.stat()
+    etag = f'"{path.stem}"'  # The sha256 the file is named after
+
+    if etag in request.headers.get('If-None-Match', ''):
+        _bump('not_modified')
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    if SENDFILE in ('x-accel-redirect', 'x-sendfile'):
+        # The web server reads the file (and answers Range) - not this worker
+        _bump('offloaded')
+        response = HttpResponse(content_type='application/pdf')
+        if SENDFILE == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = SENDFILE_PREFIX.rstrip('/') + '/' + relative_path
+        else:
+            response['X-Sendfile'] = os.fspath(path)
+    else:
+        byte_range = _byte_range(request.headers.get('Range'), stat.st_size)
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range != etag:
+            byte_range = None  # The part asked for belongs to an older file: send it all
+
+        if byte_range is False:
+            _bump('unsatisfiable')
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if byte_range is None:
+            _bump('full')
+            response = FileResponse(open(path, 'rb'), content_type='application/pdf')
+        else:
+            _bump('partial')
+            start, end = byte_range
+            response = FileResponse(
+                _FileSlice(open(path, 'rb'), start, end - start + 1), status=206, content_type='application/pdf'
+            )
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+
+    response['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    # Only for this student, and always checked again (a 304 is cheap)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def get_download_metrics():
+    with _lock:
+        counters = dict(_counters)
+    return {
+        'mode': SENDFILE or 'django',
+        **{name: counters.get(name, 0) for name in ('full', 'partial', 'not_modified', 'offloaded', 'unsatisfiable')},
+    }
@@ -0,0 +1,133 @@
+# ==================================================
+# RECEIPT_PACKS.PY - Every receipt of a hall in one ZIP file, streamed
+# ==================================================
+# At check-in the porters need the receipt of every student in their hall.
+# Rendering 1,000 PDFs one after another inside one web request would take
+# many minutes before the download even started. Here:
+#
+#   1. Active allocations are read in batches (export._batches, one query per
+#      batch), like the CSV export.
+#   2. Each batch goes through receipt_pdfs.receipt_pdfs_for(): receipts
+#      already on disk are reused as they are, the rest are rendered by all
+#      the RECEIPT_RENDER_WORKERS helper processes at the same time.
+#   3. Each PDF is added to the ZIP and its bytes are sent straight away, so
+#      the download starts with the first receipt and memory stays small.
+#      Receipts that could not be rendered are listed in MISSING.txt.
+#
+# Progress (done / total) is kept in Django's cache under the pack's id, sent
+# back in the X-Receipt-Pack header, and can be polled at
+# /api/admin/receipts/pack/progress/?pack=<id>. manage.py build_receipt_pack
+# writes the same ZIP to a file and prints progress as it goes.
+
+import io
+import uuid
+import zipfile
+
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .export import CHUNK_SIZE, _async_chunks, _batches
+from .receipt_pdfs import receipt_pdfs_for
+
+
+PROGRESS_SECONDS = 60 * 60  # How long a pack's progress can be polled
+
+
+class _ZipStream(io.RawIOBase):
+    """Where zipfile writes to: keeps the bytes until the generator hands them on."""
+
+    def __init__(self):
+        self._pieces = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pieces.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._pieces)
+        self._pieces.clear()
+        return data
+
+
+def _progress_key(pack_id):
+    return f"receipt-pack:{pack_id}"
+
+
+def get_pack_progress(pack_id):
+    """{'total', 'done', 'missing', 'finished'} of a pack, or None if unknown / expired."""
+    return cache.get(_progress_key(pack_id))
+
+
+def new_pack(allocations):
+    """(pack id, how many receipts it will hold) - its progress starts at 0."""
+    pack_id = uuid.uuid4().hex
+    total = allocations.count()
+    cache.set(_progress_key(pack_id), {'total': total, 'done': 0, 'missing': 0, 'finished': False},
+              timeout=PROGRESS_SECONDS)
+    return pack_id, total
+
+
+def _entry_name(allocation):
+    # Sorted by room when unzipped; matric numbers contain "/"
+    matric = allocation.student.matric_number.replace('/', '-')
+    return f"{slugify(allocation.room.room_number)}_{matric}_BU-HAMS-{allocation.allocation_id}.pdf"
+
+
+def receipt_pack_chunks(allocations, pack_id, total, on_progress=None, chunk_size=None):
+    """
+    Generator of ZIP bytes for these allocations (loaded with student,
+    room__hall and receipt, e.g. export.receipts_queryset()). on_progress(done,
+    total) is called after every receipt.
+    """
+    stream = _ZipStream()
+    missing = []
+    done = 0
+    # PDFs are already compressed inside, so this mostly shrinks the names
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as pack:
+        for batch in _batches(allocations, chunk_size or CHUNK_SIZE):
+            for allocation, pdf_bytes in receipt_pdfs_for(batch):
+                if pdf_bytes is None:
+                    missing.append(f"BU-HAMS-{allocation.allocation_id} {allocation.student.matric_number}")
+                else:
+                    pack.writestr(_entry_name(allocation), pdf_bytes)
+                done += 1
+                if on_progress is not None:
+                    on_progress(done, total)
+                if done % 25 == 0 or done == total:
+                    cache.set(_progress_key(pack_id),
+                              {'total': total, 'done': done, 'missing': len(missing), 'finished': False},
+                              timeout=PROGRESS_SECONDS)
+                data = stream.take()
+                if data:
+                    yield data
+        if missing:
+            pack.writestr('MISSING.txt', "Receipts that could not be rendered:\n" + '\n'.join(missing) + '\n')
+    # Closing the ZIP writes its table of contents
+    yield stream.take()
+    cache.set(_progress_key(pack_id), {'total': total, 'done': done, 'missing': len(missing), 'finished': True},
+              timeout=PROGRESS_SECONDS)
+
+
+def pack_filename(hall):
+    name = f"receipts-{hall.hall_name}" if hall else "receipts-campus"
+    return f"{slugify(name)}-{timezone.now():%Y%m%d-%H%M}.zip"
+
+
+def streaming_pack(request, chunks, hall, pack_id, total):
+    """Wrap receipt_pack_chunks() in a download response."""
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{pack_filename(hall)}"'
+    response['Cache-Control'] = 'no-store'
+    response['X-Accel-Buffering'] = 'no'
+    # For a progress bar: poll /api/admin/receipts/pack/progress/?pack=<id>
+    response['X-Receipt-Pack'] = pack_id
+    response['X-Receipt-Count'] = str(total)
+    return response
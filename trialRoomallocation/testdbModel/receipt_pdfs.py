@@ -0,0 +1,314 @@
+# ==================================================
+# RECEIPT_PDFS.PY - Render each receipt PDF once, then keep it on disk
+# ==================================================
+# Turning receipt_template.html into a PDF with xhtml2pdf takes hundreds of
+# milliseconds of CPU. It used to happen from scratch for every email, every
+# retry and every re-send - but a receipt never changes once it is issued.
+#
+# Now:
+#   - The finished PDF is saved under RECEIPT_PDF_DIR, named after a hash of
+#     the template and everything printed on the receipt ("content-addressed"):
+#         <RECEIPT_PDF_DIR>/<2 hex>/<sha256>.pdf
+#     The same receipt always gets the same file, so asking again is just a
+#     file read, and a changed template or detail simply makes a new file.
+#   - The file's path is recorded in the receipt row (Receipt.file_path), so
+#     it can be found from the allocation without rebuilding anything.
+#   - New PDFs are rendered in RECEIPT_RENDER_WORKERS helper processes. Each
+#     helper loads xhtml2pdf, its fonts and default CSS once when it starts and
+#     reuses them for every receipt after that; the template itself is
+#     compiled once per process (utils.receipt_template).
+#   - RECEIPT_RENDER_WORKERS=0 renders in the calling process (still cached).
+#
+# Used by the receipt outbox (outbox.process_entry) before sending the email,
+# and by hall receipt packs (receipt_packs.py), which keep every helper busy
+# at once through receipt_pdfs_for().
+
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import Receipt, ReceiptOutbox
+from .utils import html_to_pdf, receipt_template, render_receipt_html, warm_up_pdf_renderer
+
+
+PDF_DIR = Path(getattr(settings, 'RECEIPT_PDF_DIR', Path(settings.BASE_DIR) / 'receipt_pdfs'))
+RENDER_WORKERS = getattr(settings, 'RECEIPT_RENDER_WORKERS', 2)
+
+# The fields printed on a receipt (the outbox payload has these plus student_email)
+CONTEXT_FIELDS = (
+    'student_name', 'matric_number', 'hall_name', 'room_number', 'receipt_no', 'transaction_id',
+    'amount_paid', 'date', 'department', 'level', 'email',
+)
+
+_lock = threading.Lock()
+_counters = Counter()
+_pool = None
+
+
+def _bump(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+# ==================================================
+# WHERE - One file per distinct receipt
+# ==================================================
+def receipt_context(payload):
+    """The template context for a receipt, from an outbox payload (or any dict with the same keys)."""
+    return {field: '' if payload.get(field) is None else str(payload[field]) for field in CONTEXT_FIELDS}
+
+
+def _template_digest():
+    return hashlib.sha256(receipt_template().template.source.encode()).hexdigest()
+
+
+def receipt_pdf_path(context):
+    """Where the PDF for this exact receipt is (or will be) kept, relative to RECEIPT_PDF_DIR."""
+    content = json.dumps([_template_digest(), context], sort_keys=True)
+    digest = hashlib.sha256(content.encode()).hexdigest()
+    return f"{digest[:2]}/{digest}.pdf"
+
+
+def read_recorded_pdf(file_path):
+    """The bytes of a PDF recorded in Receipt.file_path, or None if it is missing."""
+    if not file_path:
+        return None
+    try:
+        return (PDF_DIR / file_path).read_bytes()
+    except OSError:
+        return None
+
+
+# ==================================================
+# RENDER - In the helper processes
+# ==================================================
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # "spawn": helpers start fresh (not as copies of a threaded worker)
+            # and only import utils.py - no database, no Django setup needed
+            _pool = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=warm_up_pdf_renderer,
+            )
+        return _pool
+
+
+def _submit(html):
+    """Start rendering `html`; returns (pool or None, future)."""
+    if RENDER_WORKERS <= 0:
+        future = Future()
+        future.set_result(html_to_pdf(html))
+        return None, future
+    pool = _get_pool()
+    try:
+        return pool, pool.submit(html_to_pdf, html)
+    except BrokenProcessPool as error:
+        future = Future()
+        future.set_exception(error)
+        return pool, future
+
+
+def _result(pool, future, html):
+    """The PDF bytes of a _submit()ted render (None if xhtml2pdf failed)."""
+    global _pool
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        # A helper died: start a new pool next time, render this one here
+        with _lock:
+            if _pool is pool:
+                _pool = None
+                _counters['pool_restarts'] += 1
+        return html_to_pdf(html)
+
+
+def _render(html):
+    return _result(*_submit(html), html)
+
+
+def _save(relative_path, pdf_bytes):
+    """Write the file atomically (readers never see half a PDF)."""
+    path = PDF_DIR / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.part')
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(pdf_bytes)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _store(relative_path, pdf_bytes, started):
+    """Keep a freshly rendered PDF (and count it); passes the bytes through."""
+    if pdf_bytes is None:
+        _bump('render_failures')
+        return None
+    _save(relative_path, pdf_bytes)
+    _bump('renders')
+    _bump('render_seconds_total', time.monotonic() - started)
+    return pdf_bytes
+
+
+def _record(allocation_id, relative_path):
+    # Only touches the row when the path is not recorded yet
+    Receipt.objects.filter(allocation__allocation_id=allocation_id).exclude(
+        file_path=relative_path
+    ).update(file_path=relative_path)
+
+
+# ==================================================
+# GET - Cached file, or render it once
+# ==================================================
+def receipt_pdf(payload, allocation_id=None):
+    """
+    PDF bytes of the receipt described by `payload` (outbox payload keys), or
+    None if it could not be rendered. Rendered at most once per distinct
+    receipt; if allocation_id is given the file is recorded on its receipt row.
+    """
+    context = receipt_context(payload)
+    relative_path = receipt_pdf_path(context)
+
+    pdf_bytes = read_recorded_pdf(relative_path)
+    if pdf_bytes is not None:
+        _bump('hits')
+    else:
+        started = time.monotonic()
+        pdf_bytes = _store(relative_path, _render(render_receipt_html(context)), started)
+        if pdf_bytes is None:
+            return None
+
+    if allocation_id is not None:
+        _record(allocation_id, relative_path)
+    return pdf_bytes
+
+
+def _recorded_pdf(allocation):
+    pdf_bytes = read_recorded_pdf(allocation.receipt.file_path if allocation.receipt else None)
+    if pdf_bytes is not None:
+        _bump('hits')
+    return pdf_bytes
+
+
+def _allocation_payload(allocation):
+    """The receipt of an allocation, built from its rows (same keys as the outbox payload)."""
+    student, receipt = allocation.student, allocation.receipt
+    return {
+        'student_name': student.full_name,
+        'matric_number': student.matric_number,
+        'hall_name': allocation.room.hall.hall_name,
+        'room_number': allocation.room.room_number,
+        'receipt_no': f"BU-HAMS-{allocation.allocation_id}",
+        'transaction_id': receipt.payment_reference if receipt else 'N/A',
+        'amount_paid': receipt.amount_paid if receipt else 0,
+        'date': allocation.allocation_date.strftime('%B %d, %Y') if allocation.allocation_date else '',
+        'department': student.department,
+        'level': student.level,
+        'email': student.email,
+    }
+
+
+def allocation_receipt_pdf(allocation):
+    """
+    The receipt PDF of an allocation (loaded with student, room__hall and
+    receipt): the recorded file if there is one, else the receipt exactly as it
+    was emailed (its outbox payload), else one built from the allocation.
+    """
+    recorded = _recorded_pdf(allocation)
+    if recorded is not None:
+        return recorded
+    return receipt_pdf(_emailed_payload(allocation), allocation.allocation_id)
+
+
+def _emailed_payload(allocation):
+    payload = ReceiptOutbox.objects.filter(allocation=allocation).values_list('payload', flat=True).first()
+    return payload or _allocation_payload(allocation)
+
+
+def allocation_receipt_file(allocation):
+    """
+    Where the allocation's receipt PDF is kept (relative to RECEIPT_PDF_DIR),
+    rendering it first if it isn't on disk yet. None if it can't be rendered.
+    Used by the download endpoint, which hands out the file itself.
+    """
+    recorded = allocation.receipt.file_path if allocation.receipt else None
+    if recorded and (PDF_DIR / recorded).is_file():
+        return recorded
+    payload = _emailed_payload(allocation)
+    if receipt_pdf(payload, allocation.allocation_id) is None:
+        return None
+    return receipt_pdf_path(receipt_context(payload))
+
+
+def receipt_pdfs_for(allocations):
+    """
+    Yield (allocation, PDF bytes or None) for a list of allocations (loaded
+    like allocation_receipt_pdf's), in the same order. Files already on disk
+    are read; the rest are rendered by ALL the helpers at once, at most
+    2 x RECEIPT_RENDER_WORKERS at a time so memory stays small.
+    """
+    ids = [allocation.allocation_id for allocation in allocations if allocation.receipt is None
+           or not allocation.receipt.file_path]
+    # One query for every emailed payload in the list
+    payloads = dict(ReceiptOutbox.objects.filter(allocation_id__in=ids).values_list('allocation_id', 'payload'))
+    window = max(RENDER_WORKERS, 1) * 2
+    pending = deque()  # (allocation, ready bytes or None, render job or None)
+
+    def finish(allocation, ready, job):
+        if job is None:
+            return allocation, ready
+        relative_path, pool, future, html, started = job
+        pdf_bytes = _store(relative_path, _result(pool, future, html), started)
+        if pdf_bytes is not None:
+            _record(allocation.allocation_id, relative_path)
+        return allocation, pdf_bytes
+
+    for allocation in allocations:
+        ready, job = _recorded_pdf(allocation), None
+        if ready is None:
+            context = receipt_context(payloads.get(allocation.allocation_id) or _allocation_payload(allocation))
+            relative_path = receipt_pdf_path(context)
+            ready = read_recorded_pdf(relative_path)
+            if ready is not None:
+                _bump('hits')
+                _record(allocation.allocation_id, relative_path)
+            else:
+                html = render_receipt_html(context)
+                job = (relative_path, *_submit(html), html, time.monotonic())
+        pending.append((allocation, ready, job))
+        # Hand back finished receipts in order while the helpers work on the rest
+        while pending and (len(pending) > window or pending[0][2] is None or pending[0][2][2].done()):
+            yield finish(*pending.popleft())
+
+    while pending:
+        yield finish(*pending.popleft())
+
+
+def get_receipt_pdf_metrics():
+    with _lock:
+        counters = dict(_counters)
+    renders = counters.get('renders', 0)
+    return {
+        'workers': RENDER_WORKERS,
+        'hits': counters.get('hits', 0),
+        'renders': renders,
+        'render_failures': counters.get('render_failures', 0),
+        'average_render_ms': (
+            round(counters.get('render_seconds_total', 0.0) / renders * 1000, 1) if renders else None
+        ),
+        'pool_restarts': counters.get('pool_restarts', 0),
+    }
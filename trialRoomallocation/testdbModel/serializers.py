@@ -6,22 +6,43 @@
 # into JSON format (which phones and websites understand easily)
 
 from rest_framework import serializers
+from django.db.models import Prefetch
 from .models import Hall,Student,Admin,Allocation,Room,Payment
 
+# ==================================================
+# SPARSE FIELDS - Send only the fields that were asked for
+# ==================================================
+# MySerializer(rows, many=True, fields=['full_name', 'level']) drops every other
+# field. Used by the list endpoints' ?fields= option (see listing.py).
+class SparseFieldsMixin:
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 # ==================================================
 # HALL SERIALIZER - Converts hostel hall info to JSON
 # ==================================================
 # This takes info about a hostel building and makes it easy to send over the internet
-class HallSerializer(serializers.ModelSerializer):
+class HallSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # available_rooms: Read from the hall summary row (the hall's own column is
+    # no longer kept up to date); load halls with their summary joined/prefetched
+    available_rooms = serializers.SerializerMethodField()
+
     class Meta:
         model = Hall  # Which database table to get info from
         fields = "__all__"  # Send ALL the information about the hall
 
+    def get_available_rooms(self, obj):
+        summary = getattr(obj, 'summary', None)
+        return summary.rooms_available if summary else obj.available_rooms
+
 # ==================================================
 # STUDENT SERIALIZER - Converts student info to JSON
 # ==================================================
 # This translates student information for the internet
-class StudentSerializer(serializers.ModelSerializer): 
+class StudentSerializer(SparseFieldsMixin, serializers.ModelSerializer): 
 
     class Meta:
         model = Student  # Get data from the Student table
@@ -37,7 +58,7 @@ class StudentSerializer(serializers.ModelSerializer):
 # ADMIN SERIALIZER - Converts admin info to JSON
 # ==================================================
 # This translates administrator information
-class AdminSerializer(serializers.ModelSerializer):
+class AdminSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Admin  # Get data from the Admin table
@@ -51,7 +72,7 @@ class AdminSerializer(serializers.ModelSerializer):
 # PAYMENT SERIALIZER - Converts payment info to JSON
 # ==================================================
 # This translates payment records
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Payment  # Get data from the Payment table
@@ -93,39 +114,6 @@ class RoomSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at',
         ]
 
-# ==================================================
-# STUDENT ROOM SERIALIZER - Room info for students (no occupant names)
-# ==================================================
-# Shows room availability without revealing who is in each room
-class StudentRoomSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Room
-        fields = ['room_id', 'room_number', 'capacity', 'current_occupants', 'room_status']
-
-        
-# ==================================================
-# STUDENT DASHBOARD SERIALIZER - Special view for students
-# ==================================================
-# This creates a customized view of student info for their dashboard
-class StudentDashboardSerializer(serializers.ModelSerializer):
-    # matriculation_number: Gets the student's matric number from the database
-    # source='matric_number' tells Django: "Get data from the DB column 'matric_number'"
-    # read_only=True means students can see it but can't change it
-    matriculation_number = serializers.CharField(source='matric_number', read_only=True)
-    
-    # room_details: Gets full information about the student's room
-    # source='room' means get it from the room field
-    # allow_null=True means it's okay if the student doesn't have a room yet
-    room_details = RoomSerializer(source='room', read_only=True, allow_null=True)
-    
-    # hall_details: Gets full information about the selected hall
-    hall_details = HallSerializer(source='hall_selected', read_only=True, allow_null=True)
-    
-    class Meta:
-        model = Student  # Get data from Student table
-        # Only send these specific fields to the student dashboard
-        fields = ['full_name', 'matriculation_number', 'level', 'payment_status', 'department', 'room_details', 'hall_details']
-
 # ==================================================
 # ADMIN DASHBOARD SERIALIZERS - Special views for admins
 # ==================================================
@@ -176,10 +164,18 @@ class HallStatsSerializer(serializers.ModelSerializer):
     rooms_under_maintenance = serializers.SerializerMethodField()
     true_available_beds = serializers.SerializerMethodField()
 
+    # available_rooms: Rooms that can still be booked (from the hall summary row)
+    available_rooms = serializers.SerializerMethodField()
+
+    # changes_cursor: The hall summary version this data was read at
+    # (GET /api/admin/dashboard/changes/?since=<changes_cursor> returns what changed after it)
+    changes_cursor = serializers.SerializerMethodField()
+
 
     class Meta:
         model = Hall  # Get data from Hall table
         fields = [
+            'hall_id',  # Which hall (used to watch it for live updates)
             'hall_name',  # Name of the hall
             'gender',  # Is it for males or females?
             'total_rooms',  # Total number of rooms
@@ -188,12 +184,31 @@ class HallStatsSerializer(serializers.ModelSerializer):
             'true_available_beds',  # NEW: True available beds
             'total_students_in_hall',  # Total students in the hall (calculated)
             'occupancy_rate',  # Percentage of beds filled (calculated)
+            'changes_cursor',  # Hall version - ask for changes since this later
             'rooms'  # List of all rooms with their details
         ]
 
+    # The numbers below are read from the hall's summary row (HallSummary, kept up
+    # to date by occupancy.py) instead of being counted again on every refresh.
+    # A hall without a summary row yet falls back to adding up its rooms.
+    def _summary(self, obj):
+        # Missing reverse one-to-one raises an AttributeError subclass, so getattr works
+        return getattr(obj, 'summary', None)
+
+    def get_changes_cursor(self, obj):
+        summary = self._summary(obj)
+        return summary.version if summary else None
+
+    def get_available_rooms(self, obj):
+        summary = self._summary(obj)
+        return summary.rooms_available if summary else obj.available_rooms
+
     # HOW TO COUNT: total students in the hall
     # This adds up all the students in all the rooms
     def get_total_students_in_hall(self, obj):
+        summary = self._summary(obj)
+        if summary:
+            return summary.beds_occupied
         # For each room in the hall, get its current_occupants and add them all up
         return sum(room.current_occupants for room in obj.room_set.all())
 
@@ -201,7 +216,11 @@ class HallStatsSerializer(serializers.ModelSerializer):
     # This figures out what percentage of the hall is full
     def get_occupancy_rate(self, obj):
         # Step 1: Add up the capacity of all rooms to get total beds available
-        total_capacity = sum(room.capacity for room in obj.room_set.all())
+        summary = self._summary(obj)
+        if summary:
+            total_capacity = summary.beds_total
+        else:
+            total_capacity = sum(room.capacity for room in obj.room_set.all())
         
         # Step 2: Get the total number of students currently in the hall
         current_occupants = self.get_total_students_in_hall(obj)
@@ -217,15 +236,47 @@ class HallStatsSerializer(serializers.ModelSerializer):
 
     # NEW: Show beds that are actually bookable (Not Full AND Not Broken)
     def get_true_available_beds(self, obj):
-        rooms = obj.room_set.filter(is_under_maintenance=False)
+        summary = self._summary(obj)
+        if summary:
+            return summary.beds_available
+        rooms = [room for room in obj.room_set.all() if not room.is_under_maintenance]
         total_cap = sum(room.capacity for room in rooms)
         current = sum(room.current_occupants for room in rooms)
         return total_cap - current
 
     # NEW: Count rooms currently under maintenance
     def get_rooms_under_maintenance(self, obj):
+        summary = self._summary(obj)
+        if summary:
+            return summary.rooms_under_maintenance
         # Count how many rooms in this hall are being repaired
-        return obj.room_set.filter(is_under_maintenance=True).count()
+        return sum(1 for room in obj.room_set.all() if room.is_under_maintenance)
+
+
+# HALL TOTALS SERIALIZER - The hall numbers WITHOUT the room list
+# Sent with "changes since" answers, where only the changed rooms are included
+class HallTotalsSerializer(HallStatsSerializer):
+    class Meta(HallStatsSerializer.Meta):
+        fields = [field for field in HallStatsSerializer.Meta.fields if field != 'rooms']
+
+
+# HALL STATS QUERY - Prefetches for HallStatsSerializer
+# Every room of the hall(s) in one query and every occupant in one more
+# (the hall totals come from the hall summary row).
+def occupants_queryset():
+    """Just the student columns RoomStudentSerializer shows."""
+    return Student.objects.only(
+        'student_id', 'room_id', 'matric_number', 'full_name', 'level', 'phone_number', 'department'
+    ).order_by('student_id')
+
+
+def hall_stats_prefetches():
+    """Rooms and their occupants; also usable with prefetch_related_objects() on halls already loaded."""
+    return [
+        Prefetch('room_set', queryset=Room.objects.order_by('room_id')),
+        Prefetch('room_set__student_set', queryset=occupants_queryset()),
+    ]
+
 
 # ==================================================
 # ADMIN DASHBOARD SERIALIZER - Main dashboard view
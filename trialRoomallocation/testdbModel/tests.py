@@ -1,3 +1,1256 @@
-from django.test import TestCase
+import io
+import tempfile
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+from smtplib import SMTPException
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .admission import (
+    AdmissionError, check_ticket, describe_ticket, finish_ticket, get_queue_metrics, join_queue, process_queues,
+)
+from .allocator import REASON_NO_FREE_BEDS, REASON_NO_MATCHING_HALL, apply_plan, auto_allocate, plan_allocations
+from .announcements import claim_deliveries, process_deliveries
+from .booking import BUSY_MESSAGE, ENGINE_GUARDED, HOLD_CONFLICT_MESSAGE, BookingError, book
+from .export import RECEIPT_COLUMNS, export_chunks, receipt_row, receipts_queryset
+from .holds import active_hold_counts, place_hold, sweep_expired_holds
+from .identity import STUDENT, bump_status_version_on_commit, student_tokens
+from .inventory import clear_inventory, hall_inventory
+from .live import current_cursor, events_since
+from .models import (
+    Admin, Allocation, AnnouncementDelivery, BedHold, Hall, HallSummary, IdempotencyKey, Log, Payment, QueueTicket, ReceiptOutbox, Room,
+    Student, StudentDashboard,
+)
+from .occupancy import count_hall_totals, rebuild_hall_summaries
+from .outbox import claim_batch, enqueue_receipt_email, process_entries
+from .contention import LockRetriesExhausted, classify_lock_error, get_contention_metrics, run_with_retry
+from . import admission, audit, booking, contention, live, mailer, outbox, passwords, receipt_downloads, receipt_pdfs
+
+
+# ==================================================
+# UNMANAGED TABLES - Create them for the test database
+# ==================================================
+# Most models are managed=False (the real tables come from DataBaseForProject.sql),
+# so the test runner doesn't create them. Create them once per test class.
+# Audit entries are written at once here: the background writer has its own
+# database connection, which can't see (or would lock) the test's transaction.
+class UnmanagedTablesMixin:
+    @classmethod
+    def setUpClass(cls):
+        cls.unmanaged_models = [
+            model for model in apps.get_app_config('testdbModel').get_models()
+            if not model._meta.managed
+        ]
+        with connection.schema_editor() as editor:
+            for model in cls.unmanaged_models:
+                editor.create_model(model)
+        cls.audit_async, audit.ASYNC = audit.ASYNC, False
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        audit.ASYNC = cls.audit_async
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.unmanaged_models):
+                editor.delete_model(model)
+
+
+class UnmanagedTablesTestCase(UnmanagedTablesMixin, TestCase):
+    # Shared setup: a hall with its porter, rooms, and students who have booked
+    def create_hall(self):
+        self.hall = Hall.objects.create(
+            hall_name='Test Hall', gender='Male', total_rooms=0, available_rooms=0,
+            hall_description='Test hall',
+        )
+        Admin.objects.create(name='Porter', email='porter@example.com', password='!', hall=self.hall)
+        self.room_count = 0
+        return self.hall
+
+    def add_rooms(self, count, occupants=2, capacity=4, under_maintenance=False):
+        now = timezone.now()
+        for _ in range(count):
+            self.room_count += 1
+            room = Room.objects.create(
+                hall=self.hall, room_number=f"R{self.room_count:03d}", capacity=capacity,
+                current_occupants=occupants, room_status='Occupied',
+                is_under_maintenance=under_maintenance, created_at=now,
+            )
+            for bed in range(occupants):
+                Student.objects.create(
+                    matric_number=f"T/{self.room_count:03d}/{bed}", full_name=f"Student {bed}",
+                    email=f"s{self.room_count}-{bed}@example.com", password='!', level='100',
+                    gender='Male', payment_status='Verified', room=room, hall_selected=self.hall,
+                    created_at=now,
+                )
+
+    def add_student(self, matric, **fields):
+        """A verified student without a room (fields override the defaults)."""
+        values = dict(
+            full_name=f"Student {matric}", email=f"{matric.replace('/', '-').lower()}@example.com",
+            password='!', level='100', gender='Male', payment_status='Verified', created_at=timezone.now(),
+        )
+        values.update(fields)
+        return Student.objects.create(matric_number=matric, **values)
+
+    def book_new_students(self, prefix, room, count=1):
+        """Create `count` verified students T/<prefix>/<n> and book each of them into `room`."""
+        matrics = [f"T/{prefix}/{number}" for number in range(count)]
+        for matric in matrics:
+            self.add_student(matric)
+            book(matric, room.hall_id, room.room_id)
+        return matrics
+
+
+# ==================================================
+# RECEIPT OUTBOX - Emails queued with the booking, sent and retried by workers
+# ==================================================
+class ReceiptOutboxTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.create_hall()
+        self.add_rooms(1, occupants=0, capacity=4)
+        self.room = Room.objects.get(hall=self.hall)
+
+    def test_one_email_per_booking_and_failed_sends_are_retried(self):
+        [matric] = self.book_new_students('OUT', self.room)
+        entry = ReceiptOutbox.objects.select_related('allocation').get()
+        self.assertEqual(entry.payload['matric_number'], matric)
+        # Queuing the same allocation again doesn't add a second email
+        enqueue_receipt_email(entry.allocation, entry.payload)
+        self.assertEqual(ReceiptOutbox.objects.count(), 1)
+
+        render, send, throttle = outbox.receipt_pdf, outbox.send_messages, mailer._throttle
+        outbox.receipt_pdf = lambda payload, allocation_id=None: b'%PDF-test'
+        outbox.send_messages = lambda messages: [SMTPException('mail server down')] * len(messages)
+        mailer._throttle = mailer._Throttle(0)
+        try:
+            with self.assertLogs('testdbModel.outbox', 'WARNING'):
+                self.assertEqual(process_entries(claim_batch('w1'), 'w1'), 0)
+            entry.refresh_from_db()
+            self.assertEqual((entry.status, entry.attempts), (ReceiptOutbox.STATUS_PENDING, 1))
+            self.assertIn('mail server down', entry.last_error)
+            self.assertGreater(entry.next_attempt_at, timezone.now())
+            self.assertEqual(claim_batch('w1'), [])  # Backing off, not due yet
+
+            # The server is back and the retry is due
+            outbox.send_messages = send
+            ReceiptOutbox.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(process_entries(claim_batch('w1'), 'w1'), 1)
+        finally:
+            outbox.receipt_pdf, outbox.send_messages, mailer._throttle = render, send, throttle
+            mailer.close_connection()
+
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), (ReceiptOutbox.STATUS_SENT, 2, None))
+        self.assertEqual([message.to for message in mail.outbox], [[entry.payload['student_email']]])
+
+    def test_lost_lease_counts_as_an_attempt(self):
+        self.book_new_students('LEASE', self.room)
+        entry = ReceiptOutbox.objects.get()
+        crashed_at = timezone.now() - timedelta(seconds=outbox.LEASE_SECONDS + 1)
+        # Its worker claimed it and died, MAX_ATTEMPTS - 2 runs so far
+        ReceiptOutbox.objects.filter(pk=entry.pk).update(
+            status=ReceiptOutbox.STATUS_PROCESSING, locked_at=crashed_at, locked_by='dead',
+            attempts=outbox.MAX_ATTEMPTS - 2,
+        )
+
+        [reclaimed] = claim_batch('w1')
+        self.assertEqual(reclaimed.attempts, outbox.MAX_ATTEMPTS - 1)
+        self.assertEqual(ReceiptOutbox.objects.get(pk=entry.pk).attempts, outbox.MAX_ATTEMPTS - 1)
+
+        # ...and this worker dies on it too: the last lost lease gives up on the entry
+        ReceiptOutbox.objects.filter(pk=entry.pk).update(locked_at=crashed_at)
+        self.assertEqual(claim_batch('w2'), [])
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, ReceiptOutbox.STATUS_FAILED)
+        self.assertEqual(entry.attempts, outbox.MAX_ATTEMPTS)
+        self.assertIsNone(entry.locked_by)
+
+
+# ==================================================
+# GUARDED BOOKING - One conditional UPDATE claims the bed, or nothing changes
+# ==================================================
+class GuardedBookingTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.create_hall()
+        self.add_rooms(1, occupants=1, capacity=2)
+        self.room = Room.objects.get(hall=self.hall)
+
+    def assert_refused(self, matric, message, status_code=400):
+        with self.assertRaises(BookingError) as refused:
+            book(matric, self.hall.hall_id, self.room.room_id, engine=ENGINE_GUARDED)
+        self.assertEqual((refused.exception.message, refused.exception.status_code), (message, status_code))
+        # The student claim was rolled back with the failed bed claim
+        self.assertIsNone(Student.objects.get(matric_number=matric).room_id)
+
+    def test_last_bed_goes_to_one_student_only(self):
+        self.add_student('G/1')
+        self.add_student('G/2')
+        result = book('G/1', self.hall.hall_id, self.room.room_id, engine=ENGINE_GUARDED)
+        self.assertEqual(result.room.current_occupants, 2)
+        self.assertEqual(result.room.room_status, 'Full')
+
+        self.assert_refused('G/2', "This room is already full")
+        self.assertEqual(Room.objects.get(pk=self.room.pk).current_occupants, 2)
+        self.assertEqual(Allocation.objects.count(), 1)
+
+    def test_bed_held_by_someone_else_or_maintenance_is_refused(self):
+        holder = self.add_student('G/3')
+        self.add_student('G/4')
+        now = timezone.now()
+        BedHold.objects.create(
+            student=holder, room=self.room, hall=self.hall, expires_at=now + timedelta(minutes=2), created_at=now,
+        )
+        self.assert_refused('G/4', HOLD_CONFLICT_MESSAGE, 409)
+
+        # The holder may still book their own bed
+        book('G/3', self.hall.hall_id, self.room.room_id, engine=ENGINE_GUARDED)
+
+        Room.objects.filter(pk=self.room.pk).update(is_under_maintenance=True, current_occupants=0)
+        self.assert_refused('G/4', "This room is under maintenance")
+
+    def test_hall_summary_is_locked_last(self):
+        for engine in (booking.ENGINE_LOCKING, ENGINE_GUARDED):
+            matric = f"G/{engine}"
+            self.add_student(matric)
+            Room.objects.filter(pk=self.room.pk).update(current_occupants=0)
+            with CaptureQueriesContext(connection) as queries:
+                book(matric, self.hall.hall_id, self.room.room_id, engine=engine)
+            writes = [
+                q['sql'] for q in queries.captured_queries
+                if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+            ]
+            # Everything else is written before the hall-wide row is touched
+            first_summary_write = next(i for i, sql in enumerate(writes) if '"hall_summary"' in sql)
+            self.assertTrue(
+                all('"hall_summary"' in sql or '"hall_change"' in sql for sql in writes[first_summary_write:]),
+                writes[first_summary_write:],
+            )
+            self.assertTrue(any('"allocation"' in sql for sql in writes[:first_summary_write]))
+
+
+# ==================================================
+# AUTO-ALLOCATOR - Plan in memory, then write it in chunks
+# ==================================================
+class AutoAllocatorTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        clear_inventory()
+        self.create_hall()
+        self.add_rooms(2, occupants=0, capacity=2)
+        rebuild_hall_summaries()
+        for number in range(5):
+            self.add_student(f"A/{number}")
+        self.add_student('A/F', gender='Female')  # No female hall
+
+    def test_dry_run_only_plans(self):
+        with CaptureQueriesContext(connection) as queries:
+            summary = auto_allocate(dry_run=True)
+        self.assertEqual(summary['plan']['planned_allocations'], 4)
+        self.assertEqual(summary['plan']['unallocated'], {REASON_NO_FREE_BEDS: 1, REASON_NO_MATCHING_HALL: 1})
+        self.assertNotIn('result', summary)
+        self.assertEqual([query['sql'] for query in queries if not query['sql'].startswith('SELECT')], [])
+        self.assertFalse(Allocation.objects.exists())
+
+    def test_apply_writes_the_plan_and_skips_students_who_booked_meanwhile(self):
+        plan = plan_allocations()
+        first_room = plan.assignments[0][1]
+        book('A/0', self.hall.hall_id, first_room.room_id)  # Booked by hand after planning
+
+        result = apply_plan(plan).summary()
+        self.assertEqual(result, {'allocated': 3, 'skipped_conflicts': 1, 'per_hall': {'Test Hall': 3}})
+        self.assertEqual(Allocation.objects.count(), 4)
+        self.assertEqual(ReceiptOutbox.objects.count(), 4)
+        self.assertEqual(sorted(Room.objects.values_list('current_occupants', flat=True)), [2, 2])
+        self.assertEqual(
+            sorted(Student.objects.filter(room__isnull=True).values_list('matric_number', flat=True)), ['A/4', 'A/F']
+        )
+
+
+# ==================================================
+# BED HOLDS - A few minutes to book a bed nobody else can take
+# ==================================================
+class BedHoldTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+        self.add_rooms(2, occupants=1, capacity=2)  # One free bed in each
+        self.rooms = list(Room.objects.filter(hall=self.hall).order_by('room_id'))
+        self.add_student('H/1')
+        self.add_student('H/2')
+
+    def hold(self, matric, room):
+        return self.client.post('/api/rooms/hold/', {
+            'hall_id': self.hall.hall_id, 'room_id': room.room_id, 'matriculation_number': matric,
+        })
+
+    def test_held_last_bed_is_a_409_for_others_until_the_hold_expires(self):
+        self.assertEqual(self.hold('H/1', self.rooms[0]).status_code, 201)
+        refused = self.hold('H/2', self.rooms[0])
+        self.assertEqual((refused.status_code, refused.data['error']), (409, HOLD_CONFLICT_MESSAGE))
+        with self.assertRaises(BookingError) as booking:
+            book('H/2', self.hall.hall_id, self.rooms[0].room_id)
+        self.assertEqual(booking.exception.status_code, 409)
+        self.assertEqual(active_hold_counts(self.hall.hall_id), {self.rooms[0].room_id: 1})
+
+        # Time's up: the hold stops counting straight away, and is swept later
+        BedHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(active_hold_counts(self.hall.hall_id), {})
+        self.assertEqual(self.hold('H/2', self.rooms[0]).status_code, 201)
+        self.assertEqual(sweep_expired_holds(), 1)
+        self.assertEqual(list(BedHold.objects.values_list('student__matric_number', flat=True)), ['H/2'])
+
+    def test_new_hold_replaces_the_old_one_and_booking_uses_it_up(self):
+        self.assertEqual(self.hold('H/1', self.rooms[0]).status_code, 201)
+        self.assertEqual(self.hold('H/1', self.rooms[1]).status_code, 201)
+        self.assertEqual(list(BedHold.objects.values_list('room_id', flat=True)), [self.rooms[1].room_id])
+
+        book('H/1', self.hall.hall_id, self.rooms[1].room_id)
+        self.assertFalse(BedHold.objects.exists())
+        self.assertEqual(self.hold('H/1', self.rooms[0]).data['error'], "Student already has a room")
+
+
+# ==================================================
+# BOOKING QUEUE - Tickets, admission slots and "come back later"
+# ==================================================
+class BookingQueueTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+        for number in range(3):
+            self.add_student(f"Q/{number}")
+        admission.SLOTS_PER_HALL, self.slots = 1, admission.SLOTS_PER_HALL
+
+    def tearDown(self):
+        admission.SLOTS_PER_HALL = self.slots
+
+    def test_polling_only_reads_and_expired_slots_are_handed_on(self):
+        first = join_queue('Q/0', self.hall.hall_id)
+        second = join_queue('Q/1', self.hall.hall_id)
+        self.assertEqual((first.status, second.status), (QueueTicket.STATUS_ADMITTED, QueueTicket.STATUS_WAITING))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/queue/status/', {'token': second.token})
+        self.assertEqual((response.data['status'], response.data['position']), ('waiting', 1))
+        self.assertEqual([query['sql'] for query in queries if not query['sql'].startswith('SELECT')], [])
+        hall_table = connection.ops.quote_name(Hall._meta.db_table)
+        self.assertFalse([query for query in queries if f"FROM {hall_table}" in query['sql']])
+
+        # Q/0's window runs out: they're shown as expired, and the periodic run hands the slot on
+        QueueTicket.objects.filter(pk=first.pk).update(expires_at=timezone.now())
+        self.assertEqual(describe_ticket(check_ticket(first.token))['status'], QueueTicket.STATUS_EXPIRED)
+        self.assertEqual(process_queues(), {self.hall.hall_id: 1})
+        self.assertEqual(check_ticket(second.token).status, QueueTicket.STATUS_ADMITTED)
+        self.assertEqual(QueueTicket.objects.get(pk=first.pk).status, QueueTicket.STATUS_EXPIRED)
+
+        # Booking frees the slot at once
+        finish_ticket('Q/1')
+        self.assertEqual(join_queue('Q/2', self.hall.hall_id).status, QueueTicket.STATUS_ADMITTED)
+
+    def test_students_not_admitted_get_429_with_retry_after(self):
+        self.add_rooms(1, occupants=0, capacity=2)
+        booking = {'hall_id': self.hall.hall_id, 'room_id': Room.objects.get(hall=self.hall).room_id,
+                   'matriculation_number': 'Q/1'}
+        admission.ENABLED, enabled = True, admission.ENABLED
+        try:
+            no_ticket = self.client.post('/api/rooms/hold/', booking)
+            join_queue('Q/0', self.hall.hall_id)
+            join_queue('Q/1', self.hall.hall_id)
+            not_yet = self.client.post('/api/bookRoom/', booking)
+        finally:
+            admission.ENABLED = enabled
+
+        self.assertEqual((no_ticket.status_code, no_ticket['Retry-After']), (429, '1'))
+        self.assertTrue(no_ticket.data['queue_required'])
+        self.assertEqual(not_yet.status_code, 429)
+        self.assertEqual(not_yet['Retry-After'], str(not_yet.data['retry_after']))
+        self.assertEqual(not_yet.data['queue']['position'], 1)
+        self.assertIsNone(Student.objects.get(matric_number='Q/1').room_id)
+
+    def test_full_queue_is_refused_and_abandoned_tickets_expire(self):
+        join_queue('Q/0', self.hall.hall_id)
+        waiting = join_queue('Q/1', self.hall.hall_id)
+        admission.MAX_WAITING_PER_HALL, limit = 1, admission.MAX_WAITING_PER_HALL
+        try:
+            with self.assertRaises(AdmissionError):
+                join_queue('Q/2', self.hall.hall_id)
+            full = self.client.post('/api/queue/join/', {'matriculation_number': 'Q/2', 'hall_id': self.hall.hall_id})
+        finally:
+            admission.MAX_WAITING_PER_HALL = limit
+        self.assertEqual((full.status_code, full['Retry-After']), (429, str(admission.DEFAULT_TURN_SECONDS)))
+
+        # Q/1 closed the tab and stopped asking: their ticket is dropped
+        QueueTicket.objects.filter(pk=waiting.pk).update(
+            last_seen_at=timezone.now() - timedelta(seconds=admission.ABANDON_SECONDS + 1)
+        )
+        process_queues()
+        self.assertEqual(check_ticket(waiting.token).status, QueueTicket.STATUS_EXPIRED)
+        self.assertEqual(get_queue_metrics()['halls'][self.hall.hall_id]['waiting'], 0)
+
+
+# ==================================================
+# IDEMPOTENCY-KEY - A retried booking gets the first answer back
+# ==================================================
+class IdempotencyKeyTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+        self.add_rooms(2, occupants=0, capacity=2)
+        self.rooms = list(Room.objects.filter(hall=self.hall).order_by('room_id'))
+        self.add_student('I/1')
+
+    def book_room(self, key, room):
+        return self.client.post('/api/bookRoom/', {
+            'hall_id': self.hall.hall_id, 'room_id': room.room_id, 'matriculation_number': 'I/1',
+        }, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_is_replayed_and_a_reused_key_is_a_422(self):
+        first = self.book_room('retry-1', self.rooms[0])
+        self.assertEqual(first.status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            again = self.book_room('retry-1', self.rooms[0])
+        self.assertEqual((again.status_code, again.data), (200, first.data))
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        # Answered from the stored key: no locks, no booking
+        touched = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertTrue(all('idempotency_key' in sql for sql in touched), touched)
+        self.assertEqual(Allocation.objects.count(), 1)
+
+        other = self.book_room('retry-1', self.rooms[1])
+        self.assertEqual(other.status_code, 422)
+
+    def test_same_key_from_two_students_books_both(self):
+        self.add_student('I/2')
+        answers = []
+        for matric in ('I/1', 'I/2'):
+            client = APIClient()
+            access = student_tokens(Student.objects.get(matric_number=matric))['access']
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+            # Same key and same body: the matric number comes from each token
+            answers.append(client.post('/api/bookRoom/', {
+                'hall_id': self.hall.hall_id, 'room_id': self.rooms[0].room_id, 'matriculation_number': 'ignored',
+            }, HTTP_IDEMPOTENCY_KEY='shared-key'))
+        self.assertEqual([answer.status_code for answer in answers], [200, 200])
+        self.assertFalse(answers[1].has_header('Idempotent-Replayed'))
+        self.assertEqual(Allocation.objects.count(), 2)
+        self.assertEqual(
+            sorted(IdempotencyKey.objects.values_list('owner', flat=True)), ['student:I/1', 'student:I/2'],
+        )
+
+    def test_key_still_in_flight_is_a_409(self):
+        self.book_room('retry-2', self.rooms[0])
+        # As if the first request were still running
+        IdempotencyKey.objects.filter(key='retry-2').update(
+            status=IdempotencyKey.STATUS_IN_PROGRESS, created_at=timezone.now(),
+        )
+        busy = self.book_room('retry-2', self.rooms[0])
+        self.assertEqual((busy.status_code, busy['Retry-After']), (409, '1'))
+        self.assertEqual(Allocation.objects.count(), 1)
+
+
+# ==================================================
+# DEADLOCK RETRY - Lock errors are retried, then answered with a 503
+# ==================================================
+# A TransactionTestCase runs in autocommit like a real request (inside the
+# TestCase transaction run_with_retry would only try once)
+class DeadlockRetryTests(UnmanagedTablesMixin, TransactionTestCase):
+    def setUp(self):
+        self.retry_base = contention.RETRY_BASE_SECONDS
+        contention.RETRY_BASE_SECONDS = 0
+
+    def tearDown(self):
+        contention.RETRY_BASE_SECONDS = self.retry_base
+
+    def test_lock_errors_are_classified(self):
+        self.assertEqual(classify_lock_error(OperationalError(1213, "Deadlock found when trying to get lock")), 'deadlock')
+        self.assertEqual(classify_lock_error(OperationalError(1205, "Lock wait timeout exceeded")), 'lock_timeout')
+        self.assertEqual(classify_lock_error(OperationalError("database is locked")), 'lock_timeout')
+        self.assertIsNone(classify_lock_error(OperationalError(2006, "MySQL server has gone away")))
+        self.assertIsNone(classify_lock_error(ValueError("deadlock")))
+
+    def test_deadlock_is_retried_until_it_succeeds(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError(1213, "Deadlock found when trying to get lock")
+            return 'booked'
+
+        self.assertEqual(run_with_retry(flaky, hall_id=9701, room_id=9701, max_attempts=4), 'booked')
+        counters = get_contention_metrics()['halls'][9701]['counters']
+        self.assertEqual((counters['attempts'], counters['deadlock'], counters['retries']), (3, 2, 2))
+
+        # Anything that isn't a lock error is not retried
+        def broken():
+            calls.append(1)
+            raise OperationalError(2006, "MySQL server has gone away")
+
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            run_with_retry(broken, max_attempts=4)
+        self.assertEqual(len(calls), 1)
+
+    def test_student_gets_503_when_retries_run_out(self):
+        def always_deadlocks(matric, hall_id, room_id):
+            raise OperationalError(1213, "Deadlock found when trying to get lock")
+
+        with self.assertRaises(LockRetriesExhausted), self.assertLogs('testdbModel.contention', 'WARNING'):
+            run_with_retry(lambda: always_deadlocks('D/1', 9702, 9702), hall_id=9702, max_attempts=2)
+
+        original = booking.book_with_locks
+        booking.book_with_locks = always_deadlocks
+        try:
+            with self.assertRaises(BookingError) as busy, self.assertLogs('testdbModel.contention', 'WARNING') as logs:
+                book('D/1', 9703, 9703, engine=booking.ENGINE_LOCKING)
+        finally:
+            booking.book_with_locks = original
+        self.assertIn("Giving up after 4 attempts", logs.output[0])
+        self.assertEqual((busy.exception.message, busy.exception.status_code), (BUSY_MESSAGE, 503))
+        self.assertEqual(get_contention_metrics()['halls'][9703]['counters']['gave_up'], 1)
+
+
+# ==================================================
+# ADMIN DASHBOARD - The query count must not grow with the hall
+# ==================================================
+class AdminDashboardQueryCountTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+
+    def fetch_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/admin/dashboard/', {'email': 'porter@example.com'})
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_query_count_is_constant(self):
+        self.add_rooms(2)
+        _data, small_hall_queries = self.fetch_dashboard()
+
+        self.add_rooms(30)
+        data, large_hall_queries = self.fetch_dashboard()
+
+        self.assertEqual(large_hall_queries, small_hall_queries)
+        self.assertLessEqual(large_hall_queries, 4)
+        self.assertEqual(len(data['hall_details']['rooms']), 32)
+
+    def test_totals_match_rooms(self):
+        self.add_rooms(3, occupants=2, capacity=4)
+        self.add_rooms(1, occupants=1, capacity=2, under_maintenance=True)
+
+        data, _queries = self.fetch_dashboard()
+        hall = data['hall_details']
+
+        self.assertEqual(hall['total_students_in_hall'], 7)
+        self.assertEqual(hall['occupancy_rate'], '50%')
+        self.assertEqual(hall['true_available_beds'], 6)
+        self.assertEqual(hall['rooms_under_maintenance'], 1)
+        self.assertEqual(sum(len(room['occupants_list']) for room in hall['rooms']), 7)
+
+    def test_summary_row_follows_bookings_and_maintenance(self):
+        self.add_rooms(3, occupants=1, capacity=2)
+        rebuild_hall_summaries()
+        _data, queries_with_summary = self.fetch_dashboard()
+        self.assertLessEqual(queries_with_summary, 4)
+
+        rooms = list(Room.objects.filter(hall=self.hall).order_by('room_id'))
+        self.book_new_students('NEW', rooms[0])
+        response = self.client.patch(
+            f'/api/rooms/{rooms[1].room_id}/toggle-maintenance/', QUERY_STRING='email=porter@example.com'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        summary = HallSummary.objects.get(hall=self.hall)
+        counted = count_hall_totals([self.hall.hall_id])[self.hall.hall_id]
+        self.assertEqual({field: getattr(summary, field) for field in counted}, counted)
+        self.assertEqual(summary.rooms_available, 1)
+        self.assertEqual(summary.beds_available, 1)
+        self.assertEqual(rebuild_hall_summaries(), [])
+
+    def test_unchanged_dashboard_answers_not_modified(self):
+        self.add_rooms(2, occupants=1, capacity=2)
+        rebuild_hall_summaries()
+        first = self.client.get('/api/admin/dashboard/', {'email': 'porter@example.com'})
+        etag = first['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.get('/api/admin/dashboard/', {'email': 'porter@example.com'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(len(queries), 2)  # Admin + hall + summary, then the occupants' stamp
+
+        # An occupant's details changed without any booking
+        occupant = Student.objects.filter(room__hall=self.hall).first()
+        Student.objects.filter(pk=occupant.pk).update(phone_number='08000000000', updated_at=timezone.now())
+        edited = self.client.get('/api/admin/dashboard/', {'email': 'porter@example.com'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(edited.status_code, 200)
+        etag = edited['ETag']
+
+        room = Room.objects.filter(hall=self.hall).order_by('room_id').first()
+        self.client.patch(f'/api/rooms/{room.room_id}/toggle-maintenance/', QUERY_STRING='email=porter@example.com')
+        changed = self.client.get('/api/admin/dashboard/', {'email': 'porter@example.com'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_changes_since_returns_only_changed_rooms(self):
+        self.add_rooms(3, occupants=0, capacity=2)
+        rebuild_hall_summaries()
+        data, _queries = self.fetch_dashboard()
+        cursor = data['hall_details']['changes_cursor']
+
+        rooms = list(Room.objects.filter(hall=self.hall).order_by('room_id'))
+        [matric] = self.book_new_students('NEW', rooms[2])
+
+        response = self.client.get('/api/admin/dashboard/changes/', {'email': 'porter@example.com', 'since': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['full_resync'])
+        self.assertEqual([room['room_id'] for room in response.data['rooms']], [rooms[2].room_id])
+        self.assertEqual(response.data['rooms'][0]['occupants_list'][0]['matric_number'], matric)
+        self.assertEqual(response.data['hall_details']['total_students_in_hall'], 1)
+
+        again = self.client.get(
+            '/api/admin/dashboard/changes/', {'email': 'porter@example.com', 'since': response.data['changes_cursor']}
+        )
+        self.assertEqual(again.data['rooms'], [])
+
+
+
+# ==================================================
+# CONDITIONAL GET - ETags move on exactly when the answer would change
+# ==================================================
+class ConditionalGetTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.create_hall()
+        self.add_rooms(2, occupants=0, capacity=2)
+        rebuild_hall_summaries()
+        self.room = Room.objects.filter(hall=self.hall).order_by('room_id').first()
+
+    def get(self, path, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(path, params, **headers)
+
+    def free_beds(self, response):
+        return {row['room_id']: row['free_beds'] for row in response.data}
+
+    def test_available_rooms_etag_follows_holds_and_bookings(self):
+        hall_id = self.hall.hall_id
+        first = self.get('/api/available-rooms/', hall_id=hall_id)
+        self.assertEqual(self.get('/api/available-rooms/', first['ETag'], hall_id=hall_id).status_code, 304)
+
+        self.add_student('C/1')
+        place_hold('C/1', hall_id, self.room.room_id)
+        held = self.get('/api/available-rooms/', first['ETag'], hall_id=hall_id)
+        self.assertEqual(held.status_code, 200)
+        self.assertNotEqual(held['ETag'], first['ETag'])
+        self.assertEqual(self.free_beds(held)[self.room.room_id], 1)
+
+        # A booking answers 200 with the new numbers to a client holding the old ETag
+        self.add_student('C/2')
+        with self.captureOnCommitCallbacks(execute=True):
+            book('C/2', hall_id, self.room.room_id)
+        booked = self.get('/api/available-rooms/', held['ETag'], hall_id=hall_id)
+        self.assertEqual(booked.status_code, 200)
+        self.assertNotEqual(booked['ETag'], held['ETag'])
+        self.assertNotIn(self.room.room_id, self.free_beds(booked))
+
+    def test_hall_list_etag_follows_query_and_hall_rows(self):
+        first = self.get('/api/hall/')
+        etag = first['ETag']
+        self.assertEqual(self.get('/api/hall/', etag).status_code, 304)
+        # Another page / filter is another answer
+        self.assertEqual(self.get('/api/hall/', etag, gender='Male').status_code, 200)
+
+        Hall.objects.filter(pk=self.hall.pk).update(hall_description='Repainted')
+        renamed = self.get('/api/hall/', etag)
+        self.assertEqual(renamed.status_code, 200)
+
+        # available_rooms comes from the summary row, so a booking counts too
+        self.add_student('C/3')
+        book('C/3', self.hall.hall_id, self.room.room_id)
+        self.assertEqual(self.get('/api/hall/', renamed['ETag']).status_code, 200)
+
+    def test_allocation_graph_etag_follows_bookings(self):
+        first = self.get('/api/allocation-graph/', email='porter@example.com')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.get('/api/allocation-graph/', first['ETag'], email='porter@example.com').status_code, 304)
+
+        self.add_student('C/4')
+        book('C/4', self.hall.hall_id, self.room.room_id)
+        after = self.get('/api/allocation-graph/', first['ETag'], email='porter@example.com')
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(sum(day['count'] for day in after.data), 1)
+
+
+# ==================================================
+# LIVE OCCUPANCY - Committed changes pushed to dashboards, resync when behind
+# ==================================================
+class LiveOccupancyTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+        self.add_rooms(1, occupants=0, capacity=2)
+        self.room = Room.objects.get(hall=self.hall)
+
+    def test_booking_is_seen_from_the_database_after_commit_only(self):
+        hall_id = self.hall.hall_id
+        self.add_student('L/1')
+        cursor = current_cursor(hall_id)
+        published = live.get_live_metrics()['published']
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    book('L/1', hall_id, self.room.room_id)
+                    raise RuntimeError("rolled back")
+            except RuntimeError:
+                pass
+        self.assertEqual(events_since(hall_id, cursor), ([], cursor, True))
+        self.assertEqual(live.get_live_metrics()['published'], published)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book('L/1', hall_id, self.room.room_id)
+        # One event per new hall version, whichever process made the change
+        version = HallSummary.objects.get(hall=self.hall).version
+        events, current, complete = events_since(hall_id, cursor)
+        self.assertTrue(complete)
+        self.assertEqual(current, str(version))
+        self.assertEqual([(e['cursor'], e['rooms']) for e in events], [(str(version), [self.room.room_id])])
+        self.assertEqual(live.get_live_metrics()['published'], published + 1)
+
+    def test_old_or_unknown_cursors_must_resync(self):
+        hall_id = self.hall.hall_id
+        rebuild_hall_summaries([hall_id])
+        for _ in range(4):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(
+                    f'/api/rooms/{self.room.room_id}/toggle-maintenance/', QUERY_STRING='email=porter@example.com'
+                )
+        version = HallSummary.objects.get(hall=self.hall).version
+        self.assertFalse(events_since(hall_id, 'garbage')[2])
+        self.assertFalse(events_since(hall_id, str(version + 1))[2])  # Summaries were rebuilt
+
+        buffer_size = live.BUFFER_SIZE
+        live.BUFFER_SIZE = 3
+        self.addCleanup(setattr, live, 'BUFFER_SIZE', buffer_size)
+        self.assertFalse(events_since(hall_id, str(version - 4))[2])  # Too far behind
+        events, current, complete = events_since(hall_id, str(version - 3))
+        self.assertEqual((len(events), current, complete), (3, str(version), True))
+
+        HallSummary.objects.filter(hall=self.hall).update(changes_pruned_upto=version - 2)
+        self.assertFalse(events_since(hall_id, str(version - 3))[2])  # Change log pruned
+
+        # Not under ASGI: the poll answers at once and says when to ask again
+        poll = self.client.get(f'/api/halls/{hall_id}/live/poll/', {'cursor': str(version - 3)}).json()
+        self.assertEqual(
+            poll, {'cursor': str(version), 'events': [], 'resync': True, 'retry_after': live.POLL_INTERVAL_SECONDS}
+        )
+        poll = self.client.get(f'/api/halls/{hall_id}/live/poll/', {'cursor': str(version - 1)}).json()
+        self.assertEqual((poll['resync'], len(poll['events']), poll['cursor']), (False, 1, str(version)))
+        poll = self.client.get(f'/api/halls/{hall_id}/live/poll/', {'cursor': str(version)}).json()
+        self.assertEqual((poll['resync'], poll['events'], poll['cursor']), (False, [], str(version)))
+
+
+# ==================================================
+# EXPORTS - Receipts / allocations streamed in batches
+# ==================================================
+class ExportTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+
+    def test_receipt_export_streams_csv_in_batches(self):
+        self.add_rooms(1, occupants=0, capacity=4)
+        self.book_new_students('EXP', Room.objects.get(hall=self.hall), count=3)
+
+        response = self.client.get('/api/admin/export/receipts/', {'email': 'porter@example.com', 'type': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('receipt_no,full_name,matric_no'))
+        self.assertEqual([line.split(',')[2] for line in lines[1:]], ['T/EXP/0', 'T/EXP/1', 'T/EXP/2'])
+
+        # One query per batch (plus the empty one that ends it), however many rows
+        chunks = export_chunks(receipts_queryset(self.hall), receipt_row, RECEIPT_COLUMNS, 'ndjson', chunk_size=2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(list(chunks)), 3)
+        self.assertEqual(len(queries), 3)
+
+
+# ==================================================
+# AVAILABLE ROOMS CACHE - Keyed by the hall version, rebuilt once after each change
+# ==================================================
+class AvailableRoomsCacheTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+
+    def test_available_rooms_cache_follows_the_hall_version(self):
+        cache.clear()
+        self.add_rooms(2, occupants=0, capacity=2)
+        rebuild_hall_summaries()
+        room = Room.objects.filter(hall=self.hall).order_by('room_number').first()
+
+        first = self.client.get('/api/available-rooms/', {'hall_id': self.hall.hall_id})
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get('/api/available-rooms/', {'hall_id': self.hall.hall_id})
+        self.assertEqual(cached.data, first.data)
+        from_room = f"FROM {connection.ops.quote_name(Room._meta.db_table)}"
+        self.assertFalse([query for query in queries if from_room in query['sql']])
+
+        # Another process toggles maintenance: none of its on-commit hooks run here,
+        # but the hall version moved, so the old entry is not used any more
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.patch(f'/api/rooms/{room.room_id}/toggle-maintenance/', QUERY_STRING='email=porter@example.com')
+        after = self.client.get('/api/available-rooms/', {'hall_id': self.hall.hall_id})
+        self.assertEqual([row['room_id'] for row in after.data], [row['room_id'] for row in first.data][1:])
+        self.assertNotEqual(after['ETag'], first['ETag'])
+
+
+# ==================================================
+# BED INVENTORY - Patched in place after each committed change
+# ==================================================
+class BedInventoryTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+
+    def test_bed_inventory_is_patched_after_booking(self):
+        clear_inventory()
+        self.add_rooms(3, occupants=0, capacity=2)
+        rebuild_hall_summaries()
+        rooms = list(Room.objects.filter(hall=self.hall).order_by('room_number'))
+        inventory = hall_inventory(self.hall.hall_id)
+        self.assertEqual(inventory.first_free_room(beds=2), rooms[0].room_id)
+        self.assertEqual(inventory.first_free_room(beds=2, held={rooms[0].room_id: 1}), rooms[1].room_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book_new_students('INV', rooms[0])
+            self.client.patch(f'/api/rooms/{rooms[1].room_id}/toggle-maintenance/', QUERY_STRING='email=porter@example.com')
+
+        # Same copy, patched in place (no reload) and matching the database
+        self.assertIs(hall_inventory(self.hall.hall_id), inventory)
+        self.assertEqual(inventory.version, HallSummary.objects.get(hall=self.hall).version)
+        self.assertEqual(inventory.first_free_room(beds=2), rooms[2].room_id)
+        self.assertEqual(inventory.free_beds_per_block(), {'R0': 3})
+        self.assertEqual(
+            [row['room_id'] for row in inventory.rooms_with_free_beds()], [rooms[0].room_id, rooms[2].room_id]
+        )
+
+
+# ==================================================
+# RECEIPT PDFS - Rendered once, kept on disk
+# ==================================================
+class ReceiptPdfTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+
+    def test_receipt_pdf_is_rendered_once_and_recorded(self):
+        self.add_rooms(1, occupants=0, capacity=2)
+        [matric] = self.book_new_students('PDF', Room.objects.get(hall=self.hall))
+        entry = ReceiptOutbox.objects.get(allocation__student__matric_number=matric)
+
+        with tempfile.TemporaryDirectory() as pdf_dir:
+            receipt_pdfs.PDF_DIR, original_dir = Path(pdf_dir), receipt_pdfs.PDF_DIR
+            try:
+                before = receipt_pdfs.get_receipt_pdf_metrics()
+                first = receipt_pdfs.receipt_pdf(entry.payload, entry.allocation_id)
+                again = receipt_pdfs.receipt_pdf(entry.payload, entry.allocation_id)
+                allocation = Allocation.objects.select_related('student', 'room__hall', 'receipt').get(
+                    pk=entry.allocation_id
+                )
+                from_allocation = receipt_pdfs.allocation_receipt_pdf(allocation)
+                after = receipt_pdfs.get_receipt_pdf_metrics()
+            finally:
+                receipt_pdfs.PDF_DIR = original_dir
+
+        self.assertTrue(first.startswith(b'%PDF'))
+        self.assertEqual(again, first)
+        self.assertEqual(from_allocation, first)
+        self.assertEqual(after['renders'] - before['renders'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertEqual(allocation.receipt.file_path, receipt_pdfs.receipt_pdf_path(receipt_pdfs.receipt_context(entry.payload)))
+
+
+# ==================================================
+# RECEIPT PACKS - Every receipt of a hall in one streamed ZIP
+# ==================================================
+class ReceiptPackTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+
+    def test_receipt_pack_streams_a_zip_of_every_receipt(self):
+        self.add_rooms(1, occupants=0, capacity=4)
+        self.book_new_students('PACK', Room.objects.get(hall=self.hall), count=3)
+
+        with tempfile.TemporaryDirectory() as pdf_dir:
+            receipt_pdfs.PDF_DIR, original_dir = Path(pdf_dir), receipt_pdfs.PDF_DIR
+            try:
+                response = self.client.get('/api/admin/receipts/pack/', {'email': 'porter@example.com'})
+                pack = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+                progress = self.client.get('/api/admin/receipts/pack/progress/', {'pack': response['X-Receipt-Pack']})
+                before = receipt_pdfs.get_receipt_pdf_metrics()
+                again = self.client.get('/api/admin/receipts/pack/', {'email': 'porter@example.com'})
+                b''.join(again.streaming_content)
+                after = receipt_pdfs.get_receipt_pdf_metrics()
+            finally:
+                receipt_pdfs.PDF_DIR = original_dir
+
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertEqual(response['X-Receipt-Count'], '3')
+        self.assertEqual(len(pack.namelist()), 3)
+        self.assertIsNone(pack.testzip())
+        self.assertTrue(all(pack.read(name).startswith(b'%PDF') for name in pack.namelist()))
+        self.assertEqual(progress.data, {'total': 3, 'done': 3, 'missing': 0, 'finished': True})
+        # The second pack only reads the files kept by the first
+        self.assertEqual(after['renders'], before['renders'])
+        self.assertEqual(after['hits'] - before['hits'], 3)
+
+
+# ==================================================
+# BULK MAIL - Receipts and announcements over one reused connection
+# ==================================================
+class BulkMailTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+
+    def test_receipts_and_announcements_share_one_mail_connection(self):
+        self.add_rooms(1, occupants=0, capacity=4)
+        self.book_new_students('MAIL', Room.objects.get(hall=self.hall), count=3)
+
+        response = self.client.post('/api/admin/announcements/', {
+            'email': 'porter@example.com', 'subject': 'Water outage', 'body': 'No water on Saturday.',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['recipients'], 3)
+
+        mailer.close_connection()
+        with tempfile.TemporaryDirectory() as pdf_dir:
+            receipt_pdfs.PDF_DIR, original_dir = Path(pdf_dir), receipt_pdfs.PDF_DIR
+            mailer._throttle, original_throttle = mailer._Throttle(0), mailer._throttle
+            try:
+                before = mailer.get_mail_metrics()
+                self.assertEqual(process_entries(claim_batch('w1'), 'w1'), 3)
+                self.assertEqual(process_deliveries(claim_deliveries('w1'), 'w1'), 3)
+                after = mailer.get_mail_metrics()
+            finally:
+                receipt_pdfs.PDF_DIR, mailer._throttle = original_dir, original_throttle
+                mailer.close_connection()
+
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(mail.outbox[-1].subject, 'Babcock University: Water outage')
+        self.assertEqual(len(mail.outbox[0].attachments), 1)  # The receipt PDF
+        # Six messages, one connection
+        self.assertEqual(after['connections_opened'] - before['connections_opened'], 1)
+        self.assertEqual(after['sent'] - before['sent'], 6)
+        self.assertEqual(ReceiptOutbox.objects.filter(status=ReceiptOutbox.STATUS_SENT).count(), 3)
+        status_page = self.client.get(
+            f"/api/admin/announcements/{response.data['announcement_id']}/", {'email': 'porter@example.com'}
+        )
+        self.assertEqual(status_page.data['deliveries'][AnnouncementDelivery.STATUS_SENT], 3)
+        self.assertEqual(status_page.data['failed'], [])
+
+    def test_lost_delivery_lease_counts_as_an_attempt(self):
+        self.add_rooms(1, occupants=0, capacity=4)
+        self.book_new_students('LOST', Room.objects.get(hall=self.hall))
+        self.client.post('/api/admin/announcements/', {
+            'email': 'porter@example.com', 'subject': 'Fire drill', 'body': 'Tomorrow at 7am.',
+        })
+        # Claimed by a worker that died, on its last attempt
+        AnnouncementDelivery.objects.update(
+            status=AnnouncementDelivery.STATUS_PROCESSING, locked_by='dead', attempts=outbox.MAX_ATTEMPTS - 1,
+            locked_at=timezone.now() - timedelta(seconds=outbox.LEASE_SECONDS + 1),
+        )
+
+        self.assertEqual(claim_deliveries('w1'), [])
+        delivery = AnnouncementDelivery.objects.get()
+        self.assertEqual(delivery.status, AnnouncementDelivery.STATUS_FAILED)
+        self.assertEqual(delivery.attempts, outbox.MAX_ATTEMPTS)
+
+
+# ==================================================
+# RECEIPT DOWNLOADS - ETag, Range and X-Sendfile
+# ==================================================
+class ReceiptDownloadTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.create_hall()
+
+    def test_receipt_download_supports_etag_range_and_sendfile(self):
+        self.add_rooms(1, occupants=0, capacity=2)
+        [matric] = self.book_new_students('DL', Room.objects.get(hall=self.hall))
+        url, params = '/api/allocation/receipt.pdf', {'matriculation_number': matric}
+
+        with tempfile.TemporaryDirectory() as pdf_dir:
+            receipt_pdfs.PDF_DIR, original_dir = Path(pdf_dir), receipt_pdfs.PDF_DIR
+            try:
+                full = self.client.get(url, params)
+                body = b''.join(full.streaming_content)
+                etag = full['ETag']
+                cached = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+                part = self.client.get(url, params, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)
+                tail = self.client.get(url, params, HTTP_RANGE='bytes=-10')
+                outside = self.client.get(url, params, HTTP_RANGE=f'bytes={len(body)}-')
+                receipt_downloads.SENDFILE = 'x-accel-redirect'
+                try:
+                    offloaded = self.client.get(url, params)
+                finally:
+                    receipt_downloads.SENDFILE = ''
+            finally:
+                receipt_pdfs.PDF_DIR = original_dir
+
+        self.assertEqual(full.status_code, 200)
+        self.assertTrue(body.startswith(b'%PDF'))
+        self.assertEqual(full['Content-Length'], str(len(body)))
+        self.assertIn('BU-Receipt_T-DL-0.pdf', full['Content-Disposition'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(b''.join(part.streaming_content), b'%PDF')
+        self.assertEqual(part['Content-Range'], f'bytes 0-3/{len(body)}')
+        self.assertEqual(b''.join(tail.streaming_content), body[-10:])
+        self.assertEqual(outside.status_code, 416)
+        # The web server sends the file; Django only names it
+        self.assertEqual(offloaded.content, b'')
+        self.assertEqual(offloaded['X-Accel-Redirect'], '/protected-receipts/' + etag.strip('"')[:2] + '/' + etag.strip('"') + '.pdf')
+
+
+# ==================================================
+# LIST ENDPOINTS - Keyset pages, filters and ?fields=
+# ==================================================
+class StudentListTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        now = timezone.now()
+        for number in range(7):
+            Student.objects.create(
+                matric_number=f"L/{number:03d}", full_name=f"Student {number}", email=f"l{number}@example.com",
+                password='!', level='200' if number % 2 else '100', gender='Female',
+                payment_status='Verified', created_at=now,
+            )
+
+    def test_pages_cover_every_filtered_student_once(self):
+        seen = []
+        response = self.client.get('/api/student/', {'level': '100', 'limit': 2, 'fields': 'matric_number,level'})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            for row in response.data['results']:
+                self.assertEqual(set(row), {'matric_number', 'level'})
+                seen.append(row['matric_number'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(seen, ['L/000', 'L/002', 'L/004', 'L/006'])
+
+    def test_password_cannot_be_requested(self):
+        response = self.client.get('/api/student/', {'fields': 'matric_number,password'})
+        self.assertEqual(response.status_code, 400)
+
+
+# ==================================================
+# STUDENT DASHBOARD - Hall choices come from the numeric level / cost columns
+# ==================================================
+class StudentDashboardHallTests(UnmanagedTablesTestCase):
+    def add_hall(self, name, gender, level, cost):
+        return Hall.objects.create(
+            hall_name=name, gender=gender, total_rooms=1, available_rooms=1, level=level,
+            hall_description='Test hall', accomodation_cost=cost,
+        )
+
+    def test_halls_filtered_by_level_and_split_by_budget(self):
+        juniors = self.add_hall('Juniors', 'Male', '100lvl - 200lvl', 'N1,000')
+        self.add_hall('Seniors', 'Male', '400', '500')
+        self.add_hall('Ladies', 'Female', '', '100')
+        anyone = self.add_hall('Anyone', 'Male', None, '2,000')
+        self.assertEqual((juniors.level_min, juniors.level_max, juniors.cost), (100, 200, 1000))
+
+        student = Student.objects.create(
+            matric_number='D/001', full_name='Dash Student', email='dash@example.com', password='!',
+            level='200', gender='Male', payment_status='Verified', created_at=timezone.now(),
+        )
+        Payment.objects.create(
+            matric_number=student, payment_reference='PAY-D1', amount_paid=1500,
+            payment_status='Verified', date_paid=timezone.now(),
+        )
+
+        response = APIClient().get('/api/student/dashboard/', {'matriculation_number': 'D/001'})
+        self.assertEqual([hall['hall_name'] for hall in response.data['recommended_halls']], ['Juniors'])
+        self.assertEqual([hall['hall_name'] for hall in response.data['available_halls']], ['Anyone'])
+
+        # Editing the text columns keeps the numeric ones in step
+        anyone.accomodation_cost = '1,200'
+        anyone.save(update_fields=['accomodation_cost'])
+        self.assertEqual(Hall.objects.get(pk=anyone.pk).cost, 1200)
+
+    def test_dashboard_document_follows_roommate_booking(self):
+        hall = self.add_hall('Juniors', 'Male', '100', '1,000')
+        room = Room.objects.create(
+            hall=hall, room_number='J1', capacity=2, current_occupants=0, room_status='Available',
+            is_under_maintenance=False, created_at=timezone.now(),
+        )
+        for matric in ('D/010', 'D/011'):
+            Student.objects.create(
+                matric_number=matric, full_name=f"Student {matric}", email=f"{matric[2:]}@example.com",
+                password='!', level='100', gender='Male', payment_status='Verified', created_at=timezone.now(),
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            book('D/010', hall.hall_id, room.room_id)
+
+        client = APIClient()
+        client.get('/api/student/dashboard/', {'matriculation_number': 'D/010'})
+        with self.captureOnCommitCallbacks(execute=True):
+            book('D/011', hall.hall_id, room.room_id)
+
+        # The roommate's arrival rebuilt D/010's stored document
+        document = StudentDashboard.objects.get(pk='D/010').document
+        self.assertEqual(len(document['profile']['room_details']['roommates']), 2)
+
+        # Reading it is the stored document plus the student's hall row
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/student/dashboard/', {'matriculation_number': 'D/010'})
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response.data['profile']['room_details']['current_occupants'], 2)
+        self.assertEqual(response.data['profile']['hall_details']['hall_name'], 'Juniors')
+
+
+# ==================================================
+# LOGIN - Passwords checked in the helper pool; tokens carry signed claims
+# ==================================================
+class LoginTests(UnmanagedTablesTestCase):
+    def test_login_uses_pool_and_rejects_when_full(self):
+        Student.objects.create(
+            matric_number='P/001', full_name='Pool Student', email='pool@example.com',
+            password=make_password('secret-pass'), level='100', gender='Male',
+            payment_status='Verified', created_at=timezone.now(),
+        )
+        client = APIClient()
+        before = passwords.get_login_metrics()
+
+        response = client.post('/api/student/login/', {'matriculation_number': 'P/001', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+        response = client.post('/api/student/login/', {'matriculation_number': 'P/001', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+
+        # Every slot taken: the next login is turned away without hashing
+        taken = 0
+        while passwords._slots.acquire(blocking=False):
+            taken += 1
+        try:
+            response = client.post('/api/student/login/', {'matriculation_number': 'P/001', 'password': 'secret-pass'})
+        finally:
+            for _ in range(taken):
+                passwords._slots.release()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+
+        after = client.get('/api/login/metrics/').data
+        self.assertEqual(after['matched'] - before['matched'], 1)
+        self.assertEqual(after['mismatched'] - before['mismatched'], 1)
+        self.assertEqual(after['rejected_busy'] - before['rejected_busy'], 1)
+        self.assertIsNotNone(after['hash'])
+
+    def test_token_claims_identify_student_and_go_stale(self):
+        cache.clear()
+        Student.objects.create(
+            matric_number='P/002', full_name='Claims Student', email='claims@example.com',
+            password=make_password('secret-pass'), level='200', gender='Female',
+            payment_status='Pending', created_at=timezone.now(),
+        )
+        client = APIClient()
+        tokens = client.post(
+            '/api/student/login/', {'matriculation_number': 'P/002', 'password': 'secret-pass'}
+        ).data
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+        # Who is asking comes from the token: no ?matriculation_number= needed
+        client.get('/api/student/dashboard/')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/student/dashboard/')
+        self.assertEqual(response.data['profile']['matriculation_number'], 'P/002')
+        self.assertLessEqual(len(queries), 2)  # Stored document + pending-payment check
+
+        # They are edited in the Django admin panel: old tokens are refused until refreshed
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_status_version_on_commit(STUDENT, ['P/002'])
+        stale = client.get('/api/student/dashboard/')
+        self.assertEqual(stale.status_code, 401)
+        self.assertEqual(stale.data['code'], 'token_stale')
+
+        fresh = APIClient().post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(fresh.status_code, 200)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {fresh.data['access']}")
+        self.assertEqual(client.get('/api/student/dashboard/').status_code, 200)
+
+    def test_stale_token_is_refused_by_every_process(self):
+        cache.clear()
+        Student.objects.create(
+            matric_number='P/003', full_name='Other Process', email='other@example.com',
+            password=make_password('secret-pass'), level='300', gender='Male',
+            payment_status='Pending', created_at=timezone.now(),
+        )
+        client = APIClient()
+        tokens = client.post(
+            '/api/student/login/', {'matriculation_number': 'P/003', 'password': 'secret-pass'}
+        ).data
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(client.get('/api/student/dashboard/').status_code, 200)
+
+        # Bumped by another server process: this one has no cached copy of the
+        # new version, so it reads the column instead of trusting the token
+        with self.captureOnCommitCallbacks(execute=False):
+            bump_status_version_on_commit(STUDENT, ['P/003'])
+        cache.clear()
+        self.assertEqual(client.get('/api/student/dashboard/').data['code'], 'token_stale')
+
+        # A person who no longer exists has no version at all
+        fresh = APIClient().post('/api/token/refresh/', {'refresh': tokens['refresh']}).data
+        StudentDashboard.objects.filter(student_id='P/003').delete()
+        Student.objects.filter(matric_number='P/003').delete()
+        cache.clear()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {fresh['access']}")
+        self.assertEqual(client.get('/api/student/dashboard/').status_code, 401)
+
+
+# ==================================================
+# AUDIT LOG - Buffered entries, written in one bulk INSERT
+# ==================================================
+class AuditLogTests(UnmanagedTablesTestCase):
+    def test_entries_wait_for_commit_and_are_written_in_bulk(self):
+        # Flush in this thread: no writer thread with its own connection
+        audit.ASYNC, ensure_writer, audit._ensure_writer = True, audit._ensure_writer, lambda: None
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    for number in range(5):
+                        audit.record(f"Toggled Room R{number:03d} Maintenance Status", 'porter@example.com')
+                # Recorded, but nothing written yet: the request didn't wait for the database
+                self.assertEqual(len(queries), 0)
+                self.assertEqual(audit.get_audit_metrics()['pending'], 5)
+
+                # A rolled-back transaction leaves no entry
+                with self.captureOnCommitCallbacks(execute=False):
+                    audit.record("Booked Room R001", 'P/001')
+
+                self.assertEqual(audit.flush(), 5)
+            self.assertEqual(len([q for q in queries if q['sql'].startswith('INSERT')]), 1)
+            self.assertEqual(Log.objects.filter(user_role='porter@example.com').count(), 5)
+
+            # Payments are critical: written at once, not buffered
+            audit.record("Payment changed", 'admin', critical=True)
+            self.assertEqual(Log.objects.filter(action="Payment changed").count(), 1)
+            self.assertEqual(audit.get_audit_metrics()['pending'], 0)
+        finally:
+            audit.ASYNC, audit._ensure_writer = False, ensure_writer
+            audit.flush()
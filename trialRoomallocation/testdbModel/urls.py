@@ -6,7 +6,7 @@
 # which function (view) should handle that request
 
 from django.urls import path
-from .views import get_student,get_admin,get_hall,get_payment,student_login,admin_login,student_dashboard,admin_dashboard_data,book_room,allocation_list,toggle_maintenance,allocation_graph,available_rooms,admin_student_receipts
+from .views import get_student,get_admin,get_hall,get_payment,student_login,admin_login,student_dashboard,admin_dashboard_data,book_room,allocation_list,toggle_maintenance,allocation_graph,available_rooms,admin_student_receipts,receipt_outbox_metrics,admin_auto_allocate,hold_bed,join_booking_queue,booking_queue_status,booking_queue_metrics,contention_metrics,hall_live_stream,hall_live_poll,live_metrics,admin_dashboard_changes,admin_export_receipts,admin_export_allocations,cache_metrics,inventory_metrics,login_metrics,token_refresh,receipt_pdf_metrics,admin_receipt_pack,admin_receipt_pack_progress,admin_announcements,admin_announcement_status,mail_metrics,allocation_receipt_download,audit_metrics
 
 # List of all the URLs (web addresses) available in our API
 urlpatterns = [
@@ -32,6 +32,9 @@ urlpatterns = [
     
     # When an admin tries to login at "api/admin/login/", call admin_login
     path('admin/login/', admin_login),
+
+    # When a login token needs new claims (401 "token_stale") or has expired, at "api/token/refresh/"
+    path('token/refresh/', token_refresh),
     
     # DASHBOARD ENDPOINTS
     # When a student wants to see their dashboard at "api/student/dashboard/"
@@ -39,6 +42,9 @@ urlpatterns = [
     
     # When an admin wants to see their dashboard at "api/admin/dashboard/"
     path('admin/dashboard/', admin_dashboard_data),
+
+    # When the admin page only wants the rooms that changed since its last load
+    path('admin/dashboard/changes/', admin_dashboard_changes),
     
     # BOOKING ENDPOINT
     # When a student wants to book a room at "api/bookRoom/"
@@ -48,6 +54,10 @@ urlpatterns = [
     # When a student wants to see their allocation at "api/allocation/"
     path('allocation/',allocation_list),
 
+    # RECEIPT DOWNLOAD ENDPOINT
+    # The student's stored receipt PDF at "api/allocation/receipt.pdf" (ETag, Range, X-Sendfile)
+    path('allocation/receipt.pdf', allocation_receipt_download),
+
     # ROOM MAINTENANCE ENDPOINT
     # When an admin toggles room maintenance status at "api/rooms/<room_id>/toggle-maintenance/"
     path('rooms/<int:room_id>/toggle-maintenance/', toggle_maintenance),
@@ -58,10 +68,77 @@ urlpatterns = [
     # When a student wants to see available rooms in a hall at "api/available-rooms/?hall_id=X"
     path('available-rooms/', available_rooms),
 
+    # BED HOLD ENDPOINT
+    # When a student opens a room, hold one bed for a few minutes at "api/rooms/hold/"
+    path('rooms/hold/', hold_bed),
+
     # ADMIN RECEIPTS ENDPOINT
     # When an admin wants to see all student receipts in their hall
     path('admin/receipts/', admin_student_receipts),
 
+    # ADMIN EXPORT ENDPOINTS
+    # Download the hall's (or, for a Super Admin, the campus') receipts / allocations as a streamed CSV or NDJSON file
+    path('admin/export/receipts/', admin_export_receipts),
+    path('admin/export/allocations/', admin_export_allocations),
+
+    # RECEIPT PACK ENDPOINTS
+    # Every receipt PDF of the hall in one streamed ZIP file, and how far building it has got
+    path('admin/receipts/pack/', admin_receipt_pack),
+    path('admin/receipts/pack/progress/', admin_receipt_pack_progress),
+
+    # RECEIPT OUTBOX METRICS ENDPOINT
+    # Shows how many receipt emails are pending, sent or failed
+    path('outbox/metrics/', receipt_outbox_metrics),
+
+    # AUDIT METRICS ENDPOINT
+    # Audit log entries waiting in the buffer, written in bulk, and write failures
+    path('audit/metrics/', audit_metrics),
+
+    # MAIL METRICS ENDPOINT
+    # Emails sent / failed, messages per SMTP connection and time spent throttled
+    path('mail/metrics/', mail_metrics),
+
+    # RECEIPT PDF METRICS ENDPOINT
+    # How many receipt PDFs were read from disk vs rendered (and how long rendering takes)
+    path('receipts/metrics/', receipt_pdf_metrics),
+
+    # CACHE METRICS ENDPOINT
+    # Hits / misses / rebuilds of the cached available-rooms lists
+    path('cache/metrics/', cache_metrics),
+
+    # INVENTORY METRICS ENDPOINT
+    # Rooms / free rooms / maintenance per hall in this process's in-memory bed inventory
+    path('inventory/metrics/', inventory_metrics),
+
+    # LOGIN METRICS ENDPOINT
+    # Password-check timings (wait / hash / total) and logins turned away as "busy"
+    path('login/metrics/', login_metrics),
+
+    # ANNOUNCEMENT ENDPOINTS
+    # When an admin emails everyone in their hall, and to see who it reached
+    path('admin/announcements/', admin_announcements),
+    path('admin/announcements/<int:announcement_id>/', admin_announcement_status),
+
+    # AUTO ALLOCATION ENDPOINT
+    # When an admin wants to allocate every waiting student in their hall at once
+    path('admin/auto-allocate/', admin_auto_allocate),
+
+    # BOOKING QUEUE ENDPOINTS
+    # On allocation day students take a ticket and wait their turn to book
+    path('queue/join/', join_booking_queue),
+    path('queue/status/', booking_queue_status),
+    path('queue/metrics/', booking_queue_metrics),
+
+    # CONTENTION METRICS ENDPOINT
+    # Shows deadlock retries, refusals and lock waits per hall and the busiest rooms
+    path('contention/metrics/', contention_metrics),
+
+    # LIVE OCCUPANCY ENDPOINTS
+    # Admin dashboards get pushed hall changes (Server-Sent Events), or long-poll for them
+    path('halls/<int:hall_id>/live/', hall_live_stream),
+    path('halls/<int:hall_id>/live/poll/', hall_live_poll),
+    path('live/metrics/', live_metrics),
+
 
     
 ]  
\ No newline at end of file
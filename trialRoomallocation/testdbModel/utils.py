@@ -1,19 +1,25 @@
-from django.core.mail import send_mail, EmailMessage
-from django.template.loader import render_to_string
-import io, uuid, string, random, secrets
+from django.core.mail import EmailMessage
+from django.template.loader import get_template
+from functools import lru_cache
+import io, re, uuid, string, random, secrets
+from decimal import Decimal
 from xhtml2pdf import pisa
 
-def send_allocation_email(student_email, student_name, room_details):
+FROM_EMAIL = 'projecttest531@gmail.com'
+
+
+def build_allocation_message(student_email, student_name, room_details):
     subject = 'Babcock University: Room Allocation Successful'
     message = f"Hello {student_name},\n\nYour hall allocation is successful. \nRoom: {room_details}\n\nPlease login to the portal to download your e-receipt."
-    
-    send_mail(
-        subject,
-        message,
-        'projecttest531@gmail.com', # From email
-        [student_email],        # To email
-        fail_silently=False,
-    )
+
+    return EmailMessage(subject, message, FROM_EMAIL, [student_email])
+
+
+def send_allocation_email(student_email, student_name, room_details):
+    # Imported here: PDF helper processes import this module without Django set up
+    from .mailer import send_now
+
+    send_now(build_allocation_message(student_email, student_name, room_details))
 
 
 #generating transaction id
@@ -22,48 +28,118 @@ def generate_transaction_id():
     return f"BU-{random_code}"
 
 
+# ==================================================
+# HELPER: Parse a numeric level from a string like "200", "200lvl", etc.
+# ==================================================
+def _parse_level_number(value):
+    """Extract the first integer from a level string. Returns None if not parseable."""
+    if not value:
+        return None
+    # Remove common suffixes and whitespace
+    nums = re.findall(r'\d+', str(value))
+    return int(nums[0]) if nums else None
+
+
+def _parse_cost(cost_str):
+    """Parse an accommodation cost string into a float. Returns 0.0 on failure."""
+    if not cost_str:
+        return 0.0
+    # Remove commas, currency symbols, whitespace
+    cleaned = re.sub(r'[^\d.]', '', str(cost_str))
+    try:
+        return float(cleaned)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _parse_level_range(hall_level_str):
+    """
+    (lowest, highest) level a hall takes.
+    Hall level formats: '200', '200lvl', '200-300', '200lvl - 300lvl', etc.
+    '200lvl - 300lvl' -> (200, 300), '200' -> (200, 200).
+    If the hall has no level set (or it can't be parsed) it is open to all
+    levels -> (None, None).
+    """
+    nums = re.findall(r'\d+', str(hall_level_str or ''))
+    if not nums:
+        return None, None
+    if len(nums) == 1:
+        return int(nums[0]), int(nums[0])
+    return int(nums[0]), int(nums[1])
+
+
+def hall_eligibility_values(level, accomodation_cost):
+    """The numeric Hall.level_min / level_max / cost for a hall's free-text level and cost."""
+    level_min, level_max = _parse_level_range(level)
+    cost = Decimal(str(_parse_cost(accomodation_cost))).quantize(Decimal('0.01'))
+    return {'level_min': level_min, 'level_max': level_max, 'cost': cost}
+
+
 # ==================================================
 # GENERATE RECEIPT PDF  (returns bytes in memory)
 # ==================================================
 # Uses xhtml2pdf to convert the Django HTML template into a PDF file
 # Returns the PDF bytes, or None if generation failed
-def generate_receipt_pdf(context):
-    """
-    Render receipt_template.html with the given context dict and
-    return the resulting PDF as raw bytes (ready to attach to an email).
-    """
-    # Step 1: Render the HTML template with context data
-    html_string = render_to_string('testdbModel/receipt_template.html', context)
+# (receipt_pdfs.py keeps the finished PDFs on disk and renders new ones in
+# helper processes - these functions are the steps it runs)
+@lru_cache(maxsize=1)
+def receipt_template():
+    """receipt_template.html, loaded and compiled ONCE per process."""
+    return get_template('testdbModel/receipt_template.html')
 
-    # Step 2: Create an in-memory buffer to hold the PDF
+
+def render_receipt_html(context):
+    """Fill the receipt template in with the given context dict."""
+    return receipt_template().render(context)
+
+
+def html_to_pdf(html_string):
+    """Convert rendered HTML to PDF bytes (None if xhtml2pdf failed). Needs no database."""
+    # Create an in-memory buffer to hold the PDF
     buffer = io.BytesIO()
 
-    # Step 3: Convert HTML to PDF using xhtml2pdf
+    # Convert HTML to PDF using xhtml2pdf
     pisa_status = pisa.CreatePDF(io.StringIO(html_string), dest=buffer)
 
     if pisa_status.err:
         print(f"PDF generation error: {pisa_status.err}")
         return None
 
-    # Step 4: Get the PDF bytes and close the buffer
+    # Get the PDF bytes and close the buffer
     pdf_bytes = buffer.getvalue()
     buffer.close()
     return pdf_bytes
 
 
+def warm_up_pdf_renderer():
+    """Render a tiny document so xhtml2pdf/reportlab load their fonts and default CSS now."""
+    html_to_pdf('<html><body style="font-family: Helvetica"><p><b>.</b></p></body></html>')
+
+
+def generate_receipt_pdf(context):
+    """
+    Render receipt_template.html with the given context dict and
+    return the resulting PDF as raw bytes (ready to attach to an email).
+    """
+    return html_to_pdf(render_receipt_html(context))
+
+
 # ==================================================
 # SEND RECEIPT EMAIL  (with PDF attachment)
 # ==================================================
 # Generates the PDF receipt and emails it as an attachment to the student
 # This function should ALWAYS be called inside a try/except block
 # so that email/SMTP failures never crash or rollback the booking
-def send_receipt_email(student_email, student_name, matric_number,
-                       hall_name, room_number, receipt_no,
-                       transaction_id, amount_paid, date,
-                       department='', level='', email=''):
+# (the receipt outbox builds the same message with build_receipt_message and
+# sends whole batches over one connection - see mailer.py)
+def build_receipt_message(student_email, student_name, matric_number,
+                          hall_name, room_number, receipt_no,
+                          transaction_id, amount_paid, date,
+                          department='', level='', email='', pdf_bytes=None):
     """
-    Generate a PDF receipt and send it as an email attachment.
-    If the PDF generation fails, a text-only fallback email is sent instead.
+    The receipt email, with the PDF receipt attached.
+    If the PDF generation fails, a text-only fallback email is built instead.
+    pdf_bytes: an already-rendered receipt (e.g. from receipt_pdfs.py) to attach as is.
     """
     # Build the context dict for the HTML template
     context = {
@@ -80,24 +156,23 @@ def send_receipt_email(student_email, student_name, matric_number,
         'email': email,
     }
 
-    # Generate the PDF
-    pdf_bytes = generate_receipt_pdf(context)
+    # Generate the PDF (unless the caller already has it)
+    if pdf_bytes is None:
+        pdf_bytes = generate_receipt_pdf(context)
 
     if not pdf_bytes:
-        # Fallback: send a plain-text email if PDF generation fails
+        # Fallback: a plain-text email if PDF generation fails
         print(f"Could not generate PDF for {matric_number}, sending text-only email")
-        send_mail(
+        return EmailMessage(
             'Babcock University: Room Allocation Successful',
             f"Hello {student_name},\n\n"
             f"Your hall allocation is successful.\n"
             f"Hall: {hall_name}\nRoom: {room_number}\n"
             f"Receipt No: {receipt_no}\n\n"
             f"Please login to the portal to download your e-receipt.",
-            'projecttest531@gmail.com',
+            FROM_EMAIL,
             [student_email],
-            fail_silently=False,
         )
-        return
 
     # Build email with PDF attachment using Django's EmailMessage
     msg = EmailMessage(
@@ -113,7 +188,7 @@ def send_receipt_email(student_email, student_name, matric_number,
             f"to access your room.\n\n"
             f"— Babcock University HAMS"
         ),
-        from_email='projecttest531@gmail.com',
+        from_email=FROM_EMAIL,
         to=[student_email],
     )
 
@@ -124,6 +199,14 @@ def send_receipt_email(student_email, student_name, matric_number,
         mimetype='application/pdf'
     )
 
-    msg.send(fail_silently=False)
-    print(f"Receipt email with PDF sent to {student_email}")
+    return msg
+
+
+def send_receipt_email(*args, **kwargs):
+    """Build the receipt email (same arguments as build_receipt_message) and send it now."""
+    from .mailer import send_now
+
+    msg = build_receipt_message(*args, **kwargs)
+    send_now(msg)
+    print(f"Receipt email sent to {', '.join(msg.to)}")
 
@@ -6,88 +6,128 @@
 # - Views get the data from the database
 # - Views send back the response (the data they asked for)
 
+import logging
+
 from django.shortcuts import render
 
 # Import tools from Django to create API endpoints
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from .models import Student, Admin, Hall, Payment, Receipt, Log
-from .serializers import StudentSerializer, AdminSerializer, HallSerializer, PaymentSerializer, LoginSerializer, AdminLoginSerializer, StudentDashboardSerializer, AdminDashboardSerializer,BookingSerializer,AllocationSerializer,StudentRoomSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from .models import Student, Admin, Hall, Payment, Announcement
+from .serializers import StudentSerializer, AdminSerializer, HallSerializer, PaymentSerializer, LoginSerializer, AdminLoginSerializer, AdminDashboardSerializer,BookingSerializer,AllocationSerializer,hall_stats_prefetches,occupants_queryset,HallTotalsSerializer,AdminRoomSerializer
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework import status
 from django.db import transaction
 from django.db.models.functions import TruncDay
-from .models import Allocation, Room
-from django.utils import timezone
-from django.contrib.auth.hashers import check_password
-from .utils import send_allocation_email, generate_transaction_id, send_receipt_email
-from django.db.models import Sum, Q , F, Count
-from django.utils import timezone
+from .models import Allocation, Room, HallChange
+from .passwords import verify_password, get_login_metrics
+from .identity import student_tokens, admin_tokens, refresh_tokens, request_student, request_matric, request_admin_email, request_admin_record
+from .utils import send_allocation_email
+from .mailer import get_mail_metrics
+from . import audit
+from .announcements import create_announcement, announcement_status
+from .outbox import get_outbox_metrics
+from .receipt_pdfs import get_receipt_pdf_metrics, allocation_receipt_file
+from .receipt_downloads import serve_receipt_file, get_download_metrics
+from .receipt_packs import new_pack, receipt_pack_chunks, streaming_pack, get_pack_progress
+from .listing import paged_list
+from .dashboards import load_document, dashboard_response
+from .caching import cached_hall_rooms, get_cache_metrics
+from .inventory import hall_inventory, get_inventory_metrics
+from .export import FORMATS as EXPORT_FORMATS, RECEIPT_COLUMNS, ALLOCATION_COLUMNS, receipt_row, allocation_row, receipts_queryset, allocations_queryset, export_chunks, streaming_export
+from django.utils.text import slugify
+from .booking import book, BookingError
+from .allocator import auto_allocate
+from .holds import place_hold, release_hold, active_hold_counts, HOLD_TTL_SECONDS
+from .idempotency import idempotent
+from .contention import get_contention_metrics
+from .occupancy import record_room_change
+from .conditional import (
+    admin_for_request, admin_hall_etag, admin_hall_last_modified, available_rooms_etag, hall_list_etag, hall_version,
+)
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from .live import (
+    DB_CHECK_SECONDS, HEARTBEAT_SECONDS, LONG_POLL_SECONDS, POLL_INTERVAL_SECONDS, current_cursor, events_since,
+    get_live_metrics, record as record_live, sse_message, subscription,
+)
+from asgiref.sync import sync_to_async
+import asyncio
+from .admission import AdmissionError, limit_in_flight, join_queue, check_ticket, describe_ticket, require_admission, finish_ticket, get_queue_metrics
+from django.db.models import Sum, Q , Count, Prefetch, prefetch_related_objects
+
+logger = logging.getLogger(__name__)
  
 # ==================================================
 # GET ALL STUDENTS - Shows a list of all students
 # ==================================================
 # This is like asking "Can I see everyone who is registered?"
+# One page at a time (see listing.py): ?limit=, ?cursor=, ?fields= and the filters
+# ?gender=, ?level=, ?payment_status=, ?hall= (the hall they selected)
 @api_view(['GET'])  # This only responds to GET requests (asking for data)
 def get_student(request):
-    # Step 1: Get ALL students from the database
-    student = Student.objects.all()
-    
-    # Step 2: Convert the student data to JSON format (so phones/websites can understand)
-    serializers = StudentSerializer(student, many=True)
-    
-    # Step 3: Send back the list of students
-    return Response(serializers.data)
+    # Step 1-3: Filter the students, convert one page of them to JSON and send it back
+    return paged_list(
+        request, Student.objects.all(), StudentSerializer,
+        filters={
+            'gender': 'gender',
+            'level': 'level',
+            'payment_status': 'payment_status',
+            'hall': 'hall_selected_id',
+        },
+        ordering='student_id',
+    )
 
 # ==================================================
 # GET ALL ADMINS - Shows a list of all admins
 # ==================================================
 # This is like asking "Can I see all the hostel managers?"
+# Paged like get_student; filter with ?hall=
 @api_view(['GET'])  # Only responds to GET requests
 def get_admin(request):
-    # Step 1: Get ALL admins from the database
-    admin = Admin.objects.all()
-    
-    # Step 2: Convert admin data to JSON
-    serializers = AdminSerializer(admin, many=True)
-    
-    # Step 3: Send back the list of admins
-    return Response(serializers.data)
+    return paged_list(
+        request, Admin.objects.all(), AdminSerializer,
+        filters={'hall': 'hall_id'},
+        ordering='admin_id',
+    )
 
 # ==================================================
 # GET ALL HALLS - Shows a list of all hostel halls
 # ==================================================
 @api_view(['GET'])  # Only responds to GET requests
+@cache_control(private=True, no_cache=True)  # Browser must check back, but may reuse on 304
+@condition(etag_func=hall_list_etag)  # 304 Not Modified if no hall changed (conditional.py)
 def get_hall(request):
-    # Step 1: Get ALL halls from the database
-    hall = Hall.objects.all()
-    
-    # Step 2: Convert hall data to JSON
-    serializers = HallSerializer(hall,  many=True)
-    
-    # Step 3: Send back the list of halls
-    return Response(serializers.data)
+    # Paged like get_student; filter with ?gender=
+    # (summary prefetched, not joined, so ?fields= can still trim the hall columns)
+    return paged_list(
+        request, Hall.objects.prefetch_related('summary'), HallSerializer,
+        filters={'gender': 'gender'},
+        ordering='hall_id',
+    )
 
 # ==================================================
 # GET ALL PAYMENTS - Shows a list of all payments
 # ==================================================
+# Paged like get_student; filter with ?payment_status= and ?matric_number=
 @api_view(['GET'])  # Only responds to GET requests
 def get_payment(request):
-    # Step 1: Get ALL payments from the database
-    payment = Payment.objects.all()
-    
-    # Step 2: Convert payment data to JSON
-    serializers = PaymentSerializer(payment, many=True)
-    
-    # Step 3: Send back the list of payments
-    return Response(serializers.data) 
+    return paged_list(
+        request, Payment.objects.all(), PaymentSerializer,
+        filters={'payment_status': 'payment_status', 'matric_number': 'matric_number_id'},
+        ordering='payment_id',
+    )
 
 # ==================================================
 # STUDENT LOGIN - Checks if student can login
 # ==================================================
 # This is like a security guard checking if you can enter
 @api_view(['POST'])  # This responds to POST requests (sending data)
+@authentication_classes([])  # An old token in the header must not stop a fresh login
+@limit_in_flight  # Turn people away politely when this worker is overloaded (admission.py)
 def student_login(request):
     # Check if the data sent is in the correct format
     serializer = LoginSerializer(data=request.data)
@@ -101,24 +141,29 @@ def student_login(request):
             #: Try to find a student with this matric number in the database
             student = Student.objects.get(matric_number=matriculation_number)
 
-            # Check if the password matches (using PBKDF2 hash verification)
-            if check_password(password, student.password):
+            # Check if the password matches (using PBKDF2 hash verification).
+            # The slow hashing runs in a helper process (passwords.py); when too
+            # many logins are already waiting we answer 429 "try again" at once
+            try:
+                password_ok = verify_password(password, student.password)
+            except AdmissionError as error:
+                return error.to_response()
+            audit.record(
+                "Student logged in" if password_ok else "Student login failed (wrong password)",
+                student.matric_number, user_id=student.student_id,
+            )
+            if password_ok:
                 # CORRECT PASSWORD! Let them in
                 
-                # Create a special token (like a ticket) for this student
-                # This token proves they logged in successfully
-                refresh = RefreshToken()
-                refresh['user_id'] = student.student_id
-                refresh['matric_number'] = student.matric_number
-                
-                # Create an access token (a shorter ticket for quick requests)
-                access = refresh.access_token
-                access['matric_number'] = student.matric_number
+                # Create special tokens (like tickets) for this student.
+                # They prove they logged in, and carry their gender, level and
+                # payment status so later requests don't look them up again (identity.py)
+                tokens = student_tokens(student)
                 
                 # Send back the tokens and student info
                 return Response({
-                    'refresh': str(refresh),  # Long-term token
-                    'access': str(access),  # Short-term token
+                    'refresh': tokens['refresh'],  # Long-term token
+                    'access': tokens['access'],  # Short-term token
                     'student_name': student.full_name,
                     'level': student.level,
                     'matric_number': student.matric_number
@@ -139,6 +184,7 @@ def student_login(request):
 # ==================================================
 # This is like a security guard checking if a manager can enter
 @api_view(['POST'])  # Responds to POST requests
+@authentication_classes([])  # An old token in the header must not stop a fresh login
 def admin_login(request):
     #  Check if the data sent is in the correct format
     serializer = AdminLoginSerializer(data=request.data)
@@ -152,19 +198,25 @@ def admin_login(request):
             # Try to find an admin with this email in the database
             admin = Admin.objects.get(email=email)
             
-            # Check if the password matches (using PBKDF2 hash verification)
-            if check_password(password, admin.password):
+            # Check if the password matches (in a helper process, like student_login)
+            try:
+                password_ok = verify_password(password, admin.password)
+            except AdmissionError as error:
+                return error.to_response()
+            audit.record(
+                "Admin logged in" if password_ok else "Admin login failed (wrong password)",
+                admin.email, user_id=admin.admin_id,
+            )
+            if password_ok:
                 # CORRECT PASSWORD! Let them in
                 
-                # Create special tokens for this admin
-                refresh = RefreshToken()
-                refresh['user_id'] = admin.admin_id
-                refresh['email'] = admin.email
+                # Create special tokens for this admin (carrying their role and hall)
+                tokens = admin_tokens(admin)
                 
                 # Send back the tokens and admin info
                 return Response({
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
+                    'refresh': tokens['refresh'],
+                    'access': tokens['access'],
                     'admin_name': admin.name,
                     'email': admin.email
                 }, status=status.HTTP_200_OK)
@@ -181,51 +233,22 @@ def admin_login(request):
 
 
 # ==================================================
-# HELPER: Parse a numeric level from a string like "200", "200lvl", etc.
+# TOKEN REFRESH - New tokens with up-to-date claims
 # ==================================================
-import re
-
-def _parse_level_number(value):
-    """Extract the first integer from a level string. Returns None if not parseable."""
-    if not value:
-        return None
-    # Remove common suffixes and whitespace
-    nums = re.findall(r'\d+', str(value))
-    return int(nums[0]) if nums else None
-
-
-def _hall_matches_level(hall_level_str, student_level_num):
-    """
-    Check whether a student's numeric level falls within a hall's level range.
-    Hall level formats: '200', '200lvl', '200-300', '200lvl - 300lvl', etc.
-    If the hall has no level set, it is open to all levels → return True.
-    """
-    if not hall_level_str or not student_level_num:
-        return True  # No restriction
-
-    nums = re.findall(r'\d+', str(hall_level_str))
-    if not nums:
-        return True  # Can't parse → show the hall
-
-    if len(nums) == 1:
-        # Single level, e.g. "200" or "200lvl"
-        return int(nums[0]) == student_level_num
-    else:
-        # Range, e.g. "200-300" or "200lvl - 300lvl"
-        low, high = int(nums[0]), int(nums[1])
-        return low <= student_level_num <= high
-
-
-def _parse_cost(cost_str):
-    """Parse an accommodation cost string into a float. Returns 0.0 on failure."""
-    if not cost_str:
-        return 0.0
-    # Remove commas, currency symbols, whitespace
-    cleaned = re.sub(r'[^\d.]', '', str(cost_str))
+# POST {refresh} -> {refresh, access}. Call it when a request answers 401 with
+# code "token_stale" (your payment status / hall changed) or "token_not_valid"
+# (the access token expired). The one place the person's row is read again.
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@authentication_classes([])  # The (possibly stale) access token doesn't matter here
+def token_refresh(request):
+    raw_refresh = request.data.get("refresh")
+    if not raw_refresh:
+        return Response({"error": "refresh is required"}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        return float(cleaned)
-    except (ValueError, TypeError):
-        return 0.0
+        return Response(refresh_tokens(raw_refresh), status=status.HTTP_200_OK)
+    except TokenError as e:
+        return Response({"error": str(e), "code": "token_not_valid"}, status=status.HTTP_401_UNAUTHORIZED)
 
 
 # ==================================================
@@ -234,104 +257,52 @@ def _parse_cost(cost_str):
 # This is like opening your personal account page
 @api_view(['GET'])  # Responds to GET requests
 @permission_classes([AllowAny])  # Anyone can access this (even without logging in)
+@limit_in_flight  # Turn people away politely when this worker is overloaded (admission.py)
 def student_dashboard(request):
-    # Step 1: Get the matriculation number from the request
-    matric_no = request.query_params.get("matriculation_number")
+    # Step 1: Get the matriculation number from their login token
+    # (or, without one, from the request)
+    matric_no = request_matric(request, request.query_params.get("matriculation_number"))
 
     # Step 2: Make sure they provided a matric number
     if not matric_no:
         return Response({"error": "Matriculation number needed"}, status=status.HTTP_400_BAD_REQUEST)
     
-    try:
-        # Step 3: Find this student in the database
-        student = Student.objects.get(matric_number=matric_no)
-        
-        # Step 4: Get the student's profile information
-        profile_data = StudentDashboardSerializer(student).data
-        
-        # Step 5: Create a response package with their profile
-        response_data = {
-            "profile": profile_data,
-            "recommended_halls": [],     # Halls within/at student's budget (shown first)
-            "available_halls": []        # Halls above student's budget (shown below)
-        }
-        
-        # Step 6: Decide what else to show them
-        
-        # If they DON'T have a room AND their payment is VERIFIED
-        # Show them the available halls they can choose from
-        if not student.room and student.payment_status == "Verified":
-            # Get halls that match their gender and have empty rooms
-            halls = Hall.objects.filter(gender=student.gender, available_rooms__gt=0)
-
-            # --- LEVEL FILTER ---
-            student_level_num = _parse_level_number(student.level)
-            level_matched_halls = [
-                h for h in halls
-                if _hall_matches_level(h.level, student_level_num)
-            ]
-
-            # --- COST FILTER ---
-            # Get how much the student paid
-            amount_paid = 0.0
-            try:
-                payment_record = Payment.objects.get(
-                    matric_number=student, payment_status="Verified"
-                )
-                amount_paid = float(payment_record.amount_paid)
-            except Payment.DoesNotExist:
-                pass
-
-            recommended = []   # Within or at budget
-            other_halls = []   # Above budget
-            for h in level_matched_halls:
-                hall_cost = _parse_cost(h.accomodation_cost)
-                if hall_cost <= amount_paid:
-                    recommended.append(h)
-                else:
-                    other_halls.append(h)
-
-            response_data["recommended_halls"] = HallSerializer(recommended, many=True).data
-            response_data["available_halls"] = HallSerializer(other_halls, many=True).data
-        
-        # If they ALREADY HAVE a room, show them their room details
-        elif student.room:
-            # Get all students living in the same room (roommates)
-            roommates = list(
-                Student.objects.filter(room=student.room)
-                .values("full_name", "level")
-            )
-            # Inject roommates into the profile's room_details (from the serializer)
-            if profile_data.get("room_details"):
-                profile_data["room_details"]["roommates"] = roommates
-        
-        # Step 7: Send back all the information
-        return Response(response_data)
-
-    except Student.DoesNotExist:
+    # Step 3: Read their ready-made dashboard (ONE primary-key read - see dashboards.py)
+    # It is rebuilt first if it is missing or out of date
+    document = load_document(matric_no)
+    if document is None:
         # Student not found in database
         return Response({"error": "Student not found"}, status=status.HTTP_404_NOT_FOUND)
-        
 
-    
+    # Step 4: Add the live hall rows (their hall, or the halls they can choose from)
+    # and send it back
+    return Response(dashboard_response(document))
+
+
 # ==================================================
 # ADMIN DASHBOARD - Shows admin their hall statistics
 # ==================================================
 # This shows the admin everything about their hostel hall
 @api_view(['GET'])  # Responds to GET requests
 @permission_classes([AllowAny])  # Anyone can access
+@cache_control(private=True, no_cache=True)  # Browser must check back, but may reuse on 304
+@condition(etag_func=admin_hall_etag, last_modified_func=admin_hall_last_modified)  # 304 if the hall didn't change
 def admin_dashboard_data(request):
     try:
-        # Step 1: Get the admin's email from the request
-        admin_email = request.query_params.get("email")
-        
-        # Step 2: Find this admin in the database
-        admin = Admin.objects.get(email=admin_email)
-
-        # Step 3: Get all their dashboard data (including hall statistics)
+        # Step 1: Find this admin in the database, with their hall's totals,
+        # rooms and occupants loaded up front (a fixed number of queries, however
+        # many rooms the hall has - the dashboard refreshes every few seconds)
+        # (the admin, hall and summary row were already loaded for the ETag check)
+        admin = admin_for_request(request)
+        if admin is None:
+            raise Admin.DoesNotExist
+        if admin.hall is not None:
+            prefetch_related_objects([admin.hall], *hall_stats_prefetches())
+
+        # Step 2: Get all their dashboard data (including hall statistics)
         profile_data = AdminDashboardSerializer(admin).data
 
-        # Step 4: Send back the complete dashboard
+        # Step 3: Send back the complete dashboard
         return Response(profile_data)
 
     except Admin.DoesNotExist:
@@ -339,12 +310,62 @@ def admin_dashboard_data(request):
         return Response({"error": "Admin not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+# ==================================================
+# ADMIN DASHBOARD CHANGES - Only the rooms that changed since last time
+# ==================================================
+# The full dashboard sends every room and every occupant. After the first load,
+# the admin page (and its offline copy) only needs what changed:
+#   GET /api/admin/dashboard/changes/?email=...&since=<changes_cursor>
+# returns the hall totals, the changed rooms (with their occupants) and the new
+# cursor. "full_resync": true means the cursor is too old (the change log was
+# pruned) or unknown - load the full dashboard again instead.
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def admin_dashboard_changes(request):
+    try:
+        since = int(request.query_params.get("since", ""))
+    except ValueError:
+        return Response({"error": "since must be the changes_cursor from the dashboard"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    admin = admin_for_request(request)  # Their hall and its summary row, in one query
+    if admin is None:
+        return Response({"error": "Admin not found"}, status=status.HTTP_404_NOT_FOUND)
+    if admin.hall is None:
+        return Response({"error": "Admin is not assigned to any hall"}, status=status.HTTP_400_BAD_REQUEST)
+
+    hall = admin.hall
+    summary = getattr(hall, 'summary', None)
+    if summary is None or since < summary.changes_pruned_upto or since > summary.version:
+        return Response({"full_resync": True, "changes_cursor": summary.version if summary else None})
+
+    # Which rooms changed after `since`? (versions up to the one we just read,
+    # so the cursor we hand back really covers everything we looked at)
+    changed_room_ids = set(
+        HallChange.objects.filter(hall=hall, version__gt=since, version__lte=summary.version)
+        .values_list('room_id', flat=True)
+    )
+    rooms = []
+    if changed_room_ids:
+        rooms = Room.objects.filter(room_id__in=changed_room_ids).order_by('room_id').prefetch_related(
+            Prefetch('student_set', queryset=occupants_queryset())
+        )
+
+    return Response({
+        "full_resync": False,
+        "changes_cursor": summary.version,
+        "hall_details": HallTotalsSerializer(hall).data,
+        "rooms": AdminRoomSerializer(rooms, many=True).data,
+    })
+
+
 # ==================================================
 # BOOK ROOM - Assigns a room to a student
 # ==================================================
 # This is the most important function - it gives students their rooms!
 @api_view(['POST'])  # Responds to POST requests
 @permission_classes([AllowAny])  # Anyone can access
+@idempotent('book_room')  # Retries with the same Idempotency-Key get the first answer back
 def book_room(request):
     # Step 1: Check if the booking request has the correct format
     serializer = BookingSerializer(data=request.data)
@@ -353,134 +374,55 @@ def book_room(request):
        # Get the hall_id, room_id, and matric number from the request
        hall_id = serializer.validated_data['hall_id']
        room_id = serializer.validated_data['room_id']
-       matric = serializer.validated_data['matriculation_number']
+       # (the student in the login token, if there is one)
+       matric = request_matric(request, serializer.validated_data['matriculation_number'])
 
 
        try:
-           #  Use a "transaction" - this means if anything goes wrong,
-           # we undo ALL the changes (like a safety net)
-           with transaction.atomic():
-            
-            #  Lock the student's record so they can't book twice at the same time
-            # (Like putting a "Reserved" sign while we process their booking)
-            student = Student.objects.select_for_update().get(matric_number=matric)
-
-            #  VALIDATION - Check if the student is allowed to book
-            
-            #  Check 1: Do they already have a room?
-            if student.room:
-                return Response({"error": "Student already has a room"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Check 2: Did they pay their hostel fees?
-            if student.payment_status != "Verified":
-                return Response({"error": "Payment not verified"}, status=status.HTTP_400_BAD_REQUEST)
-
-            #  Get the specific room the student selected
-            # Lock it for update to prevent race conditions
-            try:
-                room = Room.objects.select_for_update().get(
-                    room_id=room_id,
-                    hall_id=hall_id,  # Must be in the correct hall
-                )
-            except Room.DoesNotExist:
-                return Response({"error": "Room not found in this hall"}, status=status.HTTP_404_NOT_FOUND)
-            
-            #  Validate the room is still available
-            if room.current_occupants >= room.capacity:
-                return Response({"error": "This room is already full"}, status=status.HTTP_400_BAD_REQUEST)
-            if room.is_under_maintenance:
-                return Response({"error": "This room is under maintenance"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            #  EXECUTE THE BOOKING!
-            
-            # Add 1 to the number of students in this room
-            room.current_occupants += 1
-
-            # Fix #5: Update room status if room is now full
-            if room.current_occupants >= room.capacity:
-                room.room_status = 'Full'
-
-            room.save()  # Save the change to the database
-
-            # Fix #4: Update hall available_rooms count if this room just became full
-            if room.current_occupants >= room.capacity:
-                hall = room.hall
-                hall.available_rooms = max(0, hall.available_rooms - 1)
-                hall.save()
-            
-            # Assign the room and hall to the student
-            student.room = room
-            student.hall_selected = room.hall
-            student.save()  # Save the student's new room
-
-            # Create the autonomous receipt record first
-            transaction_id = generate_transaction_id()
-            
-            # Get the student's payment record to retrieve the amount paid
-            try:
-                payment_record = Payment.objects.get(matric_number=student, payment_status="Verified")
-                amount = payment_record.amount_paid
-            except Payment.DoesNotExist:
-                amount = 0  # Default to 0 if no payment record found
-
-            new_receipt = Receipt.objects.create(
-               payment_reference=transaction_id,
-               student_name = student.full_name,
-               matric_number = student,
-               amount_paid = amount,
-               date_paid = timezone.now(),
-               verified=True,
-               created_at = timezone.now(),
-               
-            )
-
-            # Create an allocation record (like a receipt of this booking)
-            allocation = Allocation.objects.create(
-                student=student,
-                room=room,
-                receipt=new_receipt,
-                allocation_date=timezone.now(),  # Current date and time
-                status='active', # The allocation is active
-                created_at = timezone.now(),
-            )
-
-
-            # send email to student with PDF receipt attached
-            # Wrapped in try/except so email failure doesn't crash the booking
-            if allocation:
-                try:
-                    send_receipt_email(
-                        student_email=student.email,
-                        student_name=student.full_name,
-                        matric_number=student.matric_number,
-                        hall_name=room.hall.hall_name,
-                        room_number=room.room_number,
-                        receipt_no=f"BU-HAMS-{allocation.allocation_id}",
-                        transaction_id=transaction_id,
-                        amount_paid=str(amount),
-                        date=timezone.now().strftime('%B %d, %Y'),
-                        department=student.department or '',
-                        level=student.level or '',
-                        email=student.email,
-                    )
-                except Exception as email_error:
-                    print(f"Receipt email failed (booking still succeeded): {email_error}")
-           
-            # Step 8: Send back a success message!
-            return Response({
-                "message": "Room booked successfully",
-                "room number":room.room_number,
-                "hall name":room.hall.hall_name
-            }, status=status.HTTP_200_OK)
-            
+           # On allocation day only students whose turn it is may book (admission.py)
+           require_admission(matric, hall_id)
+
+           # Hand the booking to the configured booking engine (see booking.py).
+           # Both engines lock/claim the student and room inside a transaction,
+           # so if anything goes wrong ALL the changes are undone.
+           result = book(matric, hall_id, room_id)
+
+           # Booked - let the next student in the queue in. The booking has
+           # already committed, so a failure here must not turn it into an error
+           # (the client would retry and be told they already have a room);
+           # process_booking_queue frees the slot on a later pass instead.
+           try:
+               finish_ticket(matric)
+           except Exception:
+               logger.exception("finish_ticket failed for %s", matric)
+
+           # Step 8: Send back a success message!
+           return Response({
+               "message": "Room booked successfully",
+               "room number": result.room.room_number,
+               "hall name": result.room.hall.hall_name
+           }, status=status.HTTP_200_OK)
+
+       except AdmissionError as e:
+           # Not this student's turn yet - tell them when to come back
+           return e.to_response()
+
+       except BookingError as e:
+           # The booking was refused for a known reason (room full, already booked...)
+           return Response({"error": e.message}, status=e.status_code)
 
        except Student.DoesNotExist:
            # Student with that matric number doesn't exist
            return Response({"error": "Student not found"}, status=status.HTTP_404_NOT_FOUND)
        
-       except Exception as e:
-           # Something unexpected went wrong
-           return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+       except Exception:
+           # Something unexpected went wrong - log it, but don't show the
+           # database error to the student
+           logger.exception("book_room failed for %s", matric)
+           return Response(
+               {"error": "Something went wrong while booking. Please try again."},
+               status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+           )
 
     # If the booking data format was wrong
     print(f"BookingSerializer errors: {serializer.errors}")  # Debug line
@@ -495,19 +437,96 @@ def book_room(request):
 # Students see room numbers and bed availability, but NOT who is in each room
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=available_rooms_etag)  # 304 if no room or hold changed
 def available_rooms(request):
     hall_id = request.query_params.get('hall_id')
     if not hall_id:
         return Response({"error": "hall_id is required"}, status=status.HTTP_400_BAD_REQUEST)
-    
+    if not hall_id.isdigit():
+        return Response({"error": "hall_id must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    hall_id = int(hall_id)
+
+    # Optional: the student asking, so their OWN hold doesn't hide the room from them
+    # (their student_id is in their login token - no lookup needed)
+    exclude_student_id = None
+    student = request_student(request)
+    matric_no = request.query_params.get('matriculation_number')
+    if student is not None:
+        exclude_student_id = student.user_id
+    elif matric_no:
+        exclude_student_id = Student.objects.filter(matric_number=matric_no).values_list('student_id', flat=True).first()
+
     # Get rooms that are not full and not under maintenance
-    rooms = Room.objects.filter(
-        hall_id=hall_id,
-        current_occupants__lt=F('capacity'),
-        is_under_maintenance=False
-    ).order_by('room_number')
-    
-    return Response(StudentRoomSerializer(rooms, many=True).data)
+    # (from the cache, keyed by the hall version the ETag was built from, see caching.py -
+    # out of this process's in-memory bed inventory, see inventory.py)
+    def build_room_list():
+        return hall_inventory(hall_id).rooms_with_free_beds()
+
+    version = hall_version(request, hall_id)
+    if version is None:
+        rooms = build_room_list()  # No summary row yet - nothing to key the cache on
+    else:
+        rooms = cached_hall_rooms(hall_id, version, build_room_list)
+
+    # Beds other students are holding right now count as taken
+    held = active_hold_counts(hall_id, exclude_student_id=exclude_student_id)
+
+    room_list = []
+    for room_data in rooms:
+        room_data = dict(room_data)  # Don't change the cached copy
+        room_data['held_beds'] = held.get(room_data['room_id'], 0)
+        room_data['free_beds'] = room_data['capacity'] - room_data['current_occupants'] - room_data['held_beds']
+        if room_data['free_beds'] > 0:
+            room_list.append(room_data)
+
+    return Response(room_list)
+
+
+# ==================================================
+# HOLD A BED - Reserve one bed for a few minutes before booking
+# ==================================================
+# POST   {matriculation_number, hall_id, room_id} -> hold one bed in that room
+# DELETE ?matriculation_number=...                 -> give the held bed back
+@api_view(['POST', 'DELETE'])
+@permission_classes([AllowAny])
+def hold_bed(request):
+    if request.method == 'DELETE':
+        matric_no = request_matric(
+            request, request.query_params.get("matriculation_number") or request.data.get("matriculation_number")
+        )
+        if not matric_no:
+            return Response({"error": "Matriculation number is required"}, status=status.HTTP_400_BAD_REQUEST)
+        released = release_hold(matric_no)
+        return Response({"released": released}, status=status.HTTP_200_OK)
+
+    # Same fields as a booking: hall_id, room_id, matriculation_number
+    serializer = BookingSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    matric_no = request_matric(request, serializer.validated_data['matriculation_number'])
+    try:
+        require_admission(matric_no, serializer.validated_data['hall_id'])
+        hold = place_hold(
+            matric_no,
+            serializer.validated_data['hall_id'],
+            serializer.validated_data['room_id'],
+        )
+    except AdmissionError as e:
+        return e.to_response()
+    except BookingError as e:
+        return Response({"error": e.message}, status=e.status_code)
+    except Student.DoesNotExist:
+        return Response({"error": "Student not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        "message": "Bed held - complete your booking before it expires",
+        "hold_id": hold.hold_id,
+        "room_id": hold.room_id,
+        "expires_at": hold.expires_at,
+        "ttl_seconds": HOLD_TTL_SECONDS,
+    }, status=status.HTTP_201_CREATED)
 
     
 # ==================================================
@@ -517,8 +536,9 @@ def available_rooms(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])  # Anyone can access
 def allocation_list(request):
-    #  Get the matriculation number from the URL parameters
-    matric_no = request.query_params.get("matriculation_number")
+    #  Get the matriculation number from the login token (or the URL parameters)
+    student_claims = request_student(request)
+    matric_no = request_matric(request, request.query_params.get("matriculation_number"))
     
     # Make sure they provided a matric number
     if not matric_no:
@@ -526,9 +546,14 @@ def allocation_list(request):
     
     try: 
         #  Find the student's allocation using their matric number
-        # First get the student, then get their allocation
-        student = Student.objects.get(matric_number=matric_no)
-        allocation = Allocation.objects.get(student=student, status='active')
+        # (their student_id is in the token; without one, look the student up first)
+        if student_claims is not None:
+            student_id = student_claims.user_id
+        else:
+            student_id = Student.objects.values_list('student_id', flat=True).get(matric_number=matric_no)
+        allocation = Allocation.objects.select_related('student__hall_selected', 'room', 'receipt').get(
+            student_id=student_id, status='active'
+        )
         
         #  Create a receipt with all the important information
         reciept_data = {
@@ -562,6 +587,37 @@ def allocation_list(request):
         return Response({'error': 'No allocation found for this student'}, status=status.HTTP_404_NOT_FOUND)
 
 
+# ==================================================
+# RECEIPT DOWNLOAD - The student's official receipt PDF, straight from disk
+# ==================================================
+# The same PDF that was emailed, rendered once and stored (receipt_pdfs.py).
+# Supports ETag / If-None-Match (304), Range requests, and - with
+# RECEIPT_SENDFILE set - lets nginx / Apache send the file (receipt_downloads.py)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def allocation_receipt_download(request):
+    student_claims = request_student(request)
+    matric_no = request_matric(request, request.query_params.get("matriculation_number"))
+    if not matric_no:
+        return Response({"error": "Matriculation number is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # With a login token the student_id is in it; without one, go through the matric number
+    owner = {'student_id': student_claims.user_id} if student_claims is not None else {'student__matric_number': matric_no}
+    allocation = Allocation.objects.select_related('student', 'room__hall', 'receipt').filter(
+        status='active', **owner
+    ).first()
+    if allocation is None:
+        return Response({'error': 'No allocation found for this student'}, status=status.HTTP_404_NOT_FOUND)
+
+    relative_path = allocation_receipt_file(allocation)
+    if relative_path is None:
+        return Response({'error': 'The receipt could not be generated. Please try again later.'},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    download_name = f"BU-Receipt_{allocation.student.matric_number.replace('/', '-')}.pdf"
+    return serve_receipt_file(request, relative_path, download_name)
+
+
 
 #========================
 # room maintenance module 
@@ -569,6 +625,7 @@ def allocation_list(request):
 
 @api_view(['PATCH'])
 @permission_classes([AllowAny])  # Using AllowAny as JWT is not yet working
+@idempotent('toggle_maintenance')  # A retried toggle must not flip the room back
 def toggle_maintenance(request, room_id):
     """
     Toggle the maintenance status of a room.
@@ -589,19 +646,29 @@ def toggle_maintenance(request, room_id):
             
             # Store the new status AFTER changing it (Fixed: was always False before)
             new_status = room.is_under_maintenance
-            
+
             # Record in Audit Log for accountability
-            # Get admin email from query parameters (sent by frontend)
-            user_email = request.query_params.get("email") or 'ADMIN'  # Fallback if not provided
+            # Get admin email from their login token (or the query parameters sent by the frontend)
+            user_email = request_admin_email(request, request.query_params.get("email")) or 'ADMIN'  # Fallback if not provided
             user_id = None  # We don't need user_id since we have email
-            
-            Log.objects.create(
-                user_role=user_email,
-                action=f"Toggled Room {room.room_number} Maintenance Status",
+
+            # Buffered and written in bulk once this transaction commits (audit.py),
+            # so the room lock isn't held for an extra INSERT
+            audit.record(
+                f"Toggled Room {room.room_number} Maintenance Status",
+                user_email,
                 description=f"Changed Room {room.room_number} in {room.hall.hall_name} maintenance status from {old_status} to {new_status}",
-                timestamp=timezone.now(),
                 user_id=user_id,
             )
+
+            # Move this room's beds in/out of the hall's "under maintenance" totals
+            # (the hall summary row is locked last, right before the commit)
+            record_room_change(
+                room.hall_id,
+                (room.capacity, room.current_occupants, old_status),
+                (room.capacity, room.current_occupants, new_status),
+                room_id=room.room_id,
+            )
         
         return Response({
             "message": "Room maintenance status toggled successfully",
@@ -632,15 +699,19 @@ def toggle_maintenance(request, room_id):
 # This returns daily allocation counts filtered by the logged-in admin's hall
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=admin_hall_etag, last_modified_func=admin_hall_last_modified)  # 304 if no new allocations
 def allocation_graph(request):
-   # Step 1: Get the admin's email from the request
-   admin_email = request.query_params.get("email")
+   # Step 1: Get the admin's email from their login token (or the request)
+   admin_email = request_admin_email(request, request.query_params.get("email"))
    if not admin_email:
        return Response({"error": "Admin email is required"}, status=status.HTTP_400_BAD_REQUEST)
 
    try:
        # Step 2: Find the admin and their hall
-       admin = Admin.objects.get(email=admin_email)
+       admin = admin_for_request(request)  # Already loaded for the ETag check
+       if admin is None:
+           raise Admin.DoesNotExist
    except Admin.DoesNotExist:
        return Response({"error": "Admin not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -674,45 +745,448 @@ def allocation_graph(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def admin_student_receipts(request):
-    admin_email = request.query_params.get("email")
+    admin_email = request_admin_email(request, request.query_params.get("email"))
 
     if not admin_email:
         return Response({"error": "Admin email is required"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        # Find the admin and their hall
-        admin = Admin.objects.get(email=admin_email)
+        # Find the admin and their hall (straight from their login token, if any)
+        admin = request_admin_record(request, admin_email)
+        if admin is None:
+            raise Admin.DoesNotExist
 
-        if not admin.hall:
+        if not admin.hall_id:
             return Response({"error": "Admin is not assigned to any hall"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get all active allocations in this admin's hall
-        allocations = Allocation.objects.filter(
-            room__hall=admin.hall,
-            status='active'
-        ).select_related('student', 'room', 'receipt')
-
-        receipts_list = []
-        for alloc in allocations:
-            receipts_list.append({
-                'receipt_no': f"BU-HAMS-{alloc.allocation_id}",
-                'full_name': alloc.student.full_name,
-                'matric_no': alloc.student.matric_number,
-                'department': alloc.student.department,
-                'level': alloc.student.level,
-                'gender': alloc.student.gender,
-                'email': alloc.student.email,
-                'phone_number': alloc.student.phone_number,
-                'house_address': alloc.student.house_address,
-                'hall_name': admin.hall.hall_name,
-                'room_number': alloc.room.room_number,
-                'allocation_date': alloc.allocation_date,
-                'status': alloc.status,
-                'transaction_reference': alloc.receipt.payment_reference if alloc.receipt else 'N/A',
-                'amount_paid': str(alloc.receipt.amount_paid) if alloc.receipt else '0',
-            })
+        # Get all active allocations in this admin's hall (same rows as the export below)
+        receipts_list = [receipt_row(alloc) for alloc in receipts_queryset(admin.hall_id)]
 
         return Response(receipts_list)
 
     except Admin.DoesNotExist:
         return Response({"error": "Admin not found"}, status=status.HTTP_404_NOT_FOUND)
+
+
+# ==================================================
+# EXPORTS - Download receipts / allocations as a CSV or NDJSON file
+# ==================================================
+# The file is streamed: the header arrives at once and rows follow batch by
+# batch, so even the whole campus never sits in memory (see export.py).
+#   ?email=      the admin asking
+#   ?type=       csv (default) or ndjson
+#   ?gzip=1      compress the file
+#   ?scope=campus  every hall instead of the admin's own (Super Admin only)
+def _export_scope(request):
+    """(hall or None for the whole campus, error Response or None)"""
+    admin_email = request_admin_email(request, request.query_params.get("email"))
+    if not admin_email:
+        return None, Response({"error": "Admin email is required"}, status=status.HTTP_400_BAD_REQUEST)
+    admin = request_admin_record(request, admin_email, related=['hall'])
+    if admin is None:
+        return None, Response({"error": "Admin not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.query_params.get("scope") == "campus":
+        if admin.role != 'Super Admin':
+            return None, Response({"error": "Only a Super Admin can export the whole campus"}, status=status.HTTP_403_FORBIDDEN)
+        return None, None
+    if not admin.hall_id:
+        return None, Response({"error": "Admin is not assigned to any hall"}, status=status.HTTP_400_BAD_REQUEST)
+    return admin.hall, None
+
+
+def _export_options(request):
+    """(file type, gzip?, error Response or None)"""
+    # Not called "format" - DRF keeps ?format= for picking its own renderer
+    file_format = request.query_params.get("type", "csv").lower()
+    if file_format not in EXPORT_FORMATS:
+        return None, False, Response(
+            {"error": f"type must be one of: {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    compress = request.query_params.get("gzip", "").lower() in ('1', 'true', 'yes')
+    return file_format, compress, None
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def admin_export_receipts(request):
+    hall, error = _export_scope(request)
+    if error:
+        return error
+    file_format, compress, error = _export_options(request)
+    if error:
+        return error
+
+    chunks = export_chunks(receipts_queryset(hall), receipt_row, RECEIPT_COLUMNS, file_format, compress)
+    name = f"receipts-{hall.hall_name}" if hall else "receipts-campus"
+    return streaming_export(request, chunks, slugify(name), file_format, compress)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def admin_export_allocations(request):
+    hall, error = _export_scope(request)
+    if error:
+        return error
+    file_format, compress, error = _export_options(request)
+    if error:
+        return error
+
+    # ?status=active / cancelled ... (empty = every allocation)
+    allocations = allocations_queryset(hall, request.query_params.get("status"))
+    chunks = export_chunks(allocations, allocation_row, ALLOCATION_COLUMNS, file_format, compress)
+    name = f"allocations-{hall.hall_name}" if hall else "allocations-campus"
+    return streaming_export(request, chunks, slugify(name), file_format, compress)
+
+
+# ==================================================
+# RECEIPT PACK - Every receipt of the hall as one streamed ZIP (for the porters)
+# ==================================================
+# Same ?email= / ?scope=campus as the exports above. Receipts already on disk
+# are reused; the rest are rendered by the helper processes in parallel while
+# the ZIP is being downloaded (see receipt_packs.py). The X-Receipt-Pack header
+# names the pack for the progress endpoint below.
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def admin_receipt_pack(request):
+    hall, error = _export_scope(request)
+    if error:
+        return error
+
+    allocations = receipts_queryset(hall)
+    pack_id, total = new_pack(allocations)
+    return streaming_pack(request, receipt_pack_chunks(allocations, pack_id, total), hall, pack_id, total)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def admin_receipt_pack_progress(request):
+    progress = get_pack_progress(request.query_params.get("pack", ""))
+    if progress is None:
+        return Response({"error": "Receipt pack not found (or finished over an hour ago)"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(progress)
+
+
+# ==================================================
+# CACHE METRICS - How often available_rooms is answered from the cache
+# ==================================================
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def cache_metrics(request):
+    return Response(get_cache_metrics())
+
+
+# ==================================================
+# INVENTORY METRICS - What this process's in-memory bed inventory holds
+# ==================================================
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def inventory_metrics(request):
+    return Response(get_inventory_metrics())
+
+
+# ==================================================
+# LOGIN METRICS - Password checks: waiting, hashing and turned-away logins
+# ==================================================
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def login_metrics(request):
+    return Response(get_login_metrics())
+
+
+# ==================================================
+# RECEIPT OUTBOX METRICS - How many receipt emails are waiting/sent/failed
+# ==================================================
+# Lets admins check that the receipt outbox worker is keeping up on busy days
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def receipt_outbox_metrics(request):
+    return Response(get_outbox_metrics())
+
+
+# ==================================================
+# MAIL METRICS - Messages per SMTP connection, failures and throttling
+# ==================================================
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def mail_metrics(request):
+    return Response(get_mail_metrics())
+
+
+# ==================================================
+# AUDIT METRICS - How far behind the buffered audit-log writer is
+# ==================================================
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def audit_metrics(request):
+    return Response(audit.get_audit_metrics())
+
+
+# ==================================================
+# RECEIPT PDF METRICS - Receipts served from disk vs rendered
+# ==================================================
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def receipt_pdf_metrics(request):
+    return Response({**get_receipt_pdf_metrics(), 'downloads': get_download_metrics()})
+
+
+# ==================================================
+# AUTO ALLOCATE - Batch-allocate every waiting student in the admin's hall
+# ==================================================
+# Send {"email": "...", "dry_run": true} first to preview the result,
+# then {"email": "...", "dry_run": false} to actually write it.
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def admin_auto_allocate(request):
+    admin_email = request_admin_email(request, request.data.get("email") or request.query_params.get("email"))
+    if not admin_email:
+        return Response({"error": "Admin email is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    admin = request_admin_record(request, admin_email)  # No query with a login token
+    if admin is None:
+        return Response({"error": "Admin not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if not admin.hall_id:
+        return Response({"error": "Admin is not assigned to any hall"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Default to a dry run so a stray click never allocates a whole hall
+    dry_run = str(request.data.get("dry_run", True)).lower() not in ('false', '0', 'no')
+
+    summary = auto_allocate(hall_ids=[admin.hall_id], dry_run=dry_run)
+    if not dry_run:
+        audit.record(
+            "Auto-allocated hall", admin.email, user_id=admin.admin_id,
+            description=f"Auto-allocation in hall {admin.hall_id}: {summary}",
+        )
+    return Response(summary, status=status.HTTP_200_OK)
+
+
+# ==================================================
+# ANNOUNCEMENTS - Email every student living in the admin's hall
+# ==================================================
+# POST {"email": "...", "subject": "...", "body": "...", "scope": "campus" (Super Admin only)}
+# queues one email per resident and answers at once; the outbox workers send
+# them (announcements.py). GET .../<id>/ shows what was sent and what failed.
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def admin_announcements(request):
+    admin_email = request_admin_email(request, request.data.get("email"))
+    if not admin_email:
+        return Response({"error": "Admin email is required"}, status=status.HTTP_400_BAD_REQUEST)
+    admin = request_admin_record(request, admin_email)
+    if admin is None:
+        return Response({"error": "Admin not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    subject = str(request.data.get("subject", "")).strip()
+    body = str(request.data.get("body", "")).strip()
+    if not subject or not body:
+        return Response({"error": "subject and body are required"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(subject) > 200:
+        return Response({"error": "subject must be at most 200 characters"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.data.get("scope") == "campus":
+        if admin.role != 'Super Admin':
+            return Response({"error": "Only a Super Admin can write to the whole campus"}, status=status.HTTP_403_FORBIDDEN)
+        hall = None
+    elif not admin.hall_id:
+        return Response({"error": "Admin is not assigned to any hall"}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        hall = Hall(hall_id=admin.hall_id)
+
+    announcement, recipients = create_announcement(hall, subject, body, admin.email)
+    return Response(
+        {"announcement_id": announcement.announcement_id, "recipients": recipients},
+        status=status.HTTP_201_CREATED,
+    )
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def admin_announcement_status(request, announcement_id):
+    admin_email = request_admin_email(request, request.query_params.get("email"))
+    admin = request_admin_record(request, admin_email) if admin_email else None
+    if admin is None:
+        return Response({"error": "Admin not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    announcement = Announcement.objects.select_related('hall').filter(announcement_id=announcement_id).first()
+    if announcement is None or (admin.role != 'Super Admin' and announcement.hall_id != admin.hall_id):
+        return Response({"error": "Announcement not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(announcement_status(announcement))
+
+
+# ==================================================
+# BOOKING QUEUE - Take a ticket and wait for your turn to book
+# ==================================================
+# POST {matriculation_number, hall_id} -> join the hall's queue (or get your existing ticket)
+# Keep the token and poll booking_queue_status until status is "admitted".
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def join_booking_queue(request):
+    matric_no = request_matric(request, request.data.get("matriculation_number"))
+    hall_id = request.data.get("hall_id")
+    if not matric_no or not hall_id:
+        return Response({"error": "matriculation_number and hall_id are required"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        hall_id = int(hall_id)
+    except (TypeError, ValueError):
+        return Response({"error": "hall_id must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        ticket = join_queue(matric_no, hall_id)
+    except AdmissionError as e:
+        return e.to_response()
+    except BookingError as e:
+        return Response({"error": e.message}, status=e.status_code)
+    except Student.DoesNotExist:
+        return Response({"error": "Student not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    info = describe_ticket(ticket)
+    headers = {'Retry-After': str(info["retry_after"])} if "retry_after" in info else None
+    return Response(info, status=status.HTTP_200_OK, headers=headers)
+
+
+# GET ?token=... -> your place in the queue, estimated wait, or "admitted"
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def booking_queue_status(request):
+    token = request.query_params.get("token")
+    if not token:
+        return Response({"error": "token is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    ticket = check_ticket(token)
+    if ticket is None:
+        return Response({"error": "Queue ticket not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    info = describe_ticket(ticket)
+    headers = {'Retry-After': str(info["retry_after"])} if "retry_after" in info else None
+    return Response(info, status=status.HTTP_200_OK, headers=headers)
+
+
+# ==================================================
+# BOOKING QUEUE METRICS - How long the queues are right now
+# ==================================================
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def booking_queue_metrics(request):
+    return Response(get_queue_metrics(), status=status.HTTP_200_OK)
+
+
+# ==================================================
+# CONTENTION METRICS - Where bookings are fighting over the same rows
+# ==================================================
+# Per hall: attempts, deadlock/lock-timeout retries, refusals and a histogram of
+# how long bookings waited for row locks. Plus the most contended rooms.
+# Counters are per web worker process and reset when it restarts.
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def contention_metrics(request):
+    try:
+        top = int(request.query_params.get('top', 20))
+    except ValueError:
+        top = 20
+    return Response(get_contention_metrics(top=top), status=status.HTTP_200_OK)
+
+
+# ==================================================
+# LIVE OCCUPANCY - Push hall changes instead of polling (see live.py)
+# ==================================================
+# These two are plain (async) Django views, not DRF views: they wait for
+# events without tying up a worker thread when served by the ASGI server.
+
+async def _hall_event_stream(hall_id, last_event_id):
+    with subscription(hall_id) as subscriber:
+        # If the connection drops, the browser reconnects after 3 seconds (sending Last-Event-ID)
+        yield "retry: 3000\n\n"
+
+        if last_event_id:
+            backlog, cursor, complete = await sync_to_async(events_since)(hall_id, last_event_id)
+        else:
+            backlog, cursor, complete = [], await sync_to_async(current_cursor)(hall_id), True
+        if complete:
+            # Resuming: carry on after the last event the browser saw
+            cursor = last_event_id or cursor
+            yield sse_message({'cursor': cursor}, event='hello', event_id=cursor)
+        else:
+            # Missed too much (or an unknown cursor) - reload the dashboard, then carry on
+            yield sse_message({'cursor': cursor}, event='resync', event_id=cursor)
+
+        idle = 0
+        while True:
+            for event in backlog:
+                cursor = event['cursor']
+                yield sse_message(event, event='occupancy', event_id=cursor)
+            if backlog:
+                idle = 0
+            elif idle >= HEARTBEAT_SECONDS:
+                # Comment line - keeps proxies from closing an idle connection
+                idle = 0
+                yield ": keep-alive\n\n"
+
+            # Sleep until the next database check (or a change committed by this process)
+            await subscriber.wait(DB_CHECK_SECONDS)
+            idle += DB_CHECK_SECONDS
+            backlog, current, complete = await sync_to_async(events_since)(hall_id, cursor)
+            if not complete:
+                backlog, cursor, idle = [], current, 0
+                yield sse_message({'cursor': cursor}, event='resync', event_id=cursor)
+
+
+# STREAM: GET /api/halls/<hall_id>/live/  (text/event-stream, use with EventSource)
+@require_GET
+async def hall_live_stream(request, hall_id):
+    if not isinstance(request, ASGIRequest):
+        # runserver / WSGI can't hold thousands of open streams - use polling instead
+        return JsonResponse(
+            {"error": "Live streaming needs the ASGI server", "poll_url": f"/api/halls/{hall_id}/live/poll/"},
+            status=503,
+        )
+    if not await Hall.objects.filter(hall_id=hall_id).aexists():
+        return JsonResponse({"error": "Hall not found"}, status=404)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+    record_live('streams_opened')
+    response = StreamingHttpResponse(_hall_event_stream(hall_id, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Tell nginx not to hold events back
+    return response
+
+
+# LONG-POLL: GET /api/halls/<hall_id>/live/poll/?cursor=...
+# Under ASGI it answers as soon as there is something newer than the cursor, or
+# after LIVE_LONG_POLL_SECONDS with no events. Under WSGI a waiting request would
+# hold a worker thread, so it answers at once. Either way, call again with the
+# returned cursor after "retry_after" seconds.
+# "resync": true means: reload the dashboard, then keep polling from the new cursor.
+@require_GET
+async def hall_live_poll(request, hall_id):
+    if not await Hall.objects.filter(hall_id=hall_id).aexists():
+        return JsonResponse({"error": "Hall not found"}, status=404)
+    record_live('long_polls')
+
+    cursor = request.GET.get('cursor')
+    can_wait = isinstance(request, ASGIRequest)
+    events, current, complete = await sync_to_async(events_since)(hall_id, cursor)
+    if can_wait and complete and not events:
+        with subscription(hall_id) as subscriber:
+            deadline = asyncio.get_running_loop().time() + LONG_POLL_SECONDS
+            while complete and not events:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                await subscriber.wait(min(DB_CHECK_SECONDS, remaining))
+                events, current, complete = await sync_to_async(events_since)(hall_id, cursor)
+
+    return JsonResponse({
+        'cursor': current,
+        'events': events if complete else [],
+        'resync': not complete,
+        'retry_after': 0 if can_wait else POLL_INTERVAL_SECONDS,
+    })
+
+
+# METRICS: how many dashboards are watching each hall, wake-ups published
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def live_metrics(request):
+    return Response(get_live_metrics(), status=status.HTTP_200_OK)
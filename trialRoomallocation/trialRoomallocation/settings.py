@@ -156,12 +156,23 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
+]
+
+# Let the frontend read these response headers (booking queue, retried requests, receipt packs)
+CORS_EXPOSE_HEADERS = [
+    'retry-after',
+    'idempotent-replayed',
+    'x-receipt-pack',
+    'x-receipt-count',
+    'content-disposition',
 ]
 
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Signed-claims tokens: request.user comes from the token, no query (testdbModel/identity.py)
+        'testdbModel.identity.TokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -200,4 +211,150 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
-EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD') 
\ No newline at end of file
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD') 
+
+# RECEIPT OUTBOX CONFIGURATION
+# Receipt emails are queued by book_room and sent by: python manage.py process_receipt_outbox
+RECEIPT_OUTBOX_MAX_ATTEMPTS = config('RECEIPT_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+RECEIPT_OUTBOX_RETRY_BASE_SECONDS = config('RECEIPT_OUTBOX_RETRY_BASE_SECONDS', default=30, cast=int)
+RECEIPT_OUTBOX_LEASE_SECONDS = config('RECEIPT_OUTBOX_LEASE_SECONDS', default=300, cast=int)
+
+# BULK MAIL (receipts and hall announcements, testdbModel/mailer.py)
+# Each outbox worker thread reuses one SMTP connection; sends are spaced out to
+# stay under the provider's limit (MAIL_MAX_PER_MINUTE, 0 = no limit)
+MAIL_BATCH_SIZE = config('MAIL_BATCH_SIZE', default=50, cast=int)
+MAIL_MESSAGES_PER_CONNECTION = config('MAIL_MESSAGES_PER_CONNECTION', default=100, cast=int)
+MAIL_MAX_PER_MINUTE = config('MAIL_MAX_PER_MINUTE', default=60, cast=int)
+MAIL_IDLE_SECONDS = config('MAIL_IDLE_SECONDS', default=30, cast=int)
+
+# AUDIT LOG (testdbModel/audit.py)
+# Entries are buffered and written in bulk by a background thread; payments are always written at once.
+# False = write every entry straight away (the old behaviour)
+AUDIT_LOG_ASYNC = config('AUDIT_LOG_ASYNC', default=True, cast=bool)
+AUDIT_LOG_BATCH_SIZE = config('AUDIT_LOG_BATCH_SIZE', default=100, cast=int)
+# Longest an entry waits in the buffer (seconds)
+AUDIT_LOG_FLUSH_SECONDS = config('AUDIT_LOG_FLUSH_SECONDS', default=1.0, cast=float)
+# A full buffer (database down / slow) makes callers write their entry themselves
+AUDIT_LOG_BUFFER_LIMIT = config('AUDIT_LOG_BUFFER_LIMIT', default=10000, cast=int)
+
+# BOOKING ENGINE
+# 'locking' = lock student + room rows with SELECT ... FOR UPDATE (original behaviour)
+# 'guarded' = claim the bed with a single conditional UPDATE (less lock queuing on hot rooms)
+# Compare them with: python manage.py benchmark_booking
+BOOKING_ENGINE = config('BOOKING_ENGINE', default='locking')
+
+# BED HOLDS
+# How long a bed stays held after a student opens a room (seconds)
+BED_HOLD_TTL_SECONDS = config('BED_HOLD_TTL_SECONDS', default=120, cast=int)
+# If True, book_room only accepts students who currently hold a bed in that room
+BED_HOLDS_REQUIRED = config('BED_HOLDS_REQUIRED', default=False, cast=bool)
+
+# BOOKING QUEUE (admission control, see testdbModel/admission.py)
+# Turn on for allocation day: students must queue for a hall before they can hold/book
+ADMISSION_CONTROL_ENABLED = config('ADMISSION_CONTROL_ENABLED', default=False, cast=bool)
+# How many students per hall may book at the same time
+ADMISSION_SLOTS_PER_HALL = config('ADMISSION_SLOTS_PER_HALL', default=20, cast=int)
+# How long an admitted student has to finish booking (seconds)
+ADMISSION_WINDOW_SECONDS = config('ADMISSION_WINDOW_SECONDS', default=300, cast=int)
+# Beyond this many waiting students a hall's queue answers 429
+ADMISSION_MAX_WAITING_PER_HALL = config('ADMISSION_MAX_WAITING_PER_HALL', default=5000, cast=int)
+# Max concurrent login/dashboard requests per web worker process before answering 429
+ADMISSION_MAX_IN_FLIGHT = config('ADMISSION_MAX_IN_FLIGHT', default=16, cast=int)
+
+# IDEMPOTENCY KEYS (see testdbModel/idempotency.py)
+# How long a saved response is replayed for retries with the same Idempotency-Key (seconds)
+IDEMPOTENCY_KEY_TTL_SECONDS = config('IDEMPOTENCY_KEY_TTL_SECONDS', default=86400, cast=int)
+
+# DEADLOCK / LOCK TIMEOUT RETRIES (see testdbModel/contention.py)
+# How many times a booking transaction is tried before answering "busy, try again"
+LOCK_RETRY_MAX_ATTEMPTS = config('LOCK_RETRY_MAX_ATTEMPTS', default=4, cast=int)
+# Base delay before a retry (seconds); doubles each attempt, with random jitter
+LOCK_RETRY_BASE_SECONDS = config('LOCK_RETRY_BASE_SECONDS', default=0.05, cast=float)
+
+# LIVE OCCUPANCY UPDATES (see testdbModel/live.py)
+# How many hall versions a reconnecting / polling client may be behind before it must reload
+LIVE_BUFFER_SIZE = config('LIVE_BUFFER_SIZE', default=200, cast=int)
+# Seconds between keep-alive comments on an idle stream
+LIVE_HEARTBEAT_SECONDS = config('LIVE_HEARTBEAT_SECONDS', default=15, cast=int)
+# How long a long-poll request waits for a change before answering "nothing new" (ASGI only)
+LIVE_LONG_POLL_SECONDS = config('LIVE_LONG_POLL_SECONDS', default=25, cast=int)
+# How often an open stream / long-poll checks the hall's version in the database
+LIVE_DB_CHECK_SECONDS = config('LIVE_DB_CHECK_SECONDS', default=2, cast=float)
+# Under WSGI polls answer at once; clients wait this long before polling again
+LIVE_POLL_INTERVAL_SECONDS = config('LIVE_POLL_INTERVAL_SECONDS', default=10, cast=int)
+
+# HALL CHANGE LOG (see testdbModel/occupancy.py)
+# How many days of room changes are kept for "changes since" syncing (manage.py prune_hall_changes)
+HALL_CHANGE_RETENTION_DAYS = config('HALL_CHANGE_RETENTION_DAYS', default=7, cast=int)
+
+# LIST ENDPOINTS (see testdbModel/listing.py)
+# Rows per page for /api/student/, /api/admin/, /api/payment/, /api/hall/ (?limit= can change it up to the max)
+LIST_PAGE_SIZE = config('LIST_PAGE_SIZE', default=100, cast=int)
+LIST_MAX_PAGE_SIZE = config('LIST_MAX_PAGE_SIZE', default=500, cast=int)
+
+# STREAMED EXPORTS (see testdbModel/export.py)
+# Rows read from the database (one query) per piece of a CSV / NDJSON export
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=1000, cast=int)
+
+# CACHE (see testdbModel/caching.py)
+# Works offline: in-memory per process by default. With several server processes use
+#   CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+#   CACHE_LOCATION=/var/tmp/hams-cache
+# so they share one cache (and each other's rebuilt room lists)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='hams-cache'),
+    }
+}
+# How long a hall's cached room list may be used at most (seconds); bookings
+# and maintenance toggles invalidate it straight away anyway
+ROOM_CACHE_SECONDS = config('ROOM_CACHE_SECONDS', default=60, cast=int)
+
+# RECEIPT PDFS (see testdbModel/receipt_pdfs.py)
+# Where finished receipt PDFs are kept (one file per receipt, rendered once)
+RECEIPT_PDF_DIR = config('RECEIPT_PDF_DIR', default=str(BASE_DIR / 'receipt_pdfs'))
+# Helper processes that render new receipt PDFs (0 = render in the calling process)
+RECEIPT_RENDER_WORKERS = config('RECEIPT_RENDER_WORKERS', default=2, cast=int)
+# Who sends downloaded receipt files (testdbModel/receipt_downloads.py):
+# '' = Django, 'x-accel-redirect' = nginx, 'x-sendfile' = Apache mod_xsendfile / lighttpd
+RECEIPT_SENDFILE = config('RECEIPT_SENDFILE', default='')
+# nginx only: the `internal` location that is aliased to RECEIPT_PDF_DIR
+RECEIPT_SENDFILE_PREFIX = config('RECEIPT_SENDFILE_PREFIX', default='/protected-receipts/')
+
+# LOGIN TOKENS (see testdbModel/identity.py)
+# True = students/admins must send their login token; ?matriculation_number= / ?email= alone are refused
+IDENTITY_REQUIRE_TOKEN = config('IDENTITY_REQUIRE_TOKEN', default=False, cast=bool)
+# How long a server process may trust its copy of a person's status version; a
+# change made through another process is seen by this one within this many seconds
+IDENTITY_STATUS_CACHE_SECONDS = config('IDENTITY_STATUS_CACHE_SECONDS', default=30, cast=int)
+
+# LOGIN PASSWORD CHECKS (see testdbModel/passwords.py)
+# Check login passwords in helper processes instead of the web worker
+PASSWORD_POOL_ENABLED = config('PASSWORD_POOL_ENABLED', default=True, cast=bool)
+# How many helper processes (0 = one per CPU core)
+PASSWORD_WORKERS = config('PASSWORD_WORKERS', default=0, cast=int)
+# Max password checks waiting or running per server process before logins answer 429
+PASSWORD_QUEUE_LIMIT = config('PASSWORD_QUEUE_LIMIT', default=32, cast=int)
+# A check slower than this (seconds) answers 429 "try again"
+PASSWORD_TIMEOUT_SECONDS = config('PASSWORD_TIMEOUT_SECONDS', default=10, cast=float)
+
+# LOGGING
+# Errors from the booking path, outbox and audit writer (with their tracebacks)
+# go to the console, where the process manager / container collects them
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'testdbModel': {
+            'handlers': ['console'],
+            'level': config('APP_LOG_LEVEL', default='INFO'),
+        },
+    },
+}